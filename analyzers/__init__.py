@@ -1,17 +1,95 @@
-from .base_analyzer import BaseAnalyzer, register_analyzer, get_all_analyzers
+from .base_analyzer import BaseAnalyzer, register_analyzer, register_lazy_analyzer, get_all_analyzers, analyzer_keys, COST_TIERS
 from .analysis import ChatAnalysisEngine
-from .render import RenderInfo
+from .features import (
+    FEATURE_TEXT,
+    FEATURE_WORDS,
+    FEATURE_POS,
+    FEATURE_SEGMENTS,
+    FEATURE_TIME,
+    MessageFeatures
+)
+from .segments import SegmentStats, classify_segments
+from .sketch import HeavyHitters
+from .rollup import DailyRollup, RollupStore
+from .engine_pool import EnginePool
+from .render import RenderInfo, configure_ranking_memo, ranking_memo_stats
+from .metrics import METRICS, MetricsRegistry, LoopLagMonitor, format_summary
+from .scheduler import ReportScheduler, RunStats
+from .user_index import UserIndex, UserStats
+from .render_queue import JobQueue, RenderJob, RenderWorkers, JOB_POSTED
+from .api_client import API, RateLimitedApi, EndpointLimit, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW, api_priority, parse_limits
+from .profiling import profile_run, profiling_active, ProfileReport, ProfileBusyError
+from .warmup import warm_up
+from .tokenizer import (
+    configure_tokenizer_pool,
+    shutdown_tokenizer_pool,
+    configure_token_cache,
+    token_cache_stats,
+    configure_token_store,
+    close_token_store
+)
 
-# 导入所有分析器以触发注册
-from . import sender
-from . import imager
-from . import hourly_analyzer
-from . import word
+# 声明内置分析器(按报告中的顺序),模块在分析器第一次被启用时才导入
+register_lazy_analyzer("active_sender", ".sender", "ActiveSenderAnalyzer")
+register_lazy_analyzer("word_count", ".sender", "WordCountAnalyzer")
+register_lazy_analyzer("image", ".imager", "ImageAnalyzer")
+register_lazy_analyzer("emoticon", ".imager", "EmoticonAnalyzer")
+register_lazy_analyzer("hourly", ".hourly_analyzer", "HourlyActivityAnalyzer", tier="standard")
+register_lazy_analyzer("pos", ".word", "PartOfSpeechAnalyzer", tier="full")
+register_lazy_analyzer("wordcloud", ".word", "WordCloudAnalyzer", tier="full")
 
 __all__ = [
     "BaseAnalyzer",
     "register_analyzer",
+    "register_lazy_analyzer",
     "get_all_analyzers",
+    "analyzer_keys",
+    "COST_TIERS",
     "ChatAnalysisEngine",
-    "RenderInfo"
+    "FEATURE_TEXT",
+    "FEATURE_WORDS",
+    "FEATURE_POS",
+    "FEATURE_SEGMENTS",
+    "FEATURE_TIME",
+    "MessageFeatures",
+    "SegmentStats",
+    "classify_segments",
+    "HeavyHitters",
+    "DailyRollup",
+    "RollupStore",
+    "EnginePool",
+    "RenderInfo",
+    "configure_ranking_memo",
+    "ranking_memo_stats",
+    "METRICS",
+    "MetricsRegistry",
+    "LoopLagMonitor",
+    "JobQueue",
+    "RenderJob",
+    "JOB_POSTED",
+    "RenderWorkers",
+    "UserIndex",
+    "UserStats",
+    "ReportScheduler",
+    "RunStats",
+    "API",
+    "RateLimitedApi",
+    "EndpointLimit",
+    "PRIORITY_HIGH",
+    "PRIORITY_NORMAL",
+    "PRIORITY_LOW",
+    "api_priority",
+    "parse_limits",
+    "format_summary",
+    "profile_run",
+    "profiling_active",
+    "ProfileReport",
+    "ProfileBusyError",
+    "configure_tokenizer_pool",
+    "shutdown_tokenizer_pool",
+    "configure_token_cache",
+    "token_cache_stats",
+    "configure_token_store",
+    "close_token_store",
+    "warm_up"
 ]
\ No newline at end of file
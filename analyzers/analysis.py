@@ -1,72 +1,738 @@
 from ncatbot.core import GroupMessageEvent
 from ncatbot.utils import get_log
-from typing import List, Dict
+from typing import Any, Awaitable, Callable, FrozenSet, Iterable, List, Dict, Optional, Sequence, Set, TypeVar
+from dataclasses import asdict
+from datetime import datetime
 from pathlib import Path
+import asyncio
 import base64
+import contextvars
+import copy
+import functools
+import inspect
+import time
 from io import BytesIO
 
-from .base_analyzer import BaseAnalyzer, get_all_analyzers
-from .render import RenderUserInfo, render_analysis_result, RenderInfo
+from PIL import Image
+
+from .base_analyzer import RENDERED_RANKS, BaseAnalyzer, get_all_analyzers
+from .features import FEATURE_SEGMENTS, FEATURE_TEXT, FEATURE_TIME, MessageFeatures, union_features
+from .metrics import METRICS
+from .rollup import DailyRollup
+from .sampling import SAMPLE_BY_HOUR, SAMPLE_METHODS, sample_indices, sample_seed
+from .segments import classify_segments
+from .user_index import UserStats, collect_user_stats
+from .tokenizer import choose_tokenize_mode, extract_tokens, prefetch_tokens, token_session
+from .render import RenderUserInfo, RenderInfo, build_section_image, render_sections, compose_sections, cleanup_sections
 
 LOG = get_log("ChatAnalyzerEngine")
 
+T = TypeVar("T")
+
+# 单个步骤(生成某一节图片 / 最终渲染)失败时的最大重试次数
+MAX_STEP_RETRIES = 3
+# 重试的基础退避时间(秒),每次重试翻倍
+RETRY_BASE_DELAY = 0.5
+
+# 可选的渲染后端
+# pillowmd: 组合 Markdown 后由 pillowmd 渲染,支持自定义版式
+# native: 使用原生 PIL 合成器直接叠放头部文字与各节图片,速度更快
+RENDER_BACKENDS = ("pillowmd", "native")
+
+# 聚合时每批交给分析器的事件数,也是检查分析器预算与让出事件循环的间隔
+BATCH_SIZE = 512
+# 超出预算的分析器在报告中显示的占位内容
+PLACEHOLDER_SECTION = "> 这一项统计超时了，本次报告先跳过喵~"
+
+
 class ChatAnalysisEngine:
-    """聊天分析引擎 - 协调多个分析器,一次遍历完成所有统计"""
-    
-    def __init__(self, resources_path: Path, group_id: str, render_info: RenderInfo):
-        """初始化分析引擎"""
+    """聊天分析引擎 - 协调多个分析器,一次遍历完成所有统计
+
+    分析分为三个阶段,每个阶段的产物都会缓存在引擎上:
+    1. 聚合(aggregate):遍历事件,收集各分析器的排行榜结果
+    2. 分节(build_sections):为每个分析器生成一张图片
+    3. 渲染(render):将各节组合为最终报告
+    渲染失败时只重试失败的步骤,不会重新处理事件。
+    """
+
+    def __init__(
+        self,
+        resources_path: Path,
+        group_id: str,
+        render_info: RenderInfo,
+        render_backend: str = "pillowmd",
+        enabled_analyzers: Optional[Iterable[str]] = None,
+        max_tier: str = "full",
+        tokenizer_hmm: bool = True,
+        sketch_capacity: int = 0,
+        deadline: float = 0,
+        analyzer_budget: float = 0,
+        batch_size: int = BATCH_SIZE,
+        sample_size: int = 0,
+        sample_method: str = SAMPLE_BY_HOUR
+    ):
+        """
+        初始化分析引擎
+
+        :param resources_path: 资源文件夹路径
+        :param group_id: 群号
+        :param render_info: 报告头部信息
+        :param render_backend: 渲染后端,见 RENDER_BACKENDS
+        :param enabled_analyzers: 启用的分析器名称,None 表示全部启用(只有被启用的分析器模块会被导入)
+        :param max_tier: 允许的最高开销等级,见 COST_TIERS
+        :param tokenizer_hmm: 只需要词(不需要词性)时,普通分词是否启用 HMM 新词发现
+        :param sketch_capacity: 大于 0 时,只需要前 K 项的分析器改用该容量的近似统计(内存固定)
+        :param deadline: 从报告开始(见 start_clock,未记录时为聚合开始)到各节生成完毕的总时限(秒),0 表示不限制
+        :param analyzer_budget: 单个分析器(分词、处理事件、获取结果、生成分节)的时间预算(秒),0 表示不限制
+        :param batch_size: 每批处理的事件数,每批之间让出事件循环,越小机器人响应越及时
+        :param sample_size: 大于 0 且消息数超过该值时,需要分词的分析器只处理该数量的抽样消息,计数类分析器不受影响
+        :param sample_method: 抽样方式,见 SAMPLE_METHODS
+        """
+        if render_backend not in RENDER_BACKENDS:
+            raise ValueError(f"未知的渲染后端: {render_backend}，可选值: {', '.join(RENDER_BACKENDS)}")
+        if sample_method not in SAMPLE_METHODS:
+            raise ValueError(f"未知的抽样方式: {sample_method}，可选值: {', '.join(SAMPLE_METHODS)}")
         self._resources_path = resources_path
-        self.analyzers = [cls(group_id) for cls in get_all_analyzers()]
+        self._group_id = str(group_id)
+        self._render_backend = render_backend
+        self._tokenizer_hmm = tokenizer_hmm
+        self._sketch_capacity = sketch_capacity
+        self._deadline = deadline
+        self._analyzer_budget = analyzer_budget
+        self._batch_size = max(1, batch_size)
+        self._sample_size = sample_size
+        self._sample_method = sample_method
+        # 报告头部追加的说明(例如本次使用了抽样)
+        self._notes: List[str] = []
+        # 最近一次聚合中分词类分析器处理的消息比例(抽样时小于 1)
+        self._sample_ratio = 1.0
+        # 最近一次聚合的个人统计(只在需要时收集)
+        self._user_stats: Optional[Dict[str, UserStats]] = None
+        self._deadline_at: Optional[float] = None
+        # 本份报告的开始时间(time.monotonic()),由调用方在获取聊天记录之前记录,见 start_clock
+        self._report_started: Optional[float] = None
+        # 各分析器已用时间与超出预算的分析器(按分析器名称)
+        self._spent: Dict[str, float] = {}
+        self._degraded: Set[str] = set()
+        self.analyzers: List[BaseAnalyzer] = []
+        for cls in get_all_analyzers(enabled_analyzers, max_tier):
+            self.register_analyzer(cls(group_id))
         self._render_info = render_info
-    
+        self._results: Optional[Dict[str, List[RenderUserInfo]]] = None
+        self._sections: Dict[str, Path | str] = {}
+
     def register_analyzer(self, analyzer: BaseAnalyzer):
         """
         手动注册一个分析器实例
-        
+
         :param analyzer: 分析器实例
         """
+        analyzer.use_sketch(self._sketch_capacity)
         self.analyzers.append(analyzer)
         return self
-    
-    async def analyze(self, events: List[GroupMessageEvent], retry: int = 0) -> str:
+
+    @property
+    def render_info(self) -> RenderInfo:
+        """报告头部信息(复用引擎时每份报告更新一次)"""
+        return self._render_info
+
+    @render_info.setter
+    def render_info(self, render_info: RenderInfo):
+        self._render_info = render_info
+
+    def release(self):
+        """
+        释放上一份报告的统计数据与分节图片,引擎本身(分析器实例与配置)保留以便复用
+        """
+        self.clear_sections()
+        for analyzer in self.analyzers:
+            analyzer.reset()
+        self._results = None
+        self._notes = []
+        self._sample_ratio = 1.0
+        self._user_stats = None
+        self._spent.clear()
+        self._deadline_at = None
+        self._report_started = None
+
+    @property
+    def required_features(self) -> FrozenSet[str]:
+        """所有分析器需要的消息特征"""
+        return union_features(analyzer.required_features for analyzer in self.analyzers)
+
+    @property
+    def tokenize_mode(self) -> Optional[str]:
+        """满足所有分析器需求的最便宜的分词模式,不需要分词时为 None"""
+        return choose_tokenize_mode(self.required_features, self._tokenizer_hmm)
+
+    async def _extract_features(self, events: List[GroupMessageEvent], extra_features: FrozenSet[str] = frozenset()) -> List[MessageFeatures]:
+        """
+        为每个事件提取被需要的特征(分词除外),未被需要的特征保持默认值
+
+        文本与消息段统计来自同一次消息段遍历;每批之间让出事件循环
+
+        :param events: 事件列表
+        :param extra_features: 分析器之外需要的特征(例如按小时分层抽样、个人统计)
+        :return: 与事件一一对应的特征
+        """
+        required = self.required_features | extra_features
+        need_segments = bool(required & {FEATURE_TEXT, FEATURE_SEGMENTS})
+        need_time = FEATURE_TIME in required
+        features = []
+        for index, event in enumerate(events, 1):
+            feature = MessageFeatures()
+            if need_segments:
+                feature.segments = classify_segments(event)
+                feature.text = feature.segments.text
+            if need_time:
+                feature.hour = datetime.fromtimestamp(event.time).hour
+            features.append(feature)
+            if index % self._batch_size == 0:
+                await asyncio.sleep(0)
+        return features
+
+    @property
+    def notes(self) -> List[str]:
+        """本次报告头部追加的说明(例如使用了抽样)"""
+        return list(self._notes)
+
+    @property
+    def degraded(self) -> Set[str]:
+        """本次报告中超出预算、以占位内容代替的分析器名称"""
+        return set(self._degraded)
+
+    def _choose_sample(self, events: List[GroupMessageEvent], features: List[MessageFeatures]) -> Optional[bytearray]:
+        """
+        消息数超过 sample_size 时选出需要分词的分析器处理的样本,并记录报告说明
+
+        :return: 每条消息是否入选的标记,不抽样时为 None
+        """
+        sampled = [analyzer for analyzer in self.analyzers if analyzer.needs_tokens]
+        if not sampled or self._sample_size <= 0 or len(events) <= self._sample_size:
+            return None
+        seed = sample_seed(self._group_id, len(events), events[0].time, events[-1].time)
+        indices = sample_indices([feature.hour for feature in features], self._sample_size, self._sample_method, seed)
+        mask = bytearray(len(events))
+        for index in indices:
+            mask[index] = 1
+        names = "、".join(f"「{analyzer.name}」" for analyzer in sampled)
+        self._sample_ratio = len(indices) / len(events)
+        self._notes.append(f"\n> 本次消息较多，{names}基于 {len(indices)} / {len(events)} 条消息的抽样统计\n")
+        LOG.info(f"群 {self._group_id} 共 {len(events)} 条消息，分词类分析器使用 {len(indices)} 条抽样")
+        METRICS.incr("sampled_reports", self._group_id)
+        return mask
+
+    def start_clock(self, started_at: float):
+        """
+        记录本份报告的开始时间,下一次聚合从该时间起计算总时限,
+        使获取聊天记录等聚合之前的步骤也计入 deadline
+
+        :param started_at: 报告开始时的 time.monotonic()
+        """
+        self._report_started = started_at
+
+    def _start_clock(self):
+        """开始计时:重置各分析器已用时间,并从报告开始时间(未记录时为现在)计算截止时间"""
+        started = self._report_started if self._report_started is not None else time.monotonic()
+        self._report_started = None
+        self._spent.clear()
+        self._degraded.clear()
+        self._deadline_at = started + self._deadline if self._deadline > 0 else None
+
+    def _remaining(self, analyzer: BaseAnalyzer) -> Optional[float]:
+        """
+        分析器剩余可用时间
+
+        :return: 剩余秒数(可能为负),不限制时返回 None
+        """
+        remaining = None
+        if self._analyzer_budget > 0:
+            remaining = self._analyzer_budget - self._spent.get(analyzer.name, 0.0)
+        if self._deadline_at is not None:
+            until_deadline = self._deadline_at - time.monotonic()
+            remaining = until_deadline if remaining is None else min(remaining, until_deadline)
+        return remaining
+
+    def _charge(self, analyzer: BaseAnalyzer, seconds: float):
+        """记录分析器用时"""
+        self._spent[analyzer.name] = self._spent.get(analyzer.name, 0.0) + seconds
+
+    def _degrade(self, analyzer: BaseAnalyzer, stage: str):
+        """将分析器标记为超出预算,该节会以占位内容代替"""
+        if analyzer.name in self._degraded:
+            return
+        self._degraded.add(analyzer.name)
+        LOG.warning(
+            f"群 {self._group_id} 的分析器「{analyzer.name}」在 {stage} 阶段超出时间预算"
+            f"(已用 {self._spent.get(analyzer.name, 0.0):.2f}s)，以占位内容代替"
+        )
+        METRICS.incr("budget_overruns", self._group_id, analyzer.metric_name)
+
+    async def analyze(self, events: List[GroupMessageEvent], max_retries: int = MAX_STEP_RETRIES, collect_users: bool = False) -> str:
         """
         分析聊天记录,一次遍历完成所有统计
-        
+
         :param events: GroupMessageEvent 对象列表
+        :param max_retries: 每个步骤失败时的最大重试次数
+        :param collect_users: 是否同时收集个人统计(见 export_user_stats)
+        :return: base64 字符串
+        """
+        await self.aggregate(events, collect_users)
+        return await self._render_report(max_retries)
+
+    async def analyze_rollups(self, rollups: Sequence[DailyRollup], max_retries: int = MAX_STEP_RETRIES) -> str:
+        """
+        合并多天的每日汇总生成报告
+
+        :param rollups: 每日汇总,按时间顺序
+        :param max_retries: 每个步骤失败时的最大重试次数
+        :return: base64 字符串
+        """
+        await self.aggregate_rollups(rollups)
+        return await self._render_report(max_retries)
+
+    async def analyze_job(self, job: Dict[str, Any], max_retries: int = MAX_STEP_RETRIES) -> str:
+        """
+        根据 export_render_job 导出的数据生成报告(在渲染工作进程中使用,不访问机器人 API)
+
+        :param job: export_render_job 的返回值
+        :param max_retries: 每个步骤失败时的最大重试次数
         :return: base64 字符串
         """
-        if retry > 3:
-            LOG.error("分析重试次数过多，终止分析")
-            raise RuntimeError("分析重试次数过多，终止分析")
+        self.clear_sections()
+        self._start_clock()
+        # 沿用机器人进程中的用时与剩余时限,总时限仍从报告开始时计算
+        remaining = job.get("deadline_remaining")
+        if remaining is not None:
+            self._deadline_at = time.monotonic() + remaining
+        self._spent.update(job.get("spent", {}))
+        for analyzer in self.analyzers:
+            analyzer.reset()
+        states = job.get("states", {})
+        for analyzer in self.analyzers:
+            analyzer_state = states.get(analyzer.metric_name)
+            if analyzer_state is not None:
+                analyzer.merge_state(analyzer_state)
+        self._degraded = set(job.get("degraded", ()))
+        self._notes = list(job.get("notes", ()))
+        results = job.get("results", {})
+        self._results = {
+            analyzer.name: [RenderUserInfo(**user) for user in results.get(analyzer.name, [])]
+            for analyzer in self.analyzers
+            if not analyzer.is_custom
+        }
+        return await self._render_report(max_retries)
+
+    def export_render_job(self) -> Dict[str, Any]:
+        """
+        导出最近一次聚合的结果,供渲染工作进程生成报告(可 JSON 序列化)
+
+        排行榜中的昵称与头像已在聚合时获取,工作进程不需要访问机器人 API
+
+        :return: {"states": 分析器状态, "degraded": 超出预算的分析器, "spent": 各分析器已用时间,
+                  "deadline_remaining": 剩余总时限, "results": 排行榜, "render_info": 报告头部信息}
+        """
+        if self._results is None:
+            raise RuntimeError("尚未进行聚合，无法导出渲染任务")
+        return {
+            "states": self.export_rollup(),
+            "degraded": sorted(self._degraded),
+            "notes": list(self._notes),
+            "spent": dict(self._spent),
+            "deadline_remaining": None if self._deadline_at is None else max(0.0, self._deadline_at - time.monotonic()),
+            "results": {
+                name: [asdict(user) for user in users[:RENDERED_RANKS]]
+                for name, users in self._results.items()
+            },
+            "render_info": {
+                "current_time": self._render_info.current_time.isoformat(),
+                "start_time": self._render_info._start_time.isoformat(),  # type: ignore
+                "end_time": self._render_info._end_time.isoformat(),  # type: ignore
+                "analysis_duration": self._render_info.analysis_duration,
+                "group_name_and_id": self._render_info.group_name_and_id,
+                "plugin_version": self._render_info.plugin_version
+            }
+        }
+
+    async def _render_report(self, max_retries: int) -> str:
+        """生成分节、渲染并编码为 base64"""
+        try:
+            await self.build_sections(max_retries)
+            images = await self.render(max_retries)
+        finally:
+            self.clear_sections()
+
+        with METRICS.span("encode", self._group_id):
+            return await asyncio.to_thread(_encode_png_base64, images[0])
+
+    async def aggregate(self, events: List[GroupMessageEvent], collect_users: bool = False) -> Dict[str, List[RenderUserInfo]]:
+        """
+        聚合阶段:按批把事件交给所有分析器处理,并收集排行榜结果
+
+        自定义图表类分析器的结果保留在分析器内部,在分节阶段生成图片。
+        新的聚合会使之前缓存的分节失效。
+
+        :param events: GroupMessageEvent 对象列表
+        :param collect_users: 是否同时收集个人统计(见 export_user_stats)
+        :return: {analyzer_name: [RenderUserInfo, ...]}
+        """
+        self.clear_sections()
+        self._start_clock()
+        self._notes = []
+        self._sample_ratio = 1.0
+        self._user_stats = None
         # 重置所有分析器
         for analyzer in self.analyzers:
             analyzer.reset()
-        
-        # 一次遍历,让所有分析器处理每个事件
-        for event in events:
-            for analyzer in self.analyzers:
-                analyzer.process_event(event)
-        
-        # 收集所有分析结果
-        results: Dict[str, List[RenderUserInfo] | Path] = {}
+
+        # 只提取被启用的分析器需要的特征,并选择开销最小的分词模式
+        sampling = 0 < self._sample_size < len(events)
+        extra_features = set()
+        if sampling and self._sample_method == SAMPLE_BY_HOUR:
+            extra_features.add(FEATURE_TIME)
+        if collect_users:
+            extra_features.update((FEATURE_SEGMENTS, FEATURE_TIME))
+        with METRICS.span("extract_features", self._group_id, items=len(events)):
+            features = await self._extract_features(events, frozenset(extra_features))
+        mode = self.tokenize_mode
+        # 消息过多时,需要分词的分析器只处理抽样的消息,也只对这些消息分词
+        sample_mask = self._choose_sample(events, features) if sampling else None
+        if sample_mask is not None:
+            features_to_tokenize = [feature for feature, selected in zip(features, sample_mask) if selected]
+        else:
+            features_to_tokenize = features
+
+        # 本次报告的分词结果只在聚合期间保留
+        with token_session():
+            # 需要分词时先批量分词(配置了进程池时在工作进程中并行),结果写入共享缓存
+            if mode is not None:
+                with METRICS.span("tokenize", self._group_id, items=len(features_to_tokenize)):
+                    await self._tokenize(features_to_tokenize, mode)
+
+            # 按批分发事件:每批事件依次交给各分析器,并分别累计各分析器的耗时
+            # 每批处理后让出事件循环(机器人可以继续响应指令与其他群),
+            # 并检查一次预算,超出预算的分析器不再处理后续事件
+            perf_counter = time.perf_counter
+            elapsed = [0.0] * len(self.analyzers)
+            charged = [0.0] * len(self.analyzers)
+            limited = self._analyzer_budget > 0 or self._deadline_at is not None
+            active = [(index, analyzer) for index, analyzer in enumerate(self.analyzers) if analyzer.name not in self._degraded]
+            for block_start in range(0, len(events), self._batch_size):
+                block_end = block_start + self._batch_size
+                event_batch = events[block_start:block_end]
+                feature_batch = features[block_start:block_end]
+                sampled_batch = None
+                for index, analyzer in active:
+                    start = perf_counter()
+                    if sample_mask is not None and analyzer.needs_tokens:
+                        if sampled_batch is None:
+                            selected = sample_mask[block_start:block_end]
+                            sampled_batch = (
+                                [event for event, keep in zip(event_batch, selected) if keep],
+                                [feature for feature, keep in zip(feature_batch, selected) if keep]
+                            )
+                        analyzer.process_batch(*sampled_batch)
+                    else:
+                        analyzer.process_batch(event_batch, feature_batch)
+                    elapsed[index] += perf_counter() - start
+                await asyncio.sleep(0)
+                if not limited:
+                    continue
+                still_active = []
+                for index, analyzer in active:
+                    self._charge(analyzer, elapsed[index] - charged[index])
+                    charged[index] = elapsed[index]
+                    remaining = self._remaining(analyzer)
+                    if remaining is not None and remaining <= 0:
+                        self._degrade(analyzer, "process_event")
+                    else:
+                        still_active.append((index, analyzer))
+                active = still_active
+            for index, analyzer in enumerate(self.analyzers):
+                seconds = elapsed[index]
+                self._charge(analyzer, seconds - charged[index])
+                METRICS.observe("process_event", seconds, self._group_id, analyzer.metric_name, items=len(events))
+
+            # 个人统计复用已提取的特征(常用词只来自已分词的消息)
+            if collect_users:
+                with METRICS.span("collect_users", self._group_id, items=len(events)):
+                    self._user_stats = collect_user_stats(events, features)
+
+        return await self._collect_results()
+
+    async def _tokenize(self, features: List[MessageFeatures], mode: str):
+        """
+        对需要分词的消息分词,耗时计入声明了分词特征的分析器
+
+        分词是这些分析器的主要开销,超出预算时这些分析器被降级,不再继续分词
+
+        :param features: 需要分词的消息特征
+        :param mode: 分词模式
+        """
+        token_analyzers = [analyzer for analyzer in self.analyzers if analyzer.needs_tokens]
+        limited = self._analyzer_budget > 0 or self._deadline_at is not None
+
+        def charge(seconds: float) -> bool:
+            """把分词耗时计入各分析器,返回是否还有分析器在预算内"""
+            for analyzer in token_analyzers:
+                self._charge(analyzer, seconds)
+                remaining = self._remaining(analyzer)
+                if limited and remaining is not None and remaining <= 0:
+                    self._degrade(analyzer, "tokenize")
+            return any(analyzer.name not in self._degraded for analyzer in token_analyzers)
+
+        def time_left() -> Optional[float]:
+            remaining = [self._remaining(analyzer) for analyzer in token_analyzers]
+            if not limited or any(value is None for value in remaining):
+                return None
+            return max(remaining)  # type: ignore
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(prefetch_tokens((feature.text for feature in features), mode), time_left())
+        except asyncio.TimeoutError:
+            pass
+        if not charge(time.perf_counter() - start):
+            return
+        start = time.perf_counter()
+        for index, feature in enumerate(features, 1):
+            if feature.text:
+                feature.tokens = extract_tokens(feature.text, mode)
+            if index % self._batch_size == 0:
+                await asyncio.sleep(0)
+                if not charge(time.perf_counter() - start):
+                    return
+                start = time.perf_counter()
+        charge(time.perf_counter() - start)
+
+    async def aggregate_rollups(self, rollups: Sequence[DailyRollup]) -> Dict[str, List[RenderUserInfo]]:
+        """
+        聚合阶段(汇总版):合并多天的分析器状态,不需要原始聊天记录
+
+        有的天使用了抽样或缺少某些分析器的状态时,在报告头部追加说明
+
+        :param rollups: 每日汇总,按时间顺序
+        :return: {analyzer_name: [RenderUserInfo, ...]}
+        """
+        self.clear_sections()
+        self._start_clock()
+        self._notes = []
+        self._sample_ratio = 1.0
+        for analyzer in self.analyzers:
+            analyzer.reset()
+        missing_days: Dict[str, int] = {}
+        with METRICS.span("merge_rollups", self._group_id):
+            for rollup in rollups:
+                for analyzer in self.analyzers:
+                    analyzer_state = rollup.analyzers.get(analyzer.metric_name)
+                    if analyzer_state is not None:
+                        analyzer.merge_state(analyzer_state)
+                    else:
+                        missing_days[analyzer.name] = missing_days.get(analyzer.name, 0) + 1
+        self._note_rollup_coverage(rollups, missing_days)
+        return await self._collect_results()
+
+    def _note_rollup_coverage(self, rollups: Sequence[DailyRollup], missing_days: Dict[str, int]):
+        """合并每日汇总时,为使用了抽样的天与缺少统计的分析器记录报告说明"""
+        sampled_days = [rollup for rollup in rollups if rollup.sample_ratio < 1.0]
+        sampled = [analyzer for analyzer in self.analyzers if analyzer.needs_tokens]
+        if sampled_days and sampled:
+            names = "、".join(f"「{analyzer.name}」" for analyzer in sampled)
+            ratio = sum(rollup.sample_ratio for rollup in sampled_days) / len(sampled_days)
+            self._notes.append(
+                f"\n> {len(rollups)} 天中有 {len(sampled_days)} 天消息较多，"
+                f"{names}在这些天基于约 {ratio:.0%} 消息的抽样统计\n"
+            )
+        for name, days in missing_days.items():
+            self._notes.append(f"\n> 「{name}」缺少 {days} / {len(rollups)} 天的统计(当天超时或未启用)，结果不完整\n")
+
+    def export_user_stats(self) -> Dict[str, UserStats]:
+        """
+        导出最近一次聚合收集的个人统计
+
+        :return: {用户号: 统计},聚合时未收集则为空
+        """
+        return self._user_stats or {}
+
+    def export_rollup(self) -> Dict[str, dict]:
+        """
+        导出最近一次聚合后各分析器的状态(用于每日汇总),超出预算的分析器统计不完整,不会导出
+
+        :return: {分析器类名: 分析器状态}
+        """
+        return {
+            analyzer.metric_name: analyzer.export_state()
+            for analyzer in self.analyzers
+            if analyzer.name not in self._degraded
+        }
+
+    def export_daily_rollup(self, group_id: str, start: int, end: int, message_count: int) -> DailyRollup:
+        """
+        导出最近一次聚合的每日汇总,同时记录抽样比例与超出预算、没有导出状态的分析器
+
+        :param group_id: 群号
+        :param start: 统计窗口开始时间戳
+        :param end: 统计窗口结束时间戳
+        :param message_count: 消息数
+        :return: 每日汇总
+        """
+        return DailyRollup(
+            group_id=group_id,
+            start=start,
+            end=end,
+            message_count=message_count,
+            analyzers=self.export_rollup(),
+            sample_ratio=self._sample_ratio,
+            missing=sorted(analyzer.metric_name for analyzer in self.analyzers if analyzer.name in self._degraded)
+        )
+
+    async def _collect_results(self) -> Dict[str, List[RenderUserInfo]]:
+        """收集所有排行榜结果,超出预算的分析器结果为空"""
+        results: Dict[str, List[RenderUserInfo]] = {}
+        for analyzer in self.analyzers:
+            if analyzer.is_custom:
+                continue
+            results[analyzer.name] = []
+            if analyzer.name in self._degraded:
+                continue
+            remaining = self._remaining(analyzer)
+            if remaining is not None and remaining <= 0:
+                self._degrade(analyzer, "resolve_users")
+                continue
+            start = time.perf_counter()
+            try:
+                with METRICS.span("resolve_users", self._group_id, analyzer.metric_name):
+                    results[analyzer.name] = await asyncio.wait_for(analyzer.get_result(), remaining)
+            except asyncio.TimeoutError:
+                self._degrade(analyzer, "resolve_users")
+            finally:
+                self._charge(analyzer, time.perf_counter() - start)
+        self._results = results
+        return results
+
+    async def build_sections(self, max_retries: int = MAX_STEP_RETRIES) -> Dict[str, Path | str]:
+        """
+        分节阶段:为每个分析器生成一节图片,已生成的节会被复用
+
+        :param max_retries: 单节生成失败时的最大重试次数
+        :return: {analyzer_name: 图片路径或 Markdown 文本},顺序与分析器一致
+        """
+        if self._results is None:
+            raise RuntimeError("尚未进行聚合，无法生成分节图片")
         for analyzer in self.analyzers:
+            if analyzer.name in self._sections:
+                continue
+            remaining = self._remaining(analyzer)
+            if analyzer.name not in self._degraded and remaining is not None and remaining <= 0:
+                self._degrade(analyzer, "section")
+            if analyzer.name in self._degraded:
+                self._sections[analyzer.name] = PLACEHOLDER_SECTION
+                continue
+            # 图片生成是同步的 CPU 密集操作,在线程中执行以免阻塞事件循环。线程无法被取消,
+            # 超时后它仍会跑完,所以只交给它一份结果副本(不共享可能被重置的分析器与 self._results)
             if analyzer.is_custom:
-                results[analyzer.name] = analyzer.custom_image_getter(self._resources_path)  # type: ignore
+                sync_step = functools.partial(analyzer.snapshot().custom_image_getter, self._resources_path)
             else:
-                results[analyzer.name] = await analyzer.get_result()
+                sync_step = functools.partial(build_section_image, list(self._results[analyzer.name]), self._resources_path)
+            attempts: List[asyncio.Future] = []
+
+            def step(sync_step=sync_step, attempts=attempts) -> Awaitable[Path | str]:
+                future = asyncio.get_running_loop().run_in_executor(
+                    None, functools.partial(contextvars.copy_context().run, sync_step)
+                )
+                attempts.append(future)
+                # shield:超时只停止等待,线程的返回值仍会交给 future,以便清理
+                return asyncio.shield(future)
+
+            start = time.perf_counter()
+            try:
+                with METRICS.span("section", self._group_id, analyzer.metric_name):
+                    self._sections[analyzer.name] = await asyncio.wait_for(
+                        self._retry(step, f"生成「{analyzer.name}」分节图片", max_retries),
+                        remaining
+                    )
+            except asyncio.TimeoutError:
+                self._degrade(analyzer, "section")
+                self._sections[analyzer.name] = PLACEHOLDER_SECTION
+                for future in attempts:
+                    future.add_done_callback(_discard_late_section)
+            finally:
+                self._charge(analyzer, time.perf_counter() - start)
+        return self._sections
+
+    async def render(self, max_retries: int = MAX_STEP_RETRIES) -> List[Image.Image]:
+        """
+        渲染阶段:使用已缓存的分节图片渲染最终报告,失败时仅重试渲染
+
+        :param max_retries: 渲染失败时的最大重试次数
+        :return: 渲染后的图片帧列表
+        """
+        sections = await self.build_sections(max_retries)
+        render_info = self._render_info
+        if self._notes:
+            # 复制一份再追加说明,复用引擎时不会影响下一份报告
+            render_info = copy.copy(render_info)
+            render_info.markdown_texts = [*render_info.markdown_texts, *self._notes]
+
+        async def step() -> List[Image.Image]:
+            with METRICS.span(f"render_{self._render_backend}", self._group_id):
+                if self._render_backend == "native":
+                    images = await asyncio.to_thread(
+                        compose_sections, render_info, sections, resources_path=self._resources_path
+                    )
+                else:
+                    images = await render_sections(render_info, sections, resources_path=self._resources_path)
+            if not images:
+                raise RuntimeError("分析结果图片生成失败")
+            return images
 
-        images = await render_analysis_result(self._render_info, results, resources_path=self._resources_path)
+        return await self._retry(step, "渲染分析报告", max_retries)
 
-        if not images:
-            LOG.warning("分析结果图片生成失败，重试中...")
-            return await self.analyze(events, retry=retry + 1)
-        
-        buffered = BytesIO()
-        images[0].save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    async def _retry(self, step: Callable[[], T | Awaitable[T]], description: str, max_retries: int) -> T:
+        """
+        执行单个步骤,失败时按指数退避重试
+
+        :param step: 步骤函数,可以是同步函数或返回可等待对象的函数
+        :param description: 步骤描述(用于日志)
+        :param max_retries: 最大重试次数
+        :return: 步骤的返回值
+        """
+        for attempt in range(max_retries + 1):
+            try:
+                result = step()
+                if inspect.isawaitable(result):
+                    result = await result
+                return result  # type: ignore
+            except Exception as e:
+                if attempt >= max_retries:
+                    LOG.error(f"{description}失败，重试次数过多，终止分析: {e}")
+                    raise RuntimeError(f"{description}失败，重试次数过多，终止分析") from e
+                delay = RETRY_BASE_DELAY * 2 ** attempt
+                LOG.warning(f"{description}失败: {e}，{delay:.1f} 秒后重试 ({attempt + 1}/{max_retries})")
+                await asyncio.sleep(delay)
+        raise RuntimeError(f"{description}失败")
+
+    def clear_sections(self):
+        """删除已缓存的分节图片"""
+        cleanup_sections(self._sections)
+        self._sections = {}
 
-        return img_str
-    
     def clear_analyzers(self):
         """清空所有注册的分析器"""
         self.analyzers.clear()
+
+
+def _discard_late_section(future: asyncio.Future):
+    """超时后才完成的分节线程:删除它生成的临时图片(报告中已使用占位内容)"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()
+    if isinstance(result, Path):
+        result.unlink(True)
+
+
+def _encode_png_base64(image: Image.Image) -> str:
+    """将图片编码为 PNG 的 base64 字符串"""
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode("utf-8")
@@ -0,0 +1,229 @@
+"""
+限速的 OneBot API 访问层
+每个接口独立的令牌桶与并发上限,按优先级排队(手动指令优先于定时任务),
+失败时按带随机抖动的指数退避重试,避免定时任务集中触发时被后端限流或触发风控
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ncatbot.utils import get_log, status
+
+from .metrics import METRICS
+
+LOG = get_log("ChatAnalyzerApi")
+
+# 优先级,数值越小越先执行
+PRIORITY_HIGH = 0  # 手动指令
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10  # 定时任务
+
+# 重试的基础退避时间(秒),第 n 次重试在 [0, 基础时间 × 2^n] 内随机等待
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 10.0
+
+_PRIORITY: contextvars.ContextVar[int] = contextvars.ContextVar("chat_analyzer_api_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def api_priority(priority: int) -> Iterator[None]:
+    """
+    设置当前上下文(包括其中创建的任务)调用 API 的优先级
+
+    用法:
+    with api_priority(PRIORITY_HIGH):
+        await self._post_analyze_img(...)
+    """
+    token = _PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+@dataclass(frozen=True)
+class EndpointLimit:
+    """单个接口的限制"""
+    rate: float  # 每秒补充的令牌数
+    burst: int  # 令牌桶容量(允许的突发调用数)
+    concurrency: int  # 同时进行的调用数上限
+    retries: int = 2  # 失败后的重试次数
+
+
+# 默认限制;未列出的接口使用 DEFAULT_LIMIT
+DEFAULT_LIMIT = EndpointLimit(rate=5, burst=5, concurrency=4)
+DEFAULT_LIMITS: Dict[str, EndpointLimit] = {
+    "get_group_msg_history": EndpointLimit(rate=2, burst=2, concurrency=2),
+    "get_group_info": EndpointLimit(rate=5, burst=5, concurrency=4),
+    "get_group_member_info": EndpointLimit(rate=10, burst=10, concurrency=5),
+    # 发送不是幂等的,失败时可能已经发出,不重试以免重复发送
+    "post_group_msg": EndpointLimit(rate=1, burst=2, concurrency=1, retries=0),
+}
+
+
+class EndpointLimiter:
+    """令牌桶 + 并发上限 + 优先级队列"""
+
+    def __init__(self, limit: EndpointLimit):
+        self.limit = limit
+        self._tokens = float(limit.burst)
+        self._updated = time.monotonic()
+        self._active = 0
+        # (优先级, 序号, future)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.limit.burst, self._tokens + (now - self._updated) * self.limit.rate)
+        self._updated = now
+
+    def _dispatch(self):
+        """按优先级放行等待者,直到令牌或并发额度用完"""
+        self._timer = None
+        self._refill()
+        while self._waiters and self._active < self.limit.concurrency:
+            _, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if self._tokens < 1:
+                delay = (1 - self._tokens) / self.limit.rate
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._tokens -= 1
+            self._active += 1
+            future.set_result(None)
+
+    async def acquire(self, priority: int):
+        """等待一个调用额度"""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._timer is None:
+            self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已被放行但调用方取消,归还并发额度
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """归还并发额度"""
+        self._active -= 1
+        if self._timer is None:
+            self._dispatch()
+
+
+class RateLimitedApi:
+    """
+    OneBot API 的限速代理,接口名与原 API 一致:
+    await API.get_group_info(group_id)
+    """
+
+    def __init__(self, api_getter: Callable[[], Any], limits: Optional[Dict[str, EndpointLimit]] = None):
+        """
+        :param api_getter: 返回实际 API 对象的函数(延迟获取,便于替换)
+        :param limits: 各接口的限制,未列出的接口使用 DEFAULT_LIMITS / DEFAULT_LIMIT
+        """
+        self._api_getter = api_getter
+        self._limits: Dict[str, EndpointLimit] = dict(DEFAULT_LIMITS)
+        self._limiters: Dict[str, EndpointLimiter] = {}
+        if limits:
+            self.configure(limits)
+
+    def configure(self, limits: Dict[str, EndpointLimit]):
+        """更新接口限制(已有的限速器会被替换)"""
+        self._limits.update(limits)
+        for endpoint in limits:
+            self._limiters.pop(endpoint, None)
+
+    def _limiter(self, endpoint: str) -> EndpointLimiter:
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            limiter = self._limiters[endpoint] = EndpointLimiter(self._limits.get(endpoint, DEFAULT_LIMIT))
+        return limiter
+
+    async def call(self, endpoint: str, *args, **kwargs):
+        """
+        限速调用接口,失败时按带抖动的指数退避重试
+
+        :param endpoint: 接口名(API 对象上的方法名)
+        :return: 接口返回值
+        """
+        limiter = self._limiter(endpoint)
+        priority = _PRIORITY.get()
+        retries = limiter.limit.retries
+        for attempt in range(retries + 1):
+            wait_start = time.perf_counter()
+            await limiter.acquire(priority)
+            METRICS.observe("api_wait", time.perf_counter() - wait_start, analyzer=endpoint)
+            try:
+                with METRICS.span("api_call", analyzer=endpoint):
+                    return await getattr(self._api_getter(), endpoint)(*args, **kwargs)
+            except Exception as e:
+                if attempt >= retries:
+                    METRICS.incr("api_failures", analyzer=endpoint)
+                    raise
+                delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+                METRICS.incr("api_retries", analyzer=endpoint)
+                LOG.warning(f"调用 {endpoint} 失败: {e}，{delay:.2f} 秒后重试 ({attempt + 1}/{retries})")
+            finally:
+                limiter.release()
+            await asyncio.sleep(delay)
+
+    def __getattr__(self, endpoint: str):
+        if endpoint.startswith("_"):
+            raise AttributeError(endpoint)
+
+        async def method(*args, **kwargs):
+            return await self.call(endpoint, *args, **kwargs)
+
+        return method
+
+
+def parse_limits(config: Dict[str, Dict[str, float]]) -> Dict[str, EndpointLimit]:
+    """
+    解析并校验配置中的接口限制
+
+    :param config: {接口名: {"rate": ..., "burst": ..., "concurrency": ..., "retries": ...}},缺省字段沿用默认值
+    :return: {接口名: EndpointLimit}
+    :raises ValueError: 字段不是数字,或 rate、burst、concurrency 不大于 0、retries 小于 0
+    """
+    limits = {}
+    for endpoint, values in (config or {}).items():
+        base = DEFAULT_LIMITS.get(endpoint, DEFAULT_LIMIT)
+        try:
+            limit = EndpointLimit(
+                rate=float(values.get("rate", base.rate)),
+                burst=int(values.get("burst", base.burst)),
+                concurrency=int(values.get("concurrency", base.concurrency)),
+                retries=int(values.get("retries", base.retries))
+            )
+        except (TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"api_rate_limits.{endpoint} 配置错误: {e}") from e
+        # rate 或 burst 为 0 时令牌永远不够,concurrency 为 0 时调用永远无法开始
+        for name in ("rate", "burst", "concurrency"):
+            if getattr(limit, name) <= 0:
+                raise ValueError(f"api_rate_limits.{endpoint}.{name} 必须大于 0，当前为 {getattr(limit, name)}")
+        if limit.retries < 0:
+            raise ValueError(f"api_rate_limits.{endpoint}.retries 不能小于 0，当前为 {limit.retries}")
+        limits[endpoint] = limit
+    return limits
+
+
+# 插件全局的限速 API,实际 API 对象取自 ncatbot 的 status.global_api
+API = RateLimitedApi(lambda: status.global_api)
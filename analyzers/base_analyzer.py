@@ -1,16 +1,55 @@
 from abc import ABC, abstractmethod
 from collections import Counter
+from dataclasses import dataclass
 from pathlib import Path
 from ncatbot.core import GroupMessageEvent
-from typing import Callable, List, Optional, Type
+from ncatbot.utils import get_log
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Type
+import importlib
 
+from .features import FEATURE_POS, FEATURE_WORDS, MessageFeatures
 from .render import RenderUserInfo
+from .sketch import HeavyHitters
 
+LOG = get_log("ChatAnalyzer")
+
+
+# 分析器开销等级(从低到高),每个群可以配置允许的最高等级
+# basic: 只做计数的排行榜;standard: 另外生成图表;full: 另外需要分词(词性、词云)
+COST_TIERS = ("basic", "standard", "full")
+
+# 排行榜一节只绘制前几名,获取结果时只为这些用户查询昵称与头像(其余用户的计数保留在计数器中)
+RENDERED_RANKS = 3
 
 # 全局分析器注册表
 _ANALYZER_REGISTRY: List[Type['BaseAnalyzer']] = []
 
 
+@dataclass(frozen=True)
+class LazyAnalyzerEntry:
+    """延迟加载的分析器声明:只记录名称与所在模块,首次使用时才导入"""
+    key: str  # 配置中使用的分析器名称
+    module: str  # 相对于 analyzers 包的模块路径,例如 ".word"
+    class_name: str
+    tier: str = "basic"  # 开销等级,见 COST_TIERS
+
+
+def tier_rank(tier: str) -> int:
+    """
+    开销等级的序号
+
+    :param tier: 开销等级
+    :return: 在 COST_TIERS 中的位置
+    """
+    if tier not in COST_TIERS:
+        raise ValueError(f"未知的开销等级: {tier}，可选值: {', '.join(COST_TIERS)}")
+    return COST_TIERS.index(tier)
+
+
+# 延迟加载的分析器声明(按声明顺序,即报告中的顺序)
+_LAZY_REGISTRY: Dict[str, LazyAnalyzerEntry] = {}
+
+
 def register_analyzer(cls: Type['BaseAnalyzer']) -> Type['BaseAnalyzer']:
     """
     装饰器:注册分析器类到全局注册表
@@ -28,28 +67,90 @@ def register_analyzer(cls: Type['BaseAnalyzer']) -> Type['BaseAnalyzer']:
     return cls
 
 
-def get_all_analyzers() -> List[Type['BaseAnalyzer']]:
+def register_lazy_analyzer(key: str, module: str, class_name: str, tier: str = "basic"):
+    """
+    声明一个延迟加载的分析器,模块在该分析器第一次被启用时才导入
+
+    使用方法(在 analyzers/__init__.py 中):
+    register_lazy_analyzer("wordcloud", ".word", "WordCloudAnalyzer", tier="full")
+
+    :param key: 分析器名称(用于 enabled_analyzers 等配置)
+    :param module: 相对于 analyzers 包的模块路径
+    :param class_name: 分析器类名
+    :param tier: 开销等级,见 COST_TIERS(声明在这里,按等级筛选时无需导入模块)
     """
-    获取所有已注册的分析器类
+    tier_rank(tier)
+    _LAZY_REGISTRY[key] = LazyAnalyzerEntry(key, module, class_name, tier)
+
+
+def analyzer_keys() -> List[str]:
+    """
+    获取所有可用的分析器名称(不会导入任何分析器模块)
+
+    :return: 延迟声明的名称,以及通过装饰器直接注册的分析器类名
+    """
+    lazy_classes = {entry.class_name for entry in _LAZY_REGISTRY.values()}
+    return list(_LAZY_REGISTRY) + [
+        cls.__name__ for cls in _ANALYZER_REGISTRY if cls.__name__ not in lazy_classes
+    ]
+
+
+def _resolve(entry: LazyAnalyzerEntry) -> Type['BaseAnalyzer']:
+    """导入延迟声明的分析器所在模块并返回分析器类"""
+    module = importlib.import_module(entry.module, package=__package__)
+    return getattr(module, entry.class_name)
+
+
+def get_all_analyzers(enabled: Optional[Iterable[str]] = None, max_tier: str = "full") -> List[Type['BaseAnalyzer']]:
+    """
+    获取已注册的分析器类,只导入被启用的分析器模块
     
-    :return: 分析器类列表
+    :param enabled: 启用的分析器名称(延迟声明的名称或分析器类名),None 表示全部启用
+    :param max_tier: 允许的最高开销等级,超出的分析器即使被启用也会被跳过(模块不会被导入)
+    :return: 分析器类列表,延迟声明的分析器按声明顺序排在前面
     """
-    return _ANALYZER_REGISTRY.copy()
+    max_rank = tier_rank(max_tier)
+    enabled_set = None if enabled is None else set(enabled)
+    if enabled_set is not None:
+        unknown = enabled_set - set(analyzer_keys())
+        if unknown:
+            LOG.warning(f"未知的分析器: {', '.join(sorted(unknown))}，可选值: {', '.join(analyzer_keys())}")
+
+    classes: List[Type['BaseAnalyzer']] = []
+    for key, entry in _LAZY_REGISTRY.items():
+        if tier_rank(entry.tier) > max_rank:
+            continue
+        if enabled_set is None or key in enabled_set:
+            classes.append(_resolve(entry))
+    lazy_classes = {entry.class_name for entry in _LAZY_REGISTRY.values()}
+    for cls in _ANALYZER_REGISTRY:
+        if cls in classes or cls.__name__ in lazy_classes or tier_rank(cls._cost_tier) > max_rank:
+            continue
+        if enabled_set is None or cls.__name__ in enabled_set:
+            classes.append(cls)
+    return classes
 
 
 def clear_registry():
     """清空分析器注册表(主要用于测试)"""
     _ANALYZER_REGISTRY.clear()
+    _LAZY_REGISTRY.clear()
 
 
 class BaseAnalyzer(ABC):
     """分析器基类"""
 
     _name : str
-    _counter : Counter
+    _counter : Counter | HeavyHitters
     _unit: str = "个"
     _custom_name_decorator: Optional[str] = None
     _custom_image_getter: Optional[Callable[[Path], Path] | Callable[[],str]] = None
+    # 需要的消息特征(见 features.py),引擎只提取被需要的特征并选择开销最小的分词模式
+    _features: FrozenSet[str] = frozenset()
+    # 只需要计数最多的前 K 项时设置,此类分析器可以切换为固定内存的近似统计(见 use_sketch)
+    _top_k: Optional[int] = None
+    # 开销等级(见 COST_TIERS),只用于通过装饰器直接注册的分析器,延迟声明的分析器在声明时指定
+    _cost_tier: str = "basic"
 
     def __init__(self, group_id: str):
         """初始化分析器"""
@@ -59,23 +160,84 @@ class BaseAnalyzer(ABC):
     def reset(self):
         """重置分析器的统计数据"""
         self._counter.clear()
+
+    def export_state(self) -> dict:
+        """
+        导出统计状态(用于每日汇总),结果可以 JSON 序列化
+
+        计数器以 [键, 计数] 列表保存,保留整数键的类型
+
+        :return: 状态字典
+        """
+        return {"counter": [[key, count] for key, count in self._counter.most_common()]}
+
+    def merge_state(self, state: dict):
+        """
+        合并 export_state 导出的状态,默认累加计数
+
+        :param state: 状态字典
+        """
+        self._counter.update({key: count for key, count in state.get("counter", ())})
+
+    def snapshot(self) -> 'BaseAnalyzer':
+        """
+        复制一份当前的统计状态(通过 export_state / merge_state),
+        供线程中的图片生成使用,之后重置或继续统计本分析器不会影响副本
+
+        :return: 只包含当前统计结果的新分析器
+        """
+        copied = type(self)(self._group_id)
+        copied.merge_state(self.export_state())
+        return copied
+
+    def use_sketch(self, capacity: int) -> bool:
+        """
+        将计数器切换为 Space-Saving 近似统计,内存不再随不同项的数量增长
+
+        只对声明了 _top_k 的分析器生效,且候选项数量不少于 _top_k;
+        分析器需要只通过 update / most_common 访问计数器
+
+        :param capacity: 候选项数量
+        :return: 是否已切换
+        """
+        if self._top_k is None or capacity <= 0:
+            return False
+        self._counter = HeavyHitters(max(capacity, self._top_k))
+        return True
     
     @abstractmethod
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """
         处理单个消息事件
         
         :param event: 群消息事件
+        :param features: 引擎提取的消息特征(只包含声明需要的特征)
         """
         pass
     
+    def process_batch(self, events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]):
+        """
+        处理一批消息事件,默认逐条调用 process_event
+
+        引擎按批调用此方法;分析器可以重写它,用批量操作(如 Counter.update)代替逐条分发
+
+        :param events: 一批群消息事件
+        :param features: 与事件一一对应的消息特征
+        """
+        process_event = self.process_event
+        for event, feature in zip(events, features):
+            process_event(event, feature)
+
     async def get_result(self) -> List[RenderUserInfo]:
         """
-        获取分析结果
-        
+        获取分析结果:前 RENDERED_RANKS 名的用户信息
+
+        每个用户都要查询群成员信息与头像,只解析会被绘制的名次,
+        活跃成员很多的群也不会因此超出时间预算
+
         :return: 分析结果
         """
-        result = self._counter.most_common()
+        result = self._counter.most_common(RENDERED_RANKS)
         rui_lst = []
         for count, (uid, time) in enumerate(result):
             rui_lst.append(
@@ -98,6 +260,26 @@ class BaseAnalyzer(ABC):
         else:
             return self._name
 
+    @property
+    def metric_name(self) -> str:
+        """用于统计指标的分析器标识(类名)"""
+        return type(self).__name__
+
+    @property
+    def required_features(self) -> FrozenSet[str]:
+        """需要的消息特征"""
+        return self._features
+
+    @property
+    def supports_sketch(self) -> bool:
+        """是否可以使用近似统计"""
+        return self._top_k is not None
+
+    @property
+    def needs_tokens(self) -> bool:
+        """是否需要分词结果"""
+        return bool(self._features & {FEATURE_WORDS, FEATURE_POS})
+
     @property
     def is_custom(self) -> bool:
         """是否有自定义图片生成函数"""
@@ -0,0 +1,109 @@
+"""
+分析引擎池
+为每个群保留一个配置好的分析引擎并在多次报告之间复用,群的分析器配置变化时重建
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+from ncatbot.utils import get_log
+
+from .analysis import ChatAnalysisEngine
+from .render import RenderInfo
+
+LOG = get_log("ChatAnalyzerEnginePool")
+
+
+@dataclass
+class _PooledEngine:
+    engine: ChatAnalysisEngine
+    signature: Tuple
+    lock: asyncio.Lock
+
+
+class EnginePool:
+    """
+    按群复用的分析引擎池
+
+    同一个群的报告串行使用同一个引擎(手动触发与定时任务不会互相干扰),不同群互不影响;
+    每份报告结束后引擎会释放统计数据,只保留分析器实例与配置
+    """
+
+    def __init__(self, resources_path: Path, **engine_options):
+        """
+        :param resources_path: 资源文件夹路径
+        :param engine_options: 传给 ChatAnalysisEngine 的其他参数(所有群共用)
+        """
+        self._resources_path = resources_path
+        self._engine_options = engine_options
+        self._engines: Dict[str, _PooledEngine] = {}
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+    def _pooled(self, group_id: str, signature: Tuple, render_info: RenderInfo) -> _PooledEngine:
+        """获取群的引擎,配置变化时重建(沿用原来的锁,保证同一群仍然串行)"""
+        pooled = self._engines.get(group_id)
+        if pooled is not None and pooled.signature == signature:
+            return pooled
+        enabled_analyzers, max_tier = signature
+        engine = ChatAnalysisEngine(
+            self._resources_path,
+            group_id,
+            render_info,
+            enabled_analyzers=enabled_analyzers,
+            max_tier=max_tier,
+            **self._engine_options
+        )
+        lock = pooled.lock if pooled is not None else asyncio.Lock()
+        pooled = self._engines[group_id] = _PooledEngine(engine, signature, lock)
+        LOG.debug(f"为群 {group_id} 创建分析引擎，分析器: {', '.join(a.metric_name for a in engine.analyzers)}")
+        return pooled
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        group_id: str,
+        render_info: RenderInfo,
+        enabled_analyzers: Optional[Iterable[str]] = None,
+        max_tier: str = "full"
+    ) -> AsyncIterator[ChatAnalysisEngine]:
+        """
+        取得群的分析引擎,退出时释放本次报告的统计数据
+
+        用法:
+        async with pool.acquire(group_id, render_info, enabled, "standard") as engine:
+            img_b64 = await engine.analyze(events)
+
+        :param group_id: 群号
+        :param render_info: 本次报告的头部信息
+        :param enabled_analyzers: 该群启用的分析器名称,None 表示全部启用
+        :param max_tier: 该群允许的最高开销等级
+        :return: 分析引擎
+        """
+        group_id = str(group_id)
+        signature = (None if enabled_analyzers is None else tuple(sorted(enabled_analyzers)), max_tier)
+        while True:
+            pooled = self._pooled(group_id, signature, render_info)
+            await pooled.lock.acquire()
+            # 等待期间配置可能被其他报告更新,重新确认
+            if self._engines.get(group_id) is pooled:
+                break
+            pooled.lock.release()
+        engine = pooled.engine
+        engine.render_info = render_info
+        try:
+            yield engine
+        finally:
+            engine.release()
+            pooled.lock.release()
+
+    def discard(self, group_id: str):
+        """丢弃群的引擎(例如取消订阅后)"""
+        self._engines.pop(str(group_id), None)
+
+    def clear(self):
+        """丢弃所有引擎"""
+        self._engines.clear()
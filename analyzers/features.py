@@ -0,0 +1,51 @@
+"""
+分析器需要的消息特征
+分析器声明自己需要哪些特征,引擎只提取被需要的特征,并据此选择开销最小的分词模式
+"""
+from dataclasses import dataclass, field
+from typing import FrozenSet, Iterable
+
+from .segments import SegmentStats
+from .token_store import Tokens
+
+
+# 纯文本(拼接文本段,忽略命令)
+FEATURE_TEXT = "text"
+# 分词结果(只需要词)
+FEATURE_WORDS = "words"
+# 分词结果及词性(jieba.posseg,开销最大)
+FEATURE_POS = "pos"
+# 消息段统计(图片、动画表情、表情、@、回复数量与文本字数)
+FEATURE_SEGMENTS = "segments"
+# 发送时间(本地时间的小时)
+FEATURE_TIME = "time"
+
+ALL_FEATURES: FrozenSet[str] = frozenset({FEATURE_TEXT, FEATURE_WORDS, FEATURE_POS, FEATURE_SEGMENTS, FEATURE_TIME})
+
+
+@dataclass(slots=True)
+class MessageFeatures:
+    """
+    单条消息的特征,未被任何分析器需要的字段保持默认值
+
+    tokens 的词性只在需要 FEATURE_POS 时有值,否则为空字符串
+    """
+    text: str = ""
+    tokens: Tokens = ()
+    segments: SegmentStats = field(default_factory=SegmentStats)
+    hour: int = -1
+
+
+def union_features(feature_sets: Iterable[FrozenSet[str]]) -> FrozenSet[str]:
+    """
+    合并多个分析器需要的特征,并补全依赖(分词依赖纯文本)
+
+    :param feature_sets: 各分析器需要的特征
+    :return: 需要提取的特征
+    """
+    features = set()
+    for feature_set in feature_sets:
+        features |= feature_set
+    if features & {FEATURE_WORDS, FEATURE_POS}:
+        features.add(FEATURE_TEXT)
+    return frozenset(features)
@@ -1,15 +1,18 @@
 from ncatbot.core import GroupMessageEvent
-from datetime import datetime
 from pathlib import Path
+from typing import Sequence
 from PIL import Image, ImageDraw, ImageFont
 import uuid
 from .base_analyzer import BaseAnalyzer, register_analyzer
 from .crayon_utils import draw_crayon_rectangle
+from .features import FEATURE_TIME, MessageFeatures
 
 
 @register_analyzer
 class HourlyActivityAnalyzer(BaseAnalyzer):
     """每小时活跃度分析器 - 统计每个小时内的聊天记录数量"""
+
+    _features = frozenset({FEATURE_TIME})
     
     def __init__(self, group_id: str):
         super().__init__(group_id) 
@@ -23,17 +26,35 @@ class HourlyActivityAnalyzer(BaseAnalyzer):
         super().reset()
         self._start_hour = -1
     
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """处理单个消息事件,按小时统计消息数量"""
-        # 获取消息的时间戳并转换为小时
-        timestamp = event.time
-        dt = datetime.fromtimestamp(timestamp)
-        hour = dt.hour  # 0-23
+        # 引擎已将消息的时间戳转换为小时
+        hour = features.hour  # 0-23
         if self._start_hour == -1:
             self._start_hour = hour
         
         # 统计该小时的消息数量
         self._counter[hour] += 1
+
+    def process_batch(self, events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]):
+        """批量按小时统计消息数量"""
+        if not features:
+            return
+        if self._start_hour == -1:
+            self._start_hour = features[0].hour
+        self._counter.update(feature.hour for feature in features)
+
+    def export_state(self) -> dict:
+        """导出统计状态,包括起始小时"""
+        state = super().export_state()
+        state["start_hour"] = self._start_hour
+        return state
+
+    def merge_state(self, state: dict):
+        """合并每日汇总,起始小时取最早一天的"""
+        super().merge_state(state)
+        if self._start_hour == -1:
+            self._start_hour = state.get("start_hour", -1)
     
     def _generate_hourly_chart(self, resources_path: Path) -> Path:
         """
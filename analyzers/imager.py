@@ -1,11 +1,14 @@
 from ncatbot.core import GroupMessageEvent
-import re
+from typing import Sequence
 from .base_analyzer import BaseAnalyzer, register_analyzer
+from .features import FEATURE_SEGMENTS, MessageFeatures
 
 
 @register_analyzer
 class ImageAnalyzer(BaseAnalyzer):
     """图片分析器 - 统计发图次数"""
+
+    _features = frozenset({FEATURE_SEGMENTS})
     
     def __init__(self, group_id: str):
         super().__init__(group_id) 
@@ -13,33 +16,42 @@ class ImageAnalyzer(BaseAnalyzer):
         self._unit = "张"
         self._custom_name_decorator = r"</\>"
     
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """处理单个消息事件,统计图片"""
-        if '[CQ:image' in event.raw_message:
-            # 计算该消息中的图片数量
-            image_count = len(re.findall(r'\[CQ:image[^\]]*\]', event.raw_message))
-            if image_count > 0:
-                self._counter[str(event.user_id)] += image_count
+        # 该消息中的图片数量
+        image_count = features.segments.images
+        if image_count > 0:
+            self._counter[str(event.user_id)] += image_count
+
+    def process_batch(self, events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]):
+        """批量统计图片"""
+        counter = self._counter
+        for event, feature in zip(events, features):
+            if feature.segments.images:
+                counter[str(event.user_id)] += feature.segments.images
 
 
 @register_analyzer
 class EmoticonAnalyzer(BaseAnalyzer):
     """表情包分析器 - 统计发送表情包(动画表情)次数"""
 
+    _features = frozenset({FEATURE_SEGMENTS})
+
     def __init__(self, group_id: str):
         super().__init__(group_id) 
         self._name = "表情包大王"
         self._unit = "张"
         self._custom_name_decorator = r"</\>"
     
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """处理单个消息事件,统计表情包"""
-        imgs_msg_array = event.message.filter_image()
-        emoticon_count = 0
-        if (not imgs_msg_array) or len(imgs_msg_array) == 0:
-            return
-        for img in imgs_msg_array:
-            if img.is_animated_image():
-                emoticon_count += 1
+        emoticon_count = features.segments.animated_images
         if emoticon_count > 0:
             self._counter[str(event.user_id)] += emoticon_count
+
+    def process_batch(self, events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]):
+        """批量统计表情包"""
+        counter = self._counter
+        for event, feature in zip(events, features):
+            if feature.segments.animated_images:
+                counter[str(event.user_id)] += feature.segments.animated_images
@@ -0,0 +1,330 @@
+"""
+分阶段耗时统计
+为分析流水线的每个阶段记录耗时,按 (阶段, 群, 分析器) 保存滚动直方图,
+可汇总为 p50/p95 文本,或导出为 Prometheus 文本格式
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Protocol, Tuple
+
+
+# 每个直方图保留的最近样本数
+DEFAULT_WINDOW = 512
+# 导出的分位数
+QUANTILES = (0.5, 0.95, 0.99)
+
+MetricKey = Tuple[str, str, str]  # (stage, group_id, analyzer)
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """
+    最近秩法计算分位数
+
+    :param sorted_samples: 升序排列的样本
+    :param q: 分位数(0~1)
+    :return: 分位数值,样本为空时返回 0
+    """
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+@dataclass
+class RollingHistogram:
+    """保留最近 window 个样本的耗时直方图,同时累计总次数、总耗时与处理条数"""
+    window: int = DEFAULT_WINDOW
+    samples: Deque[float] = field(default_factory=deque)
+    count: int = 0
+    total: float = 0.0
+    items: int = 0
+
+    def __post_init__(self):
+        self.samples = deque(self.samples, maxlen=self.window)
+
+    def observe(self, seconds: float, items: int = 0):
+        """记录一次耗时"""
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.items += items
+
+    def quantile(self, q: float) -> float:
+        """计算最近样本的分位数"""
+        return percentile(sorted(self.samples), q)
+
+    @property
+    def throughput(self) -> float:
+        """累计的平均吞吐量(条/秒)"""
+        return self.items / self.total if self.total > 0 else 0.0
+
+
+@dataclass
+class StageSummary:
+    """按阶段(可选按群/分析器)合并后的统计"""
+    stage: str
+    group_id: str
+    analyzer: str
+    count: int
+    p50: float
+    p95: float
+    total: float
+    items: int
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.total if self.total > 0 else 0.0
+
+
+class SpanHook(Protocol):
+    """span 进入/退出时的回调(例如性能剖析时记录各阶段的内存峰值)"""
+
+    def on_enter(self, stage: str, group_id: str, analyzer: str): ...
+
+    def on_exit(self, stage: str, group_id: str, analyzer: str): ...
+
+
+class MetricsRegistry:
+    """线程安全的耗时与计数器注册表"""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self._window = window
+        self._histograms: Dict[MetricKey, RollingHistogram] = {}
+        self._counters: Counter = Counter()
+        self._gauges: Dict[str, float] = {}
+        self._hooks: List[SpanHook] = []
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook: SpanHook):
+        """注册 span 回调"""
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: SpanHook):
+        """移除 span 回调"""
+        if hook in self._hooks:
+            self._hooks.remove(hook)
+
+    def observe(self, stage: str, seconds: float, group_id: str = "", analyzer: str = "", items: int = 0):
+        """
+        记录某阶段的一次耗时
+
+        :param stage: 阶段名
+        :param seconds: 耗时(秒)
+        :param group_id: 群号,不区分群时为空
+        :param analyzer: 分析器名,不区分分析器时为空
+        :param items: 本次处理的条数,用于计算吞吐量
+        """
+        key = (stage, str(group_id), analyzer)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = RollingHistogram(self._window)
+            histogram.observe(seconds, items)
+
+    @contextmanager
+    def span(self, stage: str, group_id: str = "", analyzer: str = "", items: int = 0) -> Iterator[None]:
+        """
+        计时上下文,退出时(包括异常退出)记录耗时
+
+        用法:
+        with METRICS.span("render", group_id):
+            ...
+        """
+        group_id = str(group_id)
+        for hook in list(self._hooks):
+            hook.on_enter(stage, group_id, analyzer)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, group_id, analyzer, items)
+            for hook in list(self._hooks):
+                hook.on_exit(stage, group_id, analyzer)
+
+    def incr(self, name: str, group_id: str = "", analyzer: str = "", value: int = 1):
+        """累加计数器"""
+        with self._lock:
+            self._counters[(name, str(group_id), analyzer)] += value
+
+    def set_gauge(self, name: str, value: float):
+        """设置瞬时值(如缓存条目数、命中率)"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def summarize(self, group_id: Optional[str] = None, by_group: bool = False, by_analyzer: bool = False) -> List[StageSummary]:
+        """
+        合并直方图,计算各阶段的 p50/p95
+
+        :param group_id: 只统计指定群,None 表示所有群
+        :param by_group: 是否按群分别统计
+        :param by_analyzer: 是否按分析器分别统计
+        :return: 按阶段名排序的统计列表
+        """
+        merged: Dict[MetricKey, List[RollingHistogram]] = {}
+        with self._lock:
+            for (stage, gid, analyzer), histogram in self._histograms.items():
+                if group_id is not None and gid != str(group_id):
+                    continue
+                key = (stage, gid if by_group else "", analyzer if by_analyzer else "")
+                merged.setdefault(key, []).append(histogram)
+            snapshot = {
+                key: (sorted(s for h in hs for s in h.samples), sum(h.count for h in hs),
+                      sum(h.total for h in hs), sum(h.items for h in hs))
+                for key, hs in merged.items()
+            }
+        return [
+            StageSummary(
+                stage=stage,
+                group_id=gid,
+                analyzer=analyzer,
+                count=count,
+                p50=percentile(samples, 0.5),
+                p95=percentile(samples, 0.95),
+                total=total,
+                items=items
+            )
+            for (stage, gid, analyzer), (samples, count, total, items) in sorted(snapshot.items())
+        ]
+
+    def counters(self) -> Dict[MetricKey, int]:
+        """获取所有计数器的快照"""
+        with self._lock:
+            return dict(self._counters)
+
+    def to_prometheus(self, prefix: str = "chat_analyzer") -> str:
+        """
+        导出为 Prometheus 文本格式
+
+        耗时以 summary 类型导出(分位数基于最近的样本),计数器以 counter 类型导出
+
+        :param prefix: 指标名前缀
+        :return: Prometheus 文本
+        """
+        lines = [
+            f"# HELP {prefix}_stage_seconds Latency of each analysis stage.",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        with self._lock:
+            histograms = [(key, sorted(h.samples), h.count, h.total, h.items) for key, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+        for (stage, gid, analyzer), samples, count, total, _ in histograms:
+            labels = _format_labels(stage=stage, group=gid, analyzer=analyzer)
+            for q in QUANTILES:
+                quantile_labels = _format_labels(stage=stage, group=gid, analyzer=analyzer, quantile=str(q))
+                lines.append(f"{prefix}_stage_seconds{quantile_labels} {percentile(samples, q):.6f}")
+            lines.append(f"{prefix}_stage_seconds_sum{labels} {total:.6f}")
+            lines.append(f"{prefix}_stage_seconds_count{labels} {count}")
+        lines.append(f"# HELP {prefix}_stage_items_total Items processed by each analysis stage.")
+        lines.append(f"# TYPE {prefix}_stage_items_total counter")
+        for (stage, gid, analyzer), _, _, _, items in histograms:
+            lines.append(f"{prefix}_stage_items_total{_format_labels(stage=stage, group=gid, analyzer=analyzer)} {items}")
+        declared = set()
+        for (name, gid, analyzer), value in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total{_format_labels(group=gid, analyzer=analyzer)} {value}")
+        for name, value in gauges:
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Path):
+        """
+        以原子替换的方式写出 Prometheus 文本文件(供 node_exporter textfile 收集器读取)
+
+        :param path: 输出文件路径
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        temp_path.write_text(self.to_prometheus(), encoding="utf-8")
+        temp_path.replace(path)
+
+    def reset(self):
+        """清空所有统计"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+def _format_labels(**labels: str) -> str:
+    """格式化 Prometheus 标签,忽略空值"""
+    parts = []
+    for key, value in labels.items():
+        if not value:
+            continue
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def format_summary(summaries: Iterable[StageSummary]) -> str:
+    """
+    将统计结果格式化为适合在聊天中发送的文本
+
+    :param summaries: 统计列表
+    :return: 多行文本
+    """
+    lines = []
+    for s in summaries:
+        name = s.stage
+        if s.analyzer:
+            name += f"[{s.analyzer}]"
+        if s.group_id:
+            name += f"@{s.group_id}"
+        line = f"{name}: p50 {s.p50 * 1000:.0f}ms / p95 {s.p95 * 1000:.0f}ms ×{s.count}"
+        if s.items:
+            line += f"，{s.throughput:.0f} 条/秒"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# 插件全局的统计注册表
+METRICS = MetricsRegistry()
+
+
+# 事件循环延迟的采样间隔(秒)
+LOOP_LAG_INTERVAL = 0.1
+
+
+class LoopLagMonitor:
+    """
+    事件循环延迟监控:定期休眠固定时间,实际唤醒时间超出的部分即为事件循环被阻塞的时长,
+    记录到 event_loop_lag 阶段,并把最大延迟导出为 event_loop_lag_max_seconds
+    """
+
+    def __init__(self, registry: MetricsRegistry = METRICS, interval: float = LOOP_LAG_INTERVAL):
+        self._registry = registry
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+
+    def start(self):
+        """在当前事件循环中启动监控"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        """停止监控"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._interval
+            await asyncio.sleep(self._interval)
+            lag = max(0.0, loop.time() - expected)
+            self._registry.observe("event_loop_lag", lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+                self._registry.set_gauge("event_loop_lag_max_seconds", lag)
@@ -0,0 +1,244 @@
+"""
+单次分析的性能剖析
+在 cProfile 与 tracemalloc 下运行一次报告生成,记录热点函数与各阶段的内存峰值
+"""
+import asyncio
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import METRICS
+
+
+# 报告中列出的热点函数与内存分配数量
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+# 聊天摘要中列出的条目数量
+SUMMARY_ITEMS = 5
+# Python 3.12 起 cProfile 基于 sys.monitoring,同时记录所有线程;更早的版本只记录调用 enable 的线程
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+THREAD_LIMITATION_NOTE = (
+    "注意: 当前 Python 版本的 cProfile 只记录事件循环线程，"
+    "在工作线程中执行的分节图片生成、原生合成与 PNG 编码不计入热点函数，"
+    "这些步骤的耗时见 /ca stats 中的 section、render_native 等阶段"
+)
+
+# 同一时间只允许一次剖析(cProfile 与 tracemalloc 都是进程级的)
+_PROFILE_LOCK = threading.Lock()
+
+
+class ProfileBusyError(RuntimeError):
+    """已有剖析正在进行"""
+
+
+class StageMemoryTracker:
+    """
+    metrics span 回调:记录指定群每个阶段相对于进入时的内存峰值增量
+
+    嵌套阶段会把自身峰值向外层传递,外层阶段的峰值不会因内层重置峰值而丢失
+    """
+
+    def __init__(self, group_id: str):
+        self._group_id = str(group_id)
+        # [(阶段名, 进入时的当前内存, 子阶段中观测到的最大峰值)]
+        self._stack: List[List] = []
+        self.peaks: Dict[str, int] = {}
+
+    @staticmethod
+    def _stage_key(stage: str, analyzer: str) -> str:
+        return f"{stage}[{analyzer}]" if analyzer else stage
+
+    def on_enter(self, stage: str, group_id: str, analyzer: str):
+        if group_id != self._group_id or not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+        self._stack.append([self._stage_key(stage, analyzer), current, 0])
+        tracemalloc.reset_peak()
+
+    def on_exit(self, stage: str, group_id: str, analyzer: str):
+        if group_id != self._group_id or not self._stack or not tracemalloc.is_tracing():
+            return
+        key, start_current, child_peak = self._stack.pop()
+        peak = max(tracemalloc.get_traced_memory()[1], child_peak)
+        self.peaks[key] = max(self.peaks.get(key, 0), peak - start_current)
+        if self._stack:
+            self._stack[-1][2] = max(self._stack[-1][2], peak)
+
+
+@dataclass
+class ProfileReport:
+    """一次剖析的结果"""
+    group_id: str
+    elapsed: float
+    peak_memory: int
+    stage_peaks: Dict[str, int]
+    top_functions: List[Tuple[str, float, float, int]]  # (函数, 累计耗时, 自身耗时, 调用次数)
+    report_path: Path
+    stats_path: Path
+    error: Optional[BaseException] = field(default=None)
+
+    def summary(self) -> str:
+        """生成适合在聊天中发送的简短摘要"""
+        lines = [
+            f"剖析完成喵~ 用时 {self.elapsed:.2f}s，内存峰值 {self.peak_memory / 1024 / 1024:.1f} MiB",
+        ]
+        if self.error is not None:
+            lines.append(f"分析过程中出错: {self.error}")
+        if self.top_functions:
+            lines.append("热点函数(累计耗时):")
+            for name, cumulative, _, calls in self.top_functions[:SUMMARY_ITEMS]:
+                lines.append(f"  {cumulative:.2f}s ×{calls} {name}")
+        if self.stage_peaks:
+            lines.append("各阶段内存峰值:")
+            for stage, peak in sorted(self.stage_peaks.items(), key=lambda item: -item[1])[:SUMMARY_ITEMS]:
+                lines.append(f"  {peak / 1024 / 1024:.1f} MiB {stage}")
+        if not PROFILES_ALL_THREADS:
+            lines.append(THREAD_LIMITATION_NOTE)
+        lines.append(f"完整报告: {self.report_path}")
+        return "\n".join(lines)
+
+
+def profiling_active() -> bool:
+    """是否有剖析正在进行"""
+    return _PROFILE_LOCK.locked()
+
+
+def _function_label(func: Tuple[str, int, str]) -> str:
+    filename, lineno, name = func
+    return f"{Path(filename).name}:{lineno}({name})"
+
+
+def _write_reports(
+    profiler: cProfile.Profile,
+    snapshot: tracemalloc.Snapshot,
+    stage_peaks: Dict[str, int],
+    group_id: str,
+    stamp: str,
+    elapsed: float,
+    peak_memory: int,
+    error: Optional[BaseException],
+    report_path: Path,
+    stats_path: Path
+) -> List[Tuple[str, float, float, int]]:
+    """写出 .prof 文件与文本报告,返回累计耗时最高的函数列表(在线程中执行)"""
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(stats_path))
+    stats = pstats.Stats(profiler)
+    top_functions = sorted(
+        (
+            (_function_label(func), cumulative, total, calls)
+            for func, (_, calls, total, cumulative, _) in stats.stats.items()  # type: ignore
+        ),
+        key=lambda item: -item[1]
+    )[:TOP_FUNCTIONS]
+
+    # 写出完整报告
+    buffer = io.StringIO()
+    buffer.write(f"群 {group_id} 分析剖析报告 {stamp}\n")
+    buffer.write(f"总耗时: {elapsed:.3f}s  内存峰值: {peak_memory / 1024 / 1024:.2f} MiB\n")
+    if error is not None:
+        buffer.write(f"分析出错: {error!r}\n")
+    if not PROFILES_ALL_THREADS:
+        buffer.write(f"{THREAD_LIMITATION_NOTE}\n")
+    buffer.write("\n==== 各阶段内存峰值(相对进入阶段时) ====\n")
+    for stage, peak in sorted(stage_peaks.items(), key=lambda item: -item[1]):
+        buffer.write(f"{peak / 1024 / 1024:10.2f} MiB  {stage}\n")
+    buffer.write(f"\n==== 累计耗时前 {TOP_FUNCTIONS} 的函数 ====\n")
+    pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    buffer.write(f"\n==== 自身耗时前 {TOP_FUNCTIONS} 的函数 ====\n")
+    pstats.Stats(profiler, stream=buffer).sort_stats("tottime").print_stats(TOP_FUNCTIONS)
+    buffer.write(f"\n==== 剖析结束时仍占用内存最多的 {TOP_ALLOCATIONS} 处分配 ====\n")
+    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+        buffer.write(f"{stat}\n")
+    report_path.write_text(buffer.getvalue(), encoding="utf-8")
+    return top_functions
+
+
+async def profile_run(
+    group_id: str,
+    run: Callable[[], Awaitable[object]],
+    output_dir: Path
+) -> ProfileReport:
+    """
+    在 cProfile 与 tracemalloc 下执行一次分析,并将结果写入 output_dir
+
+    注意:剖析期间事件循环上其他任务的开销也会被计入;Python 3.12 以下的版本中,
+    工作线程(分节图片、原生合成、PNG 编码)里的函数调用不会被 cProfile 记录
+
+    :param group_id: 被剖析的群号(用于筛选各阶段的内存峰值)
+    :param run: 执行一次分析的协程函数
+    :param output_dir: 输出目录
+    :return: 剖析结果
+    :raises ProfileBusyError: 已有剖析正在进行
+    """
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        raise ProfileBusyError("已有剖析正在进行")
+    try:
+        return await _profile_locked(group_id, run, output_dir)
+    finally:
+        _PROFILE_LOCK.release()
+
+
+async def _profile_locked(
+    group_id: str,
+    run: Callable[[], Awaitable[object]],
+    output_dir: Path
+) -> ProfileReport:
+    """profile_run 的实现,调用方需持有 _PROFILE_LOCK"""
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    report_path = output_dir / f"profile_{group_id}_{stamp}.txt"
+    stats_path = output_dir / f"profile_{group_id}_{stamp}.prof"
+
+    tracker = StageMemoryTracker(group_id)
+    profiler = cProfile.Profile()
+    was_tracing = tracemalloc.is_tracing()
+    error: Optional[BaseException] = None
+    METRICS.add_hook(tracker)
+    try:
+        if not was_tracing:
+            tracemalloc.start(25)
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            await run()
+        except Exception as e:
+            error = e
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+    finally:
+        # 无论 enable 或分析是否失败,都恢复 tracemalloc 与 metrics 回调
+        METRICS.remove_hook(tracker)
+        if not was_tracing:
+            tracemalloc.stop()
+
+    # 写出 .prof 与完整报告涉及统计整理和磁盘 I/O,放到线程中避免阻塞事件循环
+    top_functions = await asyncio.to_thread(
+        _write_reports,
+        profiler, snapshot, tracker.peaks, group_id, stamp,
+        elapsed, peak_memory, error, report_path, stats_path
+    )
+
+    return ProfileReport(
+        group_id=group_id,
+        elapsed=elapsed,
+        peak_memory=peak_memory,
+        stage_peaks=tracker.peaks,
+        top_functions=top_functions,
+        report_path=report_path,
+        stats_path=stats_path,
+        error=error
+    )
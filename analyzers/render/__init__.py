@@ -5,18 +5,30 @@
 
 from .main_render import (
     render_analysis_result,
+    build_section_image,
+    render_sections,
+    cleanup_sections,
     RenderInfo
 )
+from .compositor import compose_sections
 from .rankings import (
     create_ranking_with_avatars,
     save_ranking_with_avatars,
+    configure_ranking_memo,
+    ranking_memo_stats,
     RenderUserInfo
 )
 
 __all__ = [
     'RenderUserInfo',
     'render_analysis_result',
+    'build_section_image',
+    'render_sections',
+    'cleanup_sections',
+    'compose_sections',
     'create_ranking_with_avatars',
     'save_ranking_with_avatars',
+    'configure_ranking_memo',
+    'ranking_memo_stats',
     'RenderInfo'
 ]
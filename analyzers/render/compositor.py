@@ -0,0 +1,288 @@
+"""
+原生 PIL 合成器
+不经过 Markdown 解析,直接把报告头部文字和各节图片按固定版式叠放到画布上
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    from .main_render import RenderInfo, load_markdown_style
+except ImportError:
+    from main_render import RenderInfo, load_markdown_style
+
+
+# 版式参数
+CANVAS_MIN_WIDTH = 960
+PADDING_X = 48
+PADDING_Y = 40
+TITLE_FONT_SIZE = 48
+HEADING_FONT_SIZE = 34
+TEXT_FONT_SIZE = 24
+LINE_SPACING = 10
+SECTION_SPACING = 28
+SECTION_IMAGE_SCALE = 0.8  # 与 pillowmd 路径中的 !sgm[...|0.8] 保持一致
+
+TEXT_COLOR = (40, 40, 40, 255)
+QUOTE_COLOR = (110, 110, 110, 255)
+QUOTE_BAR_COLOR = (200, 200, 200, 255)
+HEADING_COLOR = (20, 20, 20, 255)
+BACKGROUND_COLOR = (255, 255, 255, 255)
+
+# 样式中没有可用字体时使用的系统字体
+FALLBACK_FONT_PATHS = [
+    "C:/Windows/Fonts/msyh.ttc",      # 微软雅黑
+    "C:/Windows/Fonts/simhei.ttf",    # 黑体
+    "C:/Windows/Fonts/STKAITI.TTF",   # 华文楷体
+]
+
+_COLOR_TAG = re.compile(r"<color=([^>]*)>")
+# pillowmd 的行内标记:<color=...> 颜色标签,以及分析器名称两侧的自定义装饰(如 </\>)
+_INLINE_MARKUP = re.compile(r"<[^<>\s]*>")
+
+# mdstyle 中对应各项的属性名(按顺序尝试)
+_STYLE_FONT_ATTRS = ("mainFontPath", "fontPath")
+_STYLE_TEXT_COLOR_ATTRS = ("textColor",)
+_STYLE_BACKGROUND_COLOR_ATTRS = ("backGroundColor", "backgroundColor")
+
+
+@dataclass
+class StyleAssets:
+    """从 mdstyle 配置中读取并预先测量好的版式资源"""
+    title_font: ImageFont.FreeTypeFont | ImageFont.ImageFont
+    heading_font: ImageFont.FreeTypeFont | ImageFont.ImageFont
+    text_font: ImageFont.FreeTypeFont | ImageFont.ImageFont
+    title_height: int
+    heading_height: int
+    text_height: int
+    text_color: Tuple[int, int, int, int]
+    background_color: Tuple[int, int, int, int]
+
+
+def _load_font(font_path: Optional[str], size: int) -> ImageFont.FreeTypeFont | ImageFont.ImageFont:
+    """按路径加载字体,失败时依次尝试系统字体,最后使用默认字体"""
+    candidates = ([font_path] if font_path else []) + FALLBACK_FONT_PATHS
+    for path in candidates:
+        try:
+            return ImageFont.truetype(path, size)
+        except Exception:
+            continue
+    return ImageFont.load_default()
+
+
+def _line_height(font: ImageFont.FreeTypeFont | ImageFont.ImageFont) -> int:
+    """测量字体的行高"""
+    bbox = font.getbbox("国Ag")
+    return int(bbox[3] - bbox[1]) + LINE_SPACING
+
+
+def _style_value(style: object, names: Tuple[str, ...]) -> object:
+    """按顺序读取 mdstyle 对象上第一个非空的属性"""
+    for name in names:
+        value = getattr(style, name, None)
+        if value:
+            return value
+    return None
+
+
+def _to_rgba(value: object, default: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
+    """把 mdstyle 中的颜色((r, g, b[, a]) 或 #RRGGBB)转换为 RGBA,无法识别时使用默认值"""
+    if isinstance(value, str) and value.startswith("#") and len(value) in (7, 9):
+        try:
+            channels = [int(value[i:i + 2], 16) for i in range(1, len(value), 2)]
+        except ValueError:
+            return default
+        return tuple(channels + [255] * (4 - len(channels)))  # type: ignore
+    if isinstance(value, (tuple, list)) and len(value) in (3, 4) and all(isinstance(c, int) for c in value):
+        return tuple(list(value) + [255] * (4 - len(value)))  # type: ignore
+    return default
+
+
+@lru_cache(maxsize=None)
+def load_style_assets(style_path: str) -> StyleAssets:
+    """
+    读取 mdstyle 配置中的字体与颜色,并测量各级文字的行高(每个样式只加载一次)
+
+    使用与 pillowmd 渲染路径相同的样式对象(load_markdown_style),
+    样式中的背景图与装饰元素不会被原生合成器绘制
+
+    :param style_path: mdstyle 文件夹路径
+    :return: 版式资源
+    """
+    style = load_markdown_style(style_path)
+    font_path: Optional[str] = None
+    configured_font = _style_value(style, _STYLE_FONT_ATTRS)
+    if configured_font:
+        candidate = Path(str(configured_font))
+        if not candidate.is_absolute() and not candidate.exists():
+            candidate = Path(style_path) / candidate
+        font_path = str(candidate)
+
+    title_font = _load_font(font_path, TITLE_FONT_SIZE)
+    heading_font = _load_font(font_path, HEADING_FONT_SIZE)
+    text_font = _load_font(font_path, TEXT_FONT_SIZE)
+    return StyleAssets(
+        title_font=title_font,
+        heading_font=heading_font,
+        text_font=text_font,
+        title_height=_line_height(title_font),
+        heading_height=_line_height(heading_font),
+        text_height=_line_height(text_font),
+        text_color=_to_rgba(_style_value(style, _STYLE_TEXT_COLOR_ATTRS), TEXT_COLOR),
+        background_color=_to_rgba(_style_value(style, _STYLE_BACKGROUND_COLOR_ATTRS), BACKGROUND_COLOR)
+    )
+
+
+def _strip_markup(text: str) -> str:
+    """
+    去掉 pillowmd 的行内标记(颜色标签与名称装饰),得到可直接绘制的纯文本
+
+    :param text: 含标记的文本
+    :return: 纯文本
+    """
+    return _INLINE_MARKUP.sub("", text).strip()
+
+
+def _parse_header_line(line: str, text_color: Tuple[int, int, int, int] = TEXT_COLOR) -> Tuple[str, Tuple[int, int, int, int], bool]:
+    """
+    解析 RenderInfo 或文本节中的单行 Markdown 文本
+
+    只支持这些地方会用到的语法:引用(> )和 <color=#RRGGBB> 标签,其余行内标记直接去掉
+
+    :param line: Markdown 文本行
+    :param text_color: 普通文字的颜色
+    :return: (纯文本, 颜色, 是否为引用)
+    """
+    text = line.strip()
+    is_quote = text.startswith(">")
+    if is_quote:
+        text = text.lstrip(">").strip()
+    color = QUOTE_COLOR if is_quote else text_color
+    match = _COLOR_TAG.search(text)
+    if match and match.group(1).startswith("#") and len(match.group(1)) == 7:
+        hex_color = match.group(1)[1:]
+        color = tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4)) + (255,)  # type: ignore
+    return _strip_markup(text), color, is_quote  # type: ignore
+
+
+@lru_cache(maxsize=64)
+def _heading_template(style_path: str, text: str) -> Image.Image:
+    """
+    渲染并缓存二级标题图片(分析器名称在各次报告之间不变)
+
+    :param style_path: mdstyle 文件夹路径
+    :param text: 标题文字(分析器名称,可以带 pillowmd 装饰)
+    :return: 透明背景的标题图片
+    """
+    assets = load_style_assets(style_path)
+    text = _strip_markup(text)
+    bbox = assets.heading_font.getbbox(text)
+    width = max(1, int(bbox[2]))
+    image = Image.new("RGBA", (width, assets.heading_height), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((0, 0), text, font=assets.heading_font, fill=HEADING_COLOR)
+    return image
+
+
+def _load_section_image(section: Path) -> Image.Image:
+    """加载一节图片并按 SECTION_IMAGE_SCALE 缩放"""
+    with Image.open(section) as raw:
+        image = raw.convert("RGBA")
+    size = (
+        max(1, int(image.width * SECTION_IMAGE_SCALE)),
+        max(1, int(image.height * SECTION_IMAGE_SCALE))
+    )
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def compose_sections(
+    render_info: RenderInfo,
+    sections: Dict[str, Path | str],
+    title: str = "群聊信息分析表",
+    resources_path: Path = Path("data/ChatAnalyzer/resources")
+) -> List[Image.Image]:
+    """
+    使用原生 PIL 合成报告:标题、头部文字和每个分析器一节,自上而下叠放
+
+    与 render_sections 的参数和返回值一致,可直接替换;不支持任意 Markdown,
+    文本类的节只识别引用与颜色标签,其余标记去掉后按纯文本逐行绘制。
+
+    :param render_info: 报告头部信息
+    :param sections: 各节内容,格式为 {analyzer_name: 图片路径或文本}
+    :param title: 图片标题
+    :param resources_path: 资源文件夹路径(包含 mdstyle 文件夹)
+    :return: 只包含一帧的图片列表
+    """
+    style_path = str(resources_path / "mdstyle")
+    assets = load_style_assets(style_path)
+
+    # 先加载所有节的内容,确定画布尺寸
+    header_lines = [
+        _parse_header_line(line, assets.text_color)
+        for text in render_info.markdown_texts
+        for line in text.splitlines()
+        if line.strip()
+    ]
+    blocks: List[Tuple[Image.Image, Image.Image | List[Tuple[str, Tuple[int, int, int, int], bool]]]] = []
+    for analyzer_name, section in sections.items():
+        heading = _heading_template(style_path, analyzer_name)
+        if isinstance(section, Path):
+            blocks.append((heading, _load_section_image(section)))
+        else:
+            blocks.append((heading, [
+                _parse_header_line(line, assets.text_color)
+                for line in str(section).splitlines() if line.strip()
+            ]))
+
+    content_width = max(
+        [CANVAS_MIN_WIDTH - 2 * PADDING_X]
+        + [body.width for _, body in blocks if isinstance(body, Image.Image)]
+    )
+    width = content_width + 2 * PADDING_X
+    height = PADDING_Y + assets.title_height + LINE_SPACING
+    height += len(header_lines) * assets.text_height
+    for heading, body in blocks:
+        height += SECTION_SPACING + heading.height + LINE_SPACING
+        if isinstance(body, Image.Image):
+            height += body.height
+        else:
+            height += len(body) * assets.text_height
+    height += PADDING_Y
+
+    canvas = Image.new("RGBA", (width, height), assets.background_color)
+    draw = ImageDraw.Draw(canvas)
+
+    y = PADDING_Y
+    draw.text((PADDING_X, y), title, font=assets.title_font, fill=HEADING_COLOR)
+    y += assets.title_height + LINE_SPACING
+
+    def draw_lines(lines: List[Tuple[str, Tuple[int, int, int, int], bool]]):
+        nonlocal y
+        for text, color, is_quote in lines:
+            x = PADDING_X
+            if is_quote:
+                draw.rectangle(
+                    [(PADDING_X, y), (PADDING_X + 4, y + assets.text_height - LINE_SPACING)],
+                    fill=QUOTE_BAR_COLOR
+                )
+                x += 16
+            draw.text((x, y), text, font=assets.text_font, fill=color)
+            y += assets.text_height
+
+    draw_lines(header_lines)
+
+    for heading, body in blocks:
+        y += SECTION_SPACING
+        canvas.paste(heading, (PADDING_X, y), heading)
+        y += heading.height + LINE_SPACING
+        if isinstance(body, Image.Image):
+            x = PADDING_X + (content_width - body.width) // 2
+            canvas.paste(body, (x, y), body)
+            y += body.height
+        else:
+            draw_lines(body)
+
+    return [canvas]
@@ -3,10 +3,10 @@ from PIL import Image
 from pathlib import Path
 from datetime import datetime, timedelta
 from dataclasses import dataclass, field
+from functools import lru_cache
 
 from ncatbot.utils import get_log
 
-import pillowmd
 import asyncio
 
 try:
@@ -16,6 +16,19 @@ except ImportError:
 
 LOG = get_log("ChatAnalyzer")
 
+
+@lru_cache(maxsize=None)
+def load_markdown_style(style_path: str):
+    """
+    加载 pillowmd 样式(每个样式文件夹只加载一次)
+
+    :param style_path: mdstyle 文件夹路径
+    :return: pillowmd 样式对象
+    """
+    # pillowmd 在首次加载样式(预热或第一份报告)时才导入,导入插件时不加载
+    import pillowmd
+    return pillowmd.LoadMarkdownStyles(style_path)
+
 @dataclass
 class RenderInfo:
     current_time: datetime
@@ -23,74 +36,85 @@ class RenderInfo:
     group_name_and_id: str
     plugin_version: str
     _start_time: Optional[datetime] = field(default=None)
+    _end_time: Optional[datetime] = field(default=None)  # 统计时间段的结束时间,默认为 current_time
     markdown_texts: List[str] = field(default_factory=list)
 
     def __post_init__(self):
+        if self._end_time is None:
+            self._end_time = self.current_time
         if self._start_time is None:
-            self._start_time = self.current_time - timedelta(minutes=self.analysis_duration)
+            self._start_time = self._end_time - timedelta(minutes=self.analysis_duration)
         self.markdown_texts.append(f"> 现在是 {self.current_time} ，来看看各位的发言情况喵！\n")
-        self.markdown_texts.append(f"统计时间段：{self._start_time.strftime('%Y年%m月%d日 %H:%M')} ~ {self.current_time.strftime('%Y年%m月%d日 %H:%M')}\n")
+        self.markdown_texts.append(f"统计时间段：{self._start_time.strftime('%Y年%m月%d日 %H:%M')} ~ {self._end_time.strftime('%Y年%m月%d日 %H:%M')}\n")
         self.markdown_texts.append(f"所在群：{self.group_name_and_id}\n")
         self.markdown_texts.append(f"插件版本：{self.plugin_version}\n")
         self.markdown_texts.append("\n<color=#800080>今天也要开心喵~<color=None>\n")
 
 
-async def render_analysis_result(
+def build_section_image(
+    result: list[RenderUserInfo] | Path | str,
+    resources_path: Path = Path("data/ChatAnalyzer/resources")
+) -> Path | str:
+    """
+    将单个分析器的结果转换为报告中的一节(图片路径或 Markdown 文本)
+
+    :param result: 单个分析器的结果,排行榜为 RenderUserInfo 列表,自定义图表为图片路径
+    :param resources_path: 资源文件夹路径
+    :return: 该节的图片路径,或需要原样插入的 Markdown 文本
+    """
+    if isinstance(result, list):
+        # 获取前三名,不足的用占位符填充(复制一份,避免修改缓存的聚合结果)
+        top_users = list(result[:3])
+        while len(top_users) < 3:
+            rank = len(top_users) + 1
+            top_users.append(RenderUserInfo.create_placeholder(rank))
+
+        return save_ranking_with_avatars(
+            champion_infos=(top_users[0], top_users[1], top_users[2]),
+            resources_path=resources_path
+        )
+    return result
+
+
+async def render_sections(
     render_info: RenderInfo,
-    results: Dict[str, list[RenderUserInfo] | Path],
+    sections: Dict[str, Path | str],
     title: str = "群聊信息分析表",
     resources_path: Path = Path("data/ChatAnalyzer/resources")
 ) -> List[Image.Image]:
     """
-    将分析结果渲染为图片,使用 pillowmd 渲染包含头像的 Markdown 文本
-    
-    :param results: 分析结果字典,格式为 {analyzer_name: [(user_id, count), ...], ...}
+    将已生成的各节图片组合为 Markdown 并使用 pillowmd 渲染
+
+    该函数不会删除各节的临时图片,渲染失败时可直接使用同一份 sections 重试
+
+    :param render_info: 报告头部信息
+    :param sections: 各节内容,格式为 {analyzer_name: 图片路径或 Markdown 文本}
     :param title: 图片标题
-    :param show_avatars: 是否在每个分析器下方显示头像
     :param resources_path: 资源文件夹路径(包含 mdstyle 文件夹)
-    :return: 渲染后的图片帧列表(用于生成 GIF)
+    :return: 渲染后的图片帧列表
     """
-    
-    # 确保临时文件夹存在
+    import pillowmd
+
     temp_dir = resources_path.parent / "temp"
     temp_dir.mkdir(parents=True, exist_ok=True)
 
-    temp_pics: list[Path] = []
-
     pillowmd.Setting.QUICK_IMAGE_PATH = temp_dir
     # 构建 Markdown 文本
     markdown_parts = []
     markdown_parts.append(f"# {title}")
     markdown_parts.extend(render_info.markdown_texts)
-    # 遍历每个分析器的结果
-    for analyzer_name, result in results.items():
+    for analyzer_name, section in sections.items():
         # 添加分析器名称作为二级标题
         markdown_parts.append(f"\n## {analyzer_name}\n")
-        img_path: Path
-        if isinstance(result, list):
-            # 获取前三名,不足的用占位符填充
-            top_users = result
-            while len(top_users) < 3:
-                rank = len(top_users) + 1
-                top_users.append(RenderUserInfo.create_placeholder(rank))
-            
-            img_path = save_ranking_with_avatars(
-                champion_infos=(top_users[0], top_users[1], top_users[2]),
-                resources_path=resources_path
-            )
-        elif isinstance(result, Path):
-            img_path = result
-        else:
-            markdown_parts.append(result)
-            continue
+        if isinstance(section, Path):
             # 在 Markdown 中添加图片引用
-        temp_pics.append(img_path)
-        markdown_parts.append(f"!sgm[{img_path.name}|0.8]")
+            markdown_parts.append(f"!sgm[{section.name}|0.8]")
+        else:
+            markdown_parts.append(section)
     # 组合完整的 Markdown 文本
     markdown_text = "\n".join(markdown_parts)
-    
-    style_path = resources_path / "mdstyle"
-    style = pillowmd.LoadMarkdownStyles(str(style_path))
+
+    style = load_markdown_style(str(resources_path / "mdstyle"))
     result = await pillowmd.MdToImage(
         text=markdown_text,
         style=style,
@@ -100,14 +124,47 @@ async def render_analysis_result(
     )
     # 从渲染结果中获取图片
     if result.imageType == 'gif':
-        base_images = result.images
-    else:
-        base_images = [result.image]
-    # 删除临时图片文件
-    for temp_pic in temp_pics:
-        temp_pic.unlink(True)
+        return result.images
+    return [result.image]
+
+
+def cleanup_sections(sections: Dict[str, Path | str]):
+    """
+    删除各节生成的临时图片文件
+
+    :param sections: 各节内容
+    """
+    for section in sections.values():
+        if isinstance(section, Path):
+            section.unlink(True)
+
+
+async def render_analysis_result(
+    render_info: RenderInfo,
+    results: Dict[str, list[RenderUserInfo] | Path],
+    title: str = "群聊信息分析表",
+    resources_path: Path = Path("data/ChatAnalyzer/resources")
+) -> List[Image.Image]:
+    """
+    将分析结果渲染为图片,使用 pillowmd 渲染包含头像的 Markdown 文本
     
-    return base_images
+    :param results: 分析结果字典,格式为 {analyzer_name: [(user_id, count), ...], ...}
+    :param title: 图片标题
+    :param resources_path: 资源文件夹路径(包含 mdstyle 文件夹)
+    :return: 渲染后的图片帧列表(用于生成 GIF)
+    """
+    # 确保临时文件夹存在
+    temp_dir = resources_path.parent / "temp"
+    temp_dir.mkdir(parents=True, exist_ok=True)
+
+    sections: Dict[str, Path | str] = {}
+    try:
+        for analyzer_name, result in results.items():
+            sections[analyzer_name] = build_section_image(result, resources_path)
+        return await render_sections(render_info, sections, title, resources_path)
+    finally:
+        # 删除临时图片文件
+        cleanup_sections(sections)
 
 
 if __name__ == "__main__":
@@ -2,22 +2,37 @@ import uuid
 from PIL import Image, ImageDraw, ImageFont
 from pathlib import Path
 from typing import Tuple, Dict, Optional
+from collections import OrderedDict
 import base64
+import hashlib
+import threading
+import time
 from io import BytesIO
 from dataclasses import dataclass, field
+from functools import lru_cache
 from ncatbot.utils import status, get_log
 import sys
 
 # 导入 get_qq_avatar_async 函数
 try:
     from ...utils import get_qq_avatar_async
+    from ..api_client import API
 except ImportError:
     # 直接运行此文件时,添加父目录到路径
     sys.path.insert(0, str(Path(__file__).parent.parent.parent))
     from utils import get_qq_avatar_async
+    from analyzers.api_client import API
 
 LOG = get_log("ChatAnalyzer")
 
+# 排行榜文字大小
+NICKNAME_FONT_SIZE = 32
+COUNT_FONT_SIZE = 24
+# 排行榜图片缓存的默认内存上限(字节)
+DEFAULT_RANKING_MEMO_BYTES = 16 * 1024 * 1024
+# 头像框文件版本的缓存时间(秒),一份报告内的各个排行榜只检查一次文件
+FRAME_VERSION_TTL = 5.0
+
 
 @dataclass
 class RenderUserInfo:
@@ -71,7 +86,7 @@ class RenderUserInfo:
         """异步初始化方法,获取昵称和头像"""
         if not self.debug:
             try:
-                member_info = await status.global_api.get_group_member_info(self.group_id, self.user_id)
+                member_info = await API.get_group_member_info(self.group_id, self.user_id)
             except Exception as e:
                 LOG.warning(f"无法获取用户信息，使用占位符: group_id={self.group_id}, user_id={self.user_id}, error={e}")
                 self = self.__dict__.update(self.create_placeholder(self.rank).__dict__)
@@ -108,6 +123,94 @@ class RenderUserInfo:
         )
 
 
+# {资源文件夹: (过期时间, 头像框版本)}
+_frame_versions: Dict[str, Tuple[float, Tuple]] = {}
+_frame_versions_lock = threading.Lock()
+
+
+def _frame_asset_version(resources_path: Path) -> Tuple:
+    """
+    头像框文件的版本(修改时间与大小),替换素材后缓存自动失效
+
+    结果缓存 FRAME_VERSION_TTL 秒,排行榜图片缓存与头像框缓存共用,避免每个排行榜重复读取文件信息
+    """
+    key = str(resources_path)
+    now = time.monotonic()
+    with _frame_versions_lock:
+        cached = _frame_versions.get(key)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    version = []
+    for name in ("1st.png", "2nd.png", "3rd.png"):
+        stat = (Path(resources_path) / name).stat()
+        version.append((stat.st_mtime_ns, stat.st_size))
+    with _frame_versions_lock:
+        _frame_versions[key] = (now + FRAME_VERSION_TTL, tuple(version))
+    return tuple(version)
+
+
+def load_ranking_frames(resources_path: str) -> Tuple[Image.Image, Image.Image, Image.Image]:
+    """
+    加载金银铜头像框,2nd 和 3rd 缩放为 1st 的 95%
+
+    结果按头像框文件的版本缓存,与排行榜图片缓存使用同一个版本,替换素材后两者同时失效
+
+    :param resources_path: 资源文件夹路径
+    :return: (1st, 2nd, 3rd) 头像框图片
+    """
+    return _load_ranking_frames(resources_path, _frame_asset_version(Path(resources_path)))
+
+
+@lru_cache(maxsize=8)
+def _load_ranking_frames(resources_path: str, version: Tuple) -> Tuple[Image.Image, Image.Image, Image.Image]:
+    """按 (资源文件夹, 头像框版本) 加载并缓存头像框,version 只参与缓存键"""
+    path = Path(resources_path)
+    img_1st = Image.open(path / "1st.png").convert("RGBA")
+    img_2nd = Image.open(path / "2nd.png").convert("RGBA")
+    img_3rd = Image.open(path / "3rd.png").convert("RGBA")
+
+    width_1st, height_1st = img_1st.size
+    size = (int(width_1st * 0.95), int(height_1st * 0.95))
+    img_2nd_resized = img_2nd.resize(size, Image.Resampling.LANCZOS)
+    img_3rd_resized = img_3rd.resize(size, Image.Resampling.LANCZOS)
+    return img_1st, img_2nd_resized, img_3rd_resized
+
+
+@lru_cache(maxsize=None)
+def load_ranking_fonts(font_size: int, count_font_size: int):
+    """
+    加载排行榜的昵称字体与统计字体(结果缓存)
+
+    :param font_size: 昵称字体大小
+    :param count_font_size: 统计数字字体大小
+    :return: (昵称字体, 统计字体)
+    """
+    font_paths = [
+        "C:/Windows/Fonts/STKAITI.TTF",   # 华文楷体
+        "C:/Windows/Fonts/simkai.ttf",    # 楷体
+        "C:/Windows/Fonts/msyh.ttc",      # 微软雅黑 - 备用
+    ]
+    
+    font = None
+    count_font = None
+    for font_path in font_paths:
+        try:
+            if font is None:
+                font = ImageFont.truetype(font_path, font_size)
+            if count_font is None:
+                count_font = ImageFont.truetype(font_path, count_font_size)
+            if font and count_font:
+                break
+        except:
+            continue
+    
+    if font is None:
+        font = ImageFont.load_default()
+    if count_font is None:
+        count_font = ImageFont.load_default()
+    return font, count_font
+
+
 def create_ranking_with_avatars(
     champion_infos: Tuple[RenderUserInfo, RenderUserInfo, RenderUserInfo],
     resources_path: Path = Path("data/ChatAnalyzer/resources"),
@@ -123,26 +226,15 @@ def create_ranking_with_avatars(
     """
     # 固定的文字样式参数
     text_gap = 10  # 头像框和文字之间的间隙
-    font_size = 32  # 昵称字体大小
-    count_font_size = 24  # 统计数字的字体大小
+    font_size = NICKNAME_FONT_SIZE  # 昵称字体大小
+    count_font_size = COUNT_FONT_SIZE  # 统计数字的字体大小
     text_width_reduce = 48  # 文字区域比头像框总宽度短的像素数
     
-    # 加载头像框
-    img_1st = Image.open(resources_path / "1st.png").convert("RGBA")
-    img_2nd = Image.open(resources_path / "2nd.png").convert("RGBA")
-    img_3rd = Image.open(resources_path / "3rd.png").convert("RGBA")
-    
-    # 获取1st的原始尺寸
+    # 加载头像框(已缩放好的头像框会被缓存)
+    img_1st, img_2nd_resized, img_3rd_resized = load_ranking_frames(str(resources_path))
     width_1st, height_1st = img_1st.size
-    
-    # 计算2nd和3rd的尺寸
-    width_2nd = int(width_1st * 0.95)
-    height_2nd = int(height_1st * 0.95)
-    img_2nd_resized = img_2nd.resize((width_2nd, height_2nd), Image.Resampling.LANCZOS)
-    
-    width_3rd = int(width_1st * 0.95)
-    height_3rd = int(height_1st * 0.95)
-    img_3rd_resized = img_3rd.resize((width_3rd, height_3rd), Image.Resampling.LANCZOS)
+    width_2nd, height_2nd = img_2nd_resized.size
+    width_3rd, height_3rd = img_3rd_resized.size
     
     # 计算画布尺寸(增加底部空间用于显示昵称和统计)
     frames_total_width = width_2nd + gap + width_1st + gap + width_3rd  # 头像框总宽度
@@ -207,30 +299,8 @@ def create_ranking_with_avatars(
     # 绘制昵称和统计文字
     draw = ImageDraw.Draw(canvas)
     
-    # 尝试加载可爱的字体,如果失败则使用默认字体
-    font_paths = [
-        "C:/Windows/Fonts/STKAITI.TTF",   # 华文楷体
-        "C:/Windows/Fonts/simkai.ttf",    # 楷体
-        "C:/Windows/Fonts/msyh.ttc",      # 微软雅黑 - 备用
-    ]
-    
-    font = None
-    count_font = None
-    for font_path in font_paths:
-        try:
-            if font is None:
-                font = ImageFont.truetype(font_path, font_size)
-            if count_font is None:
-                count_font = ImageFont.truetype(font_path, count_font_size)
-            if font and count_font:
-                break
-        except:
-            continue
-    
-    if font is None:
-        font = ImageFont.load_default()
-    if count_font is None:
-        count_font = ImageFont.load_default()
+    # 尝试加载可爱的字体,如果失败则使用默认字体(字体对象会被缓存)
+    font, count_font = load_ranking_fonts(font_size, count_font_size)
     
     def truncate_text(text: str, max_width: int, font) -> str:
         """
@@ -300,27 +370,138 @@ def create_ranking_with_avatars(
     return canvas
 
 
+@dataclass
+class RankingMemoStats:
+    """排行榜图片缓存的统计信息"""
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class RankingMemo:
+    """
+    排行榜图片缓存:以输入摘要为键保存编码好的 PNG,按总字节数做 LRU 淘汰,线程安全
+
+    同一批人、同样的昵称与统计在多个分析器或相邻两次报告中出现时,直接复用图片,
+    不再合成头像、排版文字与编码
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_RANKING_MEMO_BYTES):
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[bytes, bytes] = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return data
+
+    def put(self, key: bytes, data: bytes):
+        if len(data) > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> RankingMemoStats:
+        with self._lock:
+            return RankingMemoStats(len(self._entries), self._bytes, self._hits, self._misses)
+
+
+_RANKING_MEMO: Optional[RankingMemo] = RankingMemo()
+
+
+def configure_ranking_memo(max_bytes: int):
+    """
+    配置排行榜图片缓存的内存上限,为 0 时关闭缓存
+
+    :param max_bytes: 内存上限(字节)
+    """
+    global _RANKING_MEMO
+    _RANKING_MEMO = RankingMemo(max_bytes) if max_bytes > 0 else None
+
+
+def ranking_memo_stats() -> RankingMemoStats:
+    """获取排行榜图片缓存的统计信息"""
+    memo = _RANKING_MEMO
+    return memo.stats() if memo is not None else RankingMemoStats(0, 0, 0, 0)
+
+
+def ranking_memo_key(
+    champion_infos: Tuple[RenderUserInfo, RenderUserInfo, RenderUserInfo],
+    resources_path: Path,
+    gap: int
+) -> bytes:
+    """
+    计算排行榜图片的缓存键:前三名的用户号、昵称、统计文字、头像摘要,以及头像框版本与排版参数
+
+    :return: 16 字节摘要
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((
+        _frame_asset_version(resources_path), str(resources_path), gap, NICKNAME_FONT_SIZE, COUNT_FONT_SIZE
+    )).encode("utf-8"))
+    for info in champion_infos:
+        avatar_hash = hashlib.blake2b((info.avatar_base64 or "").encode("ascii"), digest_size=16).hexdigest()
+        digest.update(repr((info.user_id, info.nickname, info.count, avatar_hash)).encode("utf-8"))
+    return digest.digest()
+
+
 def save_ranking_with_avatars(
     champion_infos: tuple[RenderUserInfo, RenderUserInfo, RenderUserInfo],
     resources_path: Path = Path("data/ChatAnalyzer/resources"),
     gap: int = 24,
 ) -> Path:
     """
-    生成并保存带头像的排行榜图片
+    生成并保存带头像的排行榜图片,输入相同时直接写出缓存的图片
     
     :param champion_infos: 包含前三名用户信息的元组
     :param resources_path: 资源文件夹路径
     :param gap: 头像框之间的间隙(像素)
     :return: 输出文件路径
     """
-    image = create_ranking_with_avatars(
-        champion_infos,
-        resources_path,
-        gap
-    )
     random_name = uuid.uuid4().hex
     output_path = resources_path.parent / "temp" / f"ranking_{random_name}.png"
-    image.save(output_path, "PNG")
+    memo = _RANKING_MEMO
+    key = ranking_memo_key(champion_infos, resources_path, gap) if memo is not None else None
+    data = memo.get(key) if memo is not None else None
+    if data is None:
+        image = create_ranking_with_avatars(
+            champion_infos,
+            resources_path,
+            gap
+        )
+        buffer = BytesIO()
+        image.save(buffer, "PNG")
+        data = buffer.getvalue()
+        if memo is not None:
+            memo.put(key, data)
+    output_path.write_bytes(data)
     return output_path
 
 
@@ -0,0 +1,476 @@
+"""
+报告渲染队列
+机器人进程完成聚合(需要访问 API 的部分)后,把可序列化的渲染任务写入 SQLite 队列,
+由多个工作进程认领并生成图片,结果写回数据库后由机器人进程发送。
+工作进程崩溃时,它认领的任务会被重新放回队列;机器人重启后未发送的报告会继续处理
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from ncatbot.utils import get_log
+
+from .engine_pool import EnginePool
+from .metrics import METRICS
+from .render import RenderInfo
+
+LOG = get_log("ChatAnalyzerRenderQueue")
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_POSTED = "posted"  # 结果已开始发送,重启后不再重发
+
+# 任务租约(秒):工作进程在租约内未续约视为已崩溃,任务可被其他进程重新认领
+DEFAULT_LEASE = 120
+# 队列轮询间隔(秒)
+POLL_INTERVAL = 0.5
+# 单个任务最多被认领的次数(包括工作进程崩溃的情况)
+MAX_ATTEMPTS = 3
+# 检查工作进程是否存活的间隔(秒)
+HEALTH_CHECK_INTERVAL = 5
+
+
+@dataclass
+class RenderJob:
+    """队列中的一个渲染任务"""
+    id: int
+    group_id: str
+    status: str
+    attempts: int
+    result: Optional[str] = None
+    error: Optional[str] = None
+    window: str = ""  # 报告的统计窗口,用于识别同一份报告的重复任务
+
+
+class JobQueue:
+    """
+    SQLite 持久化的任务队列,可被多个进程同时使用
+
+    认领任务在 BEGIN IMMEDIATE 事务中完成,同一任务只会被一个进程认领
+    """
+
+    def __init__(self, path: Path):
+        """
+        :param path: 数据库文件路径
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "group_id TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "status TEXT NOT NULL, "
+                "worker TEXT, "
+                "lease_until REAL NOT NULL DEFAULT 0, "
+                "attempts INTEGER NOT NULL DEFAULT 0, "
+                "result TEXT, "
+                "error TEXT, "
+                "updated REAL NOT NULL"
+                ")"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            if "report_window" not in columns:
+                # 旧版本创建的队列没有 report_window 列
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN report_window TEXT NOT NULL DEFAULT ''")
+
+    def put(self, group_id: str, payload: Dict[str, Any], window: str = "") -> int:
+        """
+        写入一个任务
+
+        :param group_id: 群号
+        :param payload: 任务数据(可 JSON 序列化)
+        :param window: 报告的统计窗口(如 "开始时间戳-结束时间戳")
+        :return: 任务 id
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (group_id, payload, status, updated, report_window) VALUES (?, ?, ?, ?, ?)",
+                (str(group_id), json.dumps(payload, ensure_ascii=False), JOB_PENDING, time.time(), window)
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker_id: str, lease: float = DEFAULT_LEASE, max_attempts: int = MAX_ATTEMPTS) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """
+        认领最早的待处理任务(包括租约已过期的任务)
+
+        :param worker_id: 工作进程标识
+        :param lease: 租约时长(秒)
+        :param max_attempts: 超过该认领次数仍未完成的任务标记为失败
+        :return: (任务 id, 任务数据),没有可认领的任务时为 None
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated = ? "
+                    "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (JOB_FAILED, "渲染工作进程多次中断", now, JOB_RUNNING, now, max_attempts)
+                )
+                row = self._conn.execute(
+                    "SELECT id, payload FROM jobs "
+                    "WHERE status = ? OR (status = ? AND lease_until < ?) "
+                    "ORDER BY id LIMIT 1",
+                    (JOB_PENDING, JOB_RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated = ? "
+                        "WHERE id = ?",
+                        (JOB_RUNNING, worker_id, now + lease, now, row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def heartbeat(self, job_id: int, worker_id: str, lease: float = DEFAULT_LEASE):
+        """续约正在处理的任务"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?",
+                (time.time() + lease, job_id, worker_id, JOB_RUNNING)
+            )
+
+    def complete(self, job_id: int, worker_id: str, result: str):
+        """写入任务结果"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, payload = '{}', updated = ? WHERE id = ? AND worker = ?",
+                (JOB_DONE, result, time.time(), job_id, worker_id)
+            )
+
+    def mark_posted(self, job_id: int):
+        """标记任务的结果已开始发送(先标记再发送,重启后不会重复发送)"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = NULL, updated = ? WHERE id = ?",
+                (JOB_POSTED, time.time(), job_id)
+            )
+
+    def fail(self, job_id: int, worker_id: str, error: str, max_attempts: int = MAX_ATTEMPTS):
+        """任务失败:未达到最大认领次数时放回队列,否则标记为失败"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "worker = NULL, lease_until = 0, error = ?, updated = ? WHERE id = ? AND worker = ?",
+                (max_attempts, JOB_FAILED, JOB_PENDING, error, time.time(), job_id, worker_id)
+            )
+
+    def release_worker(self, worker_id: str) -> int:
+        """
+        把已退出的工作进程认领的任务放回队列
+
+        :return: 放回的任务数
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_until = 0, updated = ? WHERE status = ? AND worker = ?",
+                (JOB_PENDING, time.time(), JOB_RUNNING, worker_id)
+            ).rowcount
+
+    def release_all(self) -> int:
+        """
+        把所有处理中的任务放回队列(机器人重启时,上次的工作进程已经退出)
+
+        :return: 放回的任务数
+        """
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_until = 0, updated = ? WHERE status = ?",
+                (JOB_PENDING, time.time(), JOB_RUNNING)
+            ).rowcount
+
+    def get(self, job_id: int) -> Optional[RenderJob]:
+        """读取任务状态与结果"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, group_id, status, attempts, result, error, report_window FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return RenderJob(*row) if row else None
+
+    def unfinished(self) -> List[RenderJob]:
+        """所有尚未被移除(即结果尚未发送)的任务,不包含结果内容"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, group_id, status, attempts, NULL, error, report_window FROM jobs ORDER BY id"
+            ).fetchall()
+        return [RenderJob(*row) for row in rows]
+
+    def remove(self, job_id: int):
+        """移除任务(结果已发送或已放弃)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# ======== 工作进程 ========
+def _heartbeat(queue: JobQueue, job_id: int, worker_id: str, lease: float, stop: threading.Event):
+    """在后台线程中定期续约"""
+    while not stop.wait(lease / 3):
+        queue.heartbeat(job_id, worker_id, lease)
+
+
+async def render_job(engines: EnginePool, payload: Dict[str, Any]) -> str:
+    """
+    在当前进程中生成一个渲染任务的报告
+
+    :param engines: 工作进程内的分析引擎池(同一个群的任务复用同一个引擎)
+    :param payload: 任务数据,见 ChatAnalysisEngine.export_render_job
+    :return: base64 字符串
+    """
+    info = payload["render_info"]
+    render_info = RenderInfo(
+        current_time=datetime.fromisoformat(info["current_time"]),
+        analysis_duration=info["analysis_duration"],
+        group_name_and_id=info["group_name_and_id"],
+        plugin_version=info["plugin_version"],
+        _start_time=datetime.fromisoformat(info["start_time"]) if info.get("start_time") else None,
+        _end_time=datetime.fromisoformat(info["end_time"]) if info.get("end_time") else None
+    )
+    async with engines.acquire(
+        payload["group_id"],
+        render_info,
+        payload.get("enabled"),
+        payload.get("tier", "full")
+    ) as engine:
+        return await engine.analyze_job(payload)
+
+
+async def _worker_loop(
+    queue: JobQueue,
+    engines: EnginePool,
+    worker_id: str,
+    parent_pid: int,
+    lease: float,
+    poll_interval: float
+):
+    """工作进程的主循环,所有任务在同一个事件循环中处理"""
+    while os.getppid() == parent_pid:
+        claimed = queue.claim(worker_id, lease)
+        if claimed is None:
+            await asyncio.sleep(poll_interval)
+            continue
+        job_id, payload = claimed
+        stop = threading.Event()
+        threading.Thread(target=_heartbeat, args=(queue, job_id, worker_id, lease, stop), daemon=True).start()
+        try:
+            result = await render_job(engines, payload)
+        except Exception as e:
+            LOG.error(f"渲染工作进程 {worker_id} 处理任务 {job_id} 失败: {e}")
+            queue.fail(job_id, worker_id, str(e))
+        else:
+            queue.complete(job_id, worker_id, result)
+        finally:
+            stop.set()
+
+
+def worker_main(
+    db_path: str,
+    resources_path: str,
+    worker_id: str,
+    engine_options: Dict[str, Any],
+    parent_pid: int,
+    lease: float = DEFAULT_LEASE,
+    poll_interval: float = POLL_INTERVAL
+):
+    """
+    渲染工作进程入口:循环认领任务并写回结果,机器人进程退出后自动结束
+
+    与机器人进程一样按群复用分析引擎,每个任务结束后释放统计数据
+
+    :param db_path: 队列数据库路径
+    :param resources_path: 资源文件夹路径
+    :param worker_id: 工作进程标识
+    :param engine_options: 传给 ChatAnalysisEngine 的其他参数
+    :param parent_pid: 机器人进程的 pid
+    :param lease: 任务租约(秒)
+    :param poll_interval: 没有任务时的轮询间隔(秒)
+    """
+    queue = JobQueue(Path(db_path))
+    engines = EnginePool(Path(resources_path), **engine_options)
+    try:
+        asyncio.run(_worker_loop(queue, engines, worker_id, parent_pid, lease, poll_interval))
+    finally:
+        queue.close()
+
+
+class RenderWorkers:
+    """
+    渲染工作进程组(在机器人进程中使用)
+
+    工作进程以 spawn 方式启动,不继承机器人进程的事件循环与线程;
+    每个工作进程占用一个固定的槽位,后台定期检查,已退出的进程在原槽位重启,其任务放回队列
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        resources_path: Path,
+        workers: int,
+        engine_options: Optional[Dict[str, Any]] = None,
+        lease: float = DEFAULT_LEASE,
+        poll_interval: float = POLL_INTERVAL,
+        health_interval: float = HEALTH_CHECK_INTERVAL
+    ):
+        """
+        :param db_path: 队列数据库路径
+        :param resources_path: 资源文件夹路径
+        :param workers: 工作进程数
+        :param engine_options: 传给 ChatAnalysisEngine 的其他参数(需可序列化)
+        :param lease: 任务租约(秒)
+        :param poll_interval: 轮询间隔(秒)
+        :param health_interval: 检查工作进程是否存活的间隔(秒)
+        """
+        self._db_path = db_path
+        self._resources_path = resources_path
+        self._workers = max(1, workers)
+        self._engine_options = dict(engine_options or {})
+        self._lease = lease
+        self._poll_interval = poll_interval
+        self._health_interval = health_interval
+        self._queue = JobQueue(db_path)
+        self._context = multiprocessing.get_context("spawn")
+        # {槽位: (工作进程标识, 进程)}
+        self._slots: Dict[int, Tuple[str, multiprocessing.process.BaseProcess]] = {}
+        self._generation = 0
+        self._monitor: Optional[asyncio.Task] = None
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    def _spawn(self, slot: int):
+        self._generation += 1
+        worker_id = f"{os.getpid()}-{slot}-{self._generation}"
+        process = self._context.Process(
+            target=worker_main,
+            args=(str(self._db_path), str(self._resources_path), worker_id, self._engine_options, os.getpid(), self._lease, self._poll_interval),
+            name=f"ChatAnalyzerRender-{slot}",
+            daemon=True
+        )
+        process.start()
+        self._slots[slot] = (worker_id, process)
+
+    def start(self):
+        """启动工作进程,并在当前事件循环中启动健康检查"""
+        if not self._slots:
+            released = self._queue.release_all()
+            if released:
+                LOG.info(f"上次运行时有 {released} 个渲染任务未完成，已放回队列")
+        for slot in range(self._workers):
+            if slot not in self._slots:
+                self._spawn(slot)
+        LOG.info(f"已启动 {self._workers} 个渲染工作进程")
+        if self._monitor is None or self._monitor.done():
+            self._monitor = asyncio.get_running_loop().create_task(self._watch())
+
+    async def _watch(self):
+        """定期检查工作进程,报告之间崩溃的进程也会被及时重启"""
+        while True:
+            await asyncio.sleep(self._health_interval)
+            try:
+                self.check_workers()
+            except Exception as e:
+                LOG.error(f"检查渲染工作进程失败: {e}")
+
+    def check_workers(self):
+        """在原槽位重启已退出的工作进程,并把它们认领的任务放回队列"""
+        for slot, (worker_id, process) in list(self._slots.items()):
+            if process.is_alive():
+                continue
+            del self._slots[slot]
+            released = self._queue.release_worker(worker_id)
+            LOG.warning(f"渲染工作进程 {worker_id} 已退出(退出码 {process.exitcode})，放回 {released} 个任务并重启")
+            METRICS.incr("render_worker_restarts")
+            self._spawn(slot)
+
+    async def submit(self, group_id: str, payload: Dict[str, Any], window: str = "") -> int:
+        """
+        提交渲染任务
+
+        :param group_id: 群号
+        :param payload: 任务数据,见 ChatAnalysisEngine.export_render_job
+        :param window: 报告的统计窗口
+        :return: 任务 id
+        """
+        return await asyncio.to_thread(self._queue.put, group_id, {**payload, "group_id": str(group_id)}, window)
+
+    async def wait(self, job_id: int) -> str:
+        """
+        等待任务完成并移除任务
+
+        :param job_id: 任务 id
+        :return: base64 字符串
+        """
+        while True:
+            job = await asyncio.to_thread(self._queue.get, job_id)
+            if job is None:
+                raise RuntimeError(f"渲染任务 {job_id} 不存在")
+            if job.status == JOB_DONE:
+                return job.result  # type: ignore
+            if job.status == JOB_FAILED:
+                raise RuntimeError(f"渲染任务失败: {job.error}")
+            await asyncio.sleep(self._poll_interval)
+
+    async def render(self, group_id: str, payload: Dict[str, Any], window: str = "") -> str:
+        """
+        提交任务并等待结果,结果取回(或任务失败)后移除任务;
+        等待被取消时任务保留在队列中,机器人重启后继续处理
+        """
+        job_id = await self.submit(group_id, payload, window)
+        with METRICS.span("render_queue", group_id):
+            try:
+                result = await self.wait(job_id)
+            except Exception:
+                await asyncio.to_thread(self._queue.remove, job_id)
+                raise
+        await asyncio.to_thread(self._queue.remove, job_id)
+        return result
+
+    def unfinished(self) -> List[RenderJob]:
+        """结果尚未发送的任务(用于机器人重启后继续处理)"""
+        return self._queue.unfinished()
+
+    def remove(self, job_id: int):
+        """移除任务"""
+        self._queue.remove(job_id)
+
+    def mark_posted(self, job_id: int):
+        """标记任务的结果已开始发送"""
+        self._queue.mark_posted(job_id)
+
+    def shutdown(self):
+        """结束所有工作进程并关闭队列(未完成的任务保留在队列中)"""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        for _, process in self._slots.values():
+            process.terminate()
+        for _, process in self._slots.values():
+            process.join(timeout=5)
+        self._slots.clear()
+        self._queue.close()
@@ -0,0 +1,133 @@
+"""
+每日汇总
+保存每天定时报告结束时各分析器的统计结果,长时段(周、月)报告直接合并每日汇总,
+不再重新获取和处理原始聊天记录
+"""
+import gzip
+import json
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ncatbot.utils import get_log
+
+LOG = get_log("ChatAnalyzerRollup")
+
+# 汇总文件格式版本,格式变化时递增,旧文件会被忽略
+ROLLUP_VERSION = 1
+# 相邻两天的统计窗口允许的间隙(秒),用于容忍夏令时等偏差
+WINDOW_TOLERANCE = 3600
+DAY_SECONDS = 24 * 3600
+
+
+@dataclass
+class DailyRollup:
+    """一个群一天的统计汇总"""
+    group_id: str
+    start: int  # 统计窗口开始时间戳
+    end: int  # 统计窗口结束时间戳
+    message_count: int
+    analyzers: Dict[str, dict] = field(default_factory=dict)  # {分析器类名: 分析器状态}
+    version: int = ROLLUP_VERSION
+    # 分词类分析器处理的消息比例(小于 1 表示当天使用了抽样)
+    sample_ratio: float = 1.0
+    # 当天超出时间预算、没有导出状态的分析器类名
+    missing: List[str] = field(default_factory=list)
+
+    @property
+    def day(self) -> date:
+        """汇总所属的日期(窗口结束时间所在的日期)"""
+        return datetime.fromtimestamp(self.end).date()
+
+
+class RollupStore:
+    """
+    每日汇总存储,每个群每天一个 gzip 压缩的 JSON 文件:
+    <root>/<群号>/<YYYY-MM-DD>.json.gz
+    """
+
+    def __init__(self, root: Path, keep_days: int = 45):
+        """
+        :param root: 存储目录
+        :param keep_days: 保留天数,保存时清理更早的汇总
+        """
+        self._root = root
+        self._keep_days = keep_days
+
+    def _path(self, group_id: str, day: date) -> Path:
+        return self._root / str(group_id) / f"{day.isoformat()}.json.gz"
+
+    def save(self, rollup: DailyRollup):
+        """
+        保存一天的汇总(同一天已有的汇总会被覆盖),并清理过期汇总
+
+        :param rollup: 每日汇总
+        """
+        path = self._path(rollup.group_id, rollup.day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(asdict(rollup), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        temp_path.write_bytes(gzip.compress(data))
+        temp_path.replace(path)
+        self.prune(rollup.group_id, rollup.day)
+
+    def load(self, group_id: str, day: date) -> Optional[DailyRollup]:
+        """
+        读取某一天的汇总
+
+        :param group_id: 群号
+        :param day: 日期
+        :return: 汇总,不存在、损坏或版本不符时返回 None
+        """
+        path = self._path(group_id, day)
+        if not path.exists():
+            return None
+        try:
+            data = json.loads(gzip.decompress(path.read_bytes()))
+        except (OSError, ValueError) as e:
+            LOG.warning(f"读取每日汇总 {path} 失败: {e}")
+            return None
+        if data.get("version") != ROLLUP_VERSION:
+            return None
+        return DailyRollup(**data)
+
+    def load_window(self, group_id: str, start: int, end: int) -> Optional[List[DailyRollup]]:
+        """
+        读取覆盖 [start, end] 的连续每日汇总
+
+        要求各汇总的窗口首尾相接,第一份覆盖 start,最后一份在 end 前一天内结束
+        (定时报告尚未覆盖的最近数小时会被忽略)
+
+        :param group_id: 群号
+        :param start: 开始时间戳
+        :param end: 结束时间戳
+        :return: 按时间排序的汇总,无法完整覆盖时返回 None
+        """
+        first_day = datetime.fromtimestamp(start).date()
+        last_day = datetime.fromtimestamp(end).date()
+        rollups = []
+        day = first_day
+        while day <= last_day:
+            rollup = self.load(group_id, day)
+            if rollup is not None and start + WINDOW_TOLERANCE < rollup.end <= end + WINDOW_TOLERANCE:
+                rollups.append(rollup)
+            day += timedelta(days=1)
+        if not rollups:
+            return None
+        rollups.sort(key=lambda r: r.end)
+        if rollups[0].start > start + WINDOW_TOLERANCE or rollups[-1].end < end - DAY_SECONDS:
+            return None
+        for previous, current in zip(rollups, rollups[1:]):
+            if abs(current.start - previous.end) > WINDOW_TOLERANCE:
+                return None
+        return rollups
+
+    def prune(self, group_id: str, today: date):
+        """删除超过保留天数的汇总"""
+        if self._keep_days <= 0:
+            return
+        cutoff = (today - timedelta(days=self._keep_days)).isoformat()
+        for path in (self._root / str(group_id)).glob("*.json.gz"):
+            if path.name[:10] < cutoff:
+                path.unlink(missing_ok=True)
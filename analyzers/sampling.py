@@ -0,0 +1,92 @@
+"""
+消息抽样
+消息量很大时,需要分词的分析器(词云、词性)只处理有界的样本,计数类分析器仍处理全部消息
+"""
+import hashlib
+import random
+from typing import Dict, Iterable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+# 抽样方式
+# hour: 按小时分层,各小时按消息量比例分配样本,保留一天中不同时段的话题
+# reservoir: 蓄水池抽样,所有消息等概率入选
+SAMPLE_BY_HOUR = "hour"
+SAMPLE_RESERVOIR = "reservoir"
+SAMPLE_METHODS = (SAMPLE_BY_HOUR, SAMPLE_RESERVOIR)
+
+
+def reservoir_sample(items: Iterable[T], k: int, rng: random.Random) -> List[T]:
+    """
+    蓄水池抽样(算法 R),只遍历一次,不需要事先知道总数
+
+    :param items: 待抽样的元素
+    :param k: 样本大小
+    :param rng: 随机数生成器
+    :return: 样本(顺序不固定)
+    """
+    reservoir: List[T] = []
+    for index, item in enumerate(items):
+        if index < k:
+            reservoir.append(item)
+        else:
+            slot = rng.randrange(index + 1)
+            if slot < k:
+                reservoir[slot] = item
+    return reservoir
+
+
+def stratified_sample(strata: Sequence[int], k: int, rng: random.Random) -> List[int]:
+    """
+    分层抽样:按各层的元素数比例分配样本(最大余数法),层内随机抽取
+
+    :param strata: 每个元素所属的层(如小时)
+    :param k: 样本大小
+    :param rng: 随机数生成器
+    :return: 入选元素的下标(未排序)
+    """
+    groups: Dict[int, List[int]] = {}
+    for index, stratum in enumerate(strata):
+        groups.setdefault(stratum, []).append(index)
+    total = len(strata)
+    quotas = {stratum: k * len(members) / total for stratum, members in groups.items()}
+    allocation = {stratum: int(quota) for stratum, quota in quotas.items()}
+    leftover = k - sum(allocation.values())
+    for stratum in sorted(quotas, key=lambda s: quotas[s] - allocation[s], reverse=True)[:leftover]:
+        allocation[stratum] += 1
+    sample: List[int] = []
+    for stratum, members in groups.items():
+        sample.extend(rng.sample(members, min(allocation[stratum], len(members))))
+    return sample
+
+
+def sample_seed(*parts: object) -> int:
+    """
+    由任意字段计算稳定的随机种子(random.Random 不接受元组等类型作为种子)
+
+    :param parts: 决定样本的字段,例如群号、消息数与时间范围
+    :return: 64 位整数种子
+    """
+    text = "|".join(str(part) for part in parts)
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def sample_indices(hours: Sequence[int], k: int, method: str = SAMPLE_BY_HOUR, seed: Optional[int] = None) -> List[int]:
+    """
+    选出样本下标,总数不超过 k 时返回全部下标
+
+    :param hours: 每条消息所在的小时
+    :param k: 样本大小
+    :param method: 抽样方式,见 SAMPLE_METHODS
+    :param seed: 随机种子(见 sample_seed),相同的种子得到相同的样本
+    :return: 升序排列的下标
+    """
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f"未知的抽样方式: {method}，可选值: {', '.join(SAMPLE_METHODS)}")
+    total = len(hours)
+    if k <= 0 or total <= k:
+        return list(range(total))
+    rng = random.Random(seed)
+    if method == SAMPLE_BY_HOUR:
+        return sorted(stratified_sample(hours, k, rng))
+    return sorted(reservoir_sample(range(total), k, rng))
@@ -0,0 +1,170 @@
+"""
+定时报告调度器
+订阅的群较多时,报告按截止时间与群规模排队,由固定数量的工作协程依次生成,
+开始时间在推送窗口内错开,避免所有群的拉取、分词与渲染同时进行
+"""
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ncatbot.utils import get_log
+
+from .metrics import METRICS
+
+LOG = get_log("ChatAnalyzerScheduler")
+
+ReportHandler = Callable[[str], Awaitable[object]]
+
+
+@dataclass(order=True)
+class ReportJob:
+    """排队中的一份报告,按 (截止时间, 群规模从大到小, 入队顺序) 排序"""
+    deadline: float
+    neg_size: float
+    sequence: int
+    group_id: str = field(compare=False)
+    not_before: float = field(compare=False)
+    handler: ReportHandler = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class RunStats:
+    """一次定时触发的完成情况"""
+    label: str
+    total: int
+    succeeded: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    max_lateness: float = 0.0  # 晚于截止时间完成的最长时间(秒)
+    durations: Dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        """生成适合写入日志或在聊天中发送的简短摘要"""
+        text = f"{self.label}: {self.succeeded}/{self.total} 成功，用时 {self.elapsed:.1f}s"
+        if self.failed:
+            text += f"，失败 {self.failed}"
+        if self.max_lateness > 0:
+            text += f"，最多超出截止时间 {self.max_lateness:.1f}s"
+        return text
+
+
+class ReportScheduler:
+    """
+    有界并发的报告调度器
+
+    多次触发(例如 22:00 与 23:59)共用同一个队列与同一组工作协程,
+    截止时间早的先处理;同一次触发中按上次观测到的消息数从大到小处理,
+    规模未知的群视为最大,尽早开始
+    """
+
+    def __init__(self, workers: int = 2, spread: float = 0, deadline: float = 0):
+        """
+        :param workers: 同时生成的报告数
+        :param spread: 同一次触发内各群开始时间错开的窗口(秒),0 表示不错开
+        :param deadline: 每次触发的报告应在多少秒内完成(只影响排序与统计),0 表示使用 spread
+        """
+        self._workers = max(1, workers)
+        self._spread = max(0.0, spread)
+        self._deadline = deadline if deadline > 0 else self._spread
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._sizes: Dict[str, int] = {}
+        self.last_run: Optional[RunStats] = None
+
+    def record_size(self, group_id: str, message_count: int):
+        """记录群最近一次报告的消息数,用于下次排序"""
+        self._sizes[str(group_id)] = message_count
+
+    def _size(self, group_id: str) -> float:
+        return self._sizes.get(str(group_id), float("inf"))
+
+    def start(self):
+        """在当前事件循环中启动工作协程"""
+        self._tasks = [task for task in self._tasks if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._tasks) < self._workers:
+            self._tasks.append(loop.create_task(self._worker()))
+
+    def stop(self):
+        """停止工作协程,未开始的报告会被取消"""
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        while not self._queue.empty():
+            job: ReportJob = self._queue.get_nowait()
+            job.future.cancel()
+
+    async def _worker(self):
+        while True:
+            job: ReportJob = await self._queue.get()
+            try:
+                if job.future.done():
+                    continue
+                delay = job.not_before - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                start = time.perf_counter()
+                try:
+                    with METRICS.span("scheduled_report", job.group_id):
+                        await job.handler(job.group_id)
+                except asyncio.CancelledError:
+                    job.future.cancel()
+                    raise
+                except Exception as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                else:
+                    if not job.future.done():
+                        job.future.set_result(time.perf_counter() - start)
+            finally:
+                self._queue.task_done()
+
+    async def run(self, label: str, group_ids: Sequence[str], handler: ReportHandler) -> RunStats:
+        """
+        为一批群排队生成报告,等待全部完成
+
+        :param label: 本次触发的名称(用于日志与统计)
+        :param group_ids: 群号列表
+        :param handler: 为单个群生成并发送报告的协程函数,异常视为失败
+        :return: 本次触发的完成情况
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        deadline = now + self._deadline
+        ordered = sorted(dict.fromkeys(str(group_id) for group_id in group_ids), key=lambda gid: -self._size(gid))
+        step = self._spread / len(ordered) if ordered else 0
+        jobs: List[Tuple[str, asyncio.Future]] = []
+        for index, group_id in enumerate(ordered):
+            future = loop.create_future()
+            self._queue.put_nowait(ReportJob(
+                deadline=deadline,
+                neg_size=-self._size(group_id),
+                sequence=next(self._sequence),
+                group_id=group_id,
+                not_before=now + index * step,
+                handler=handler,
+                future=future
+            ))
+            jobs.append((group_id, future))
+
+        stats = RunStats(label=label, total=len(jobs))
+        start = time.perf_counter()
+        for group_id, future in jobs:
+            try:
+                stats.durations[group_id] = await future
+                stats.succeeded += 1
+            except Exception:
+                stats.failed += 1
+                METRICS.incr("scheduled_report_failures", group_id)
+        stats.elapsed = time.perf_counter() - start
+        stats.max_lateness = max(0.0, time.monotonic() - deadline) if self._deadline > 0 else 0.0
+        METRICS.set_gauge("scheduler_last_run_seconds", stats.elapsed)
+        METRICS.set_gauge("scheduler_last_run_failures", stats.failed)
+        self.last_run = stats
+        LOG.info(stats.summary())
+        return stats
@@ -0,0 +1,64 @@
+"""
+消息段分类
+一次遍历 event.message,统计各类消息段数量并拼接纯文本,供所有分析器共享
+"""
+from dataclasses import dataclass
+
+from ncatbot.core import GroupMessageEvent
+
+
+# OneBot11 消息段类型
+SEGMENT_TEXT = "text"
+SEGMENT_IMAGE = "image"
+SEGMENT_FACE = "face"
+SEGMENT_AT = "at"
+SEGMENT_REPLY = "reply"
+
+# 以此开头的文本段视为命令,不计入拼接文本
+COMMAND_PREFIX = "/"
+
+
+@dataclass(slots=True)
+class SegmentStats:
+    """单条消息的消息段统计"""
+    text: str = ""  # 以空格连接的纯文本(忽略命令)
+    text_length: int = 0  # 所有文本段的总字数(包括命令)
+    images: int = 0  # 图片数量(包括动画表情)
+    animated_images: int = 0  # 动画表情数量
+    faces: int = 0  # QQ 表情数量
+    ats: int = 0  # @ 数量
+    replies: int = 0  # 回复数量
+
+
+def classify_segments(event: GroupMessageEvent) -> SegmentStats:
+    """
+    一次遍历消息段,统计各类消息段并拼接纯文本
+
+    :param event: 群消息事件
+    :return: 消息段统计
+    """
+    stats = SegmentStats()
+    message = event.message
+    if message is None:
+        return stats
+    texts = []
+    for segment in message.messages:
+        seg_type = segment.msg_seg_type
+        if seg_type == SEGMENT_TEXT:
+            text = segment.text
+            stats.text_length += len(text)
+            if not text.startswith(COMMAND_PREFIX):
+                texts.append(text)
+        elif seg_type == SEGMENT_IMAGE:
+            stats.images += 1
+            if segment.is_animated_image():
+                stats.animated_images += 1
+        elif seg_type == SEGMENT_FACE:
+            stats.faces += 1
+        elif seg_type == SEGMENT_AT:
+            stats.ats += 1
+        elif seg_type == SEGMENT_REPLY:
+            stats.replies += 1
+    if texts:
+        stats.text = " ".join(texts) + " "
+    return stats
@@ -1,5 +1,7 @@
 from ncatbot.core import GroupMessageEvent
+from typing import Sequence
 from .base_analyzer import BaseAnalyzer, register_analyzer
+from .features import FEATURE_SEGMENTS, MessageFeatures
 
 
 @register_analyzer
@@ -12,14 +14,20 @@ class ActiveSenderAnalyzer(BaseAnalyzer):
         self._unit = "条"
         self._custom_name_decorator = r"</\>"
     
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """处理单个消息事件,统计发言"""
         self._counter[str(event.user_id)] += 1
 
+    def process_batch(self, events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]):
+        """批量统计发言"""
+        self._counter.update(str(event.user_id) for event in events)
+
 
 @register_analyzer
 class WordCountAnalyzer(BaseAnalyzer):
     """字数统计分析器 - 统计单条消息最长字数"""
+
+    _features = frozenset({FEATURE_SEGMENTS})
     
     def __init__(self, group_id: str):
         super().__init__(group_id)
@@ -27,14 +35,18 @@ class WordCountAnalyzer(BaseAnalyzer):
         self._unit = "字"
         self._custom_name_decorator = r"</\>"
     
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """处理单个消息事件,记录单条消息最长字数"""
-        # 获取纯文本内容
-        texts = event.message.filter_text()
-        total_chars = sum(len(plain_text.text) for plain_text in texts)
+        # 所有文本段的总字数
+        total_chars = features.segments.text_length
         
         if total_chars > 0:
             user_id = str(event.user_id)
             # 只保留该用户发送过的最长的单条消息字数
             self._counter[user_id] = max(self._counter[user_id], total_chars)
+
+    def merge_state(self, state: dict):
+        """合并每日汇总,保留各天中的最长字数"""
+        for user_id, count in state.get("counter", ()):
+            self._counter[user_id] = max(self._counter[user_id], count)
     
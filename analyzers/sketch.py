@@ -0,0 +1,106 @@
+"""
+高频项近似统计
+Space-Saving 算法的批量压缩实现:只保留固定数量的候选项,内存与消息量无关,
+适合只需要前 K 项的分析器(例如词云)
+"""
+import heapq
+from typing import Dict, Hashable, Iterable, List, Mapping, Tuple
+
+
+class HeavyHitters:
+    """
+    Space-Saving 高频项统计,接口与 Counter 的常用子集一致(update / most_common / clear)
+
+    候选项达到 2 × capacity 时压缩回 capacity 项,被淘汰项的最大计数记为下限 floor,
+    新出现的项从 floor 开始计数。因此:
+    - 内存上限为 2 × capacity 项
+    - 每项的估计值不低于真实值,且高估不超过 floor ≤ N / capacity(N 为总计数)
+    - 真实计数大于 N / capacity 的项一定会被保留
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: 压缩后保留的候选项数量,应为所需前 K 项的数倍
+        """
+        if capacity <= 0:
+            raise ValueError("capacity 必须大于 0")
+        self._capacity = capacity
+        self._counts: Dict[Hashable, int] = {}
+        self._floor = 0
+        self._total = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def total(self) -> int:
+        """累计计数 N"""
+        return self._total
+
+    @property
+    def error_bound(self) -> int:
+        """单项估计值的最大高估量"""
+        return self._floor
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._counts
+
+    def __getitem__(self, key: Hashable) -> int:
+        """估计值(未被跟踪的项返回 floor,即其真实计数的上界)"""
+        return self._counts.get(key, self._floor)
+
+    def get(self, key: Hashable, default: int = 0) -> int:
+        return self._counts.get(key, default)
+
+    def add(self, key: Hashable, count: int = 1):
+        """累加单项计数"""
+        counts = self._counts
+        value = counts.get(key)
+        counts[key] = (self._floor if value is None else value) + count
+        self._total += count
+        if value is None and len(counts) >= 2 * self._capacity:
+            self._compact()
+
+    def update(self, keys: Iterable[Hashable] | Mapping[Hashable, int]):
+        """逐项计数,传入映射时累加其中的计数(与 Counter.update 相同)"""
+        if isinstance(keys, Mapping):
+            for key, count in keys.items():
+                self.add(key, count)
+            return
+        for key in keys:
+            self.add(key)
+
+    def _compact(self):
+        """只保留计数最大的 capacity 项,并把被淘汰项的最大计数记为 floor"""
+        kept = heapq.nlargest(self._capacity, self._counts.items(), key=lambda item: item[1])
+        kept_keys = {key for key, _ in kept}
+        dropped_max = max(
+            (value for key, value in self._counts.items() if key not in kept_keys),
+            default=0
+        )
+        self._floor = max(self._floor, dropped_max)
+        self._counts = dict(kept)
+
+    def most_common(self, n: int | None = None) -> List[Tuple[Hashable, int]]:
+        """
+        按估计值降序返回前 n 项
+
+        :param n: 返回数量,None 表示全部候选项
+        :return: [(项, 估计值), ...]
+        """
+        if n is None:
+            return sorted(self._counts.items(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(n, self._counts.items(), key=lambda item: item[1])
+
+    def items(self):
+        return self._counts.items()
+
+    def clear(self):
+        """清空统计"""
+        self._counts.clear()
+        self._floor = 0
+        self._total = 0
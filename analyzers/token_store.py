@@ -0,0 +1,190 @@
+"""
+分词结果持久化存储
+以文本哈希为键,将 (词汇, 词性) 序列保存在 SQLite 中,跨报告、跨重启复用
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ncatbot.utils import get_log
+
+LOG = get_log("ChatAnalyzerTokenStore")
+
+Tokens = Tuple[Tuple[str, str], ...]
+
+# 分词规则(清洗正则、停用词、过滤条件、缓存键格式)变化时递增,旧结果自动失效
+TOKENIZER_VERSION = 2
+# 单条 SQL 中 IN (...) 的最大参数数
+_QUERY_CHUNK = 500
+# 词与词性、词与词之间的分隔符(清洗后的文本不会包含控制字符)
+_FIELD_SEP = "\x1f"
+_RECORD_SEP = "\x1e"
+
+
+def text_key(text: str) -> bytes:
+    """
+    计算文本的缓存键(包含分词规则版本)
+
+    :param text: 原始文本(非词性模式时带有分词模式前缀)
+    :return: 16 字节摘要
+    """
+    return hashlib.blake2b(
+        f"{TOKENIZER_VERSION}:{text}".encode("utf-8"),
+        digest_size=16
+    ).digest()
+
+
+def encode_tokens(tokens: Tokens) -> bytes:
+    """将分词结果编码为紧凑的字节串"""
+    return _RECORD_SEP.join(f"{word}{_FIELD_SEP}{flag}" for word, flag in tokens).encode("utf-8")
+
+
+def decode_tokens(data: bytes) -> Tokens:
+    """解码 encode_tokens 生成的字节串"""
+    if not data:
+        return ()
+    return tuple(
+        tuple(record.split(_FIELD_SEP, 1))  # type: ignore
+        for record in data.decode("utf-8").split(_RECORD_SEP)
+    )
+
+
+class TokenStore:
+    """
+    SQLite 分词结果存储,线程安全
+
+    每条记录保存最近一次写入或命中的日期,超过 max_age_days 天未使用的记录会在打开时
+    以及之后每天第一次写入时清理,常用的文本不会因为写入得早而被清理
+    """
+
+    def __init__(self, path: Path, max_age_days: int = 30):
+        """
+        :param path: 数据库文件路径
+        :param max_age_days: 记录保留天数,0 表示永久保留
+        """
+        self._path = path
+        self._max_age_days = max_age_days
+        self._pruned_day = -1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                "key BLOB PRIMARY KEY, "
+                "value BLOB NOT NULL, "
+                "day INTEGER NOT NULL"
+                ") WITHOUT ROWID"
+            )
+        self._maybe_prune()
+
+    @staticmethod
+    def _today() -> int:
+        return int(time.time() // 86400)
+
+    def _maybe_prune(self):
+        """每天最多清理一次过期记录"""
+        today = self._today()
+        if self._max_age_days > 0 and self._pruned_day != today:
+            self._pruned_day = today
+            self.prune(self._max_age_days)
+
+    def _touch(self, keys: Sequence[bytes]):
+        """
+        把命中记录的日期更新为今天(每条记录每天最多更新一次)
+
+        调用方需持有 self._lock
+        """
+        today = self._today()
+        with self._conn:
+            for i in range(0, len(keys), _QUERY_CHUNK):
+                chunk = list(keys[i:i + _QUERY_CHUNK])
+                placeholders = ",".join("?" * len(chunk))
+                self._conn.execute(
+                    f"UPDATE tokens SET day = ? WHERE day < ? AND key IN ({placeholders})",
+                    (today, today, *chunk)
+                )
+
+    def get(self, text: str) -> Optional[Tokens]:
+        """读取单条文本的分词结果"""
+        key = text_key(text)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM tokens WHERE key = ?", (key,)
+            ).fetchone()
+            if row:
+                self._touch((key,))
+        self._maybe_prune()
+        return decode_tokens(row[0]) if row else None
+
+    def get_many(self, texts: Sequence[str]) -> Dict[str, Tokens]:
+        """
+        批量读取分词结果
+
+        :param texts: 文本列表
+        :return: {文本: 分词结果},只包含命中的文本
+        """
+        keys = {text_key(text): text for text in texts}
+        key_list = list(keys)
+        found: Dict[str, Tokens] = {}
+        hits: List[bytes] = []
+        with self._lock:
+            for i in range(0, len(key_list), _QUERY_CHUNK):
+                chunk = key_list[i:i + _QUERY_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM tokens WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, value in rows:
+                    found[keys[key]] = decode_tokens(value)
+                    hits.append(key)
+            if hits:
+                self._touch(hits)
+        self._maybe_prune()
+        return found
+
+    def put_many(self, items: Iterable[Tuple[str, Tokens]]):
+        """
+        批量写入分词结果(单个事务)
+
+        :param items: (文本, 分词结果) 序列
+        """
+        today = self._today()
+        rows: List[Tuple[bytes, bytes, int]] = [
+            (text_key(text), encode_tokens(tokens), today) for text, tokens in items
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tokens (key, value, day) VALUES (?, ?, ?)", rows
+            )
+        self._maybe_prune()
+
+    def put(self, text: str, tokens: Tokens):
+        """写入单条分词结果"""
+        self.put_many(((text, tokens),))
+
+    def prune(self, max_age_days: int):
+        """删除超过 max_age_days 天未写入也未命中的记录"""
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM tokens WHERE day < ?", (self._today() - max_age_days,)
+            ).rowcount
+        if deleted:
+            LOG.info(f"已清理 {deleted} 条过期的分词缓存记录")
+
+    def count(self) -> int:
+        """记录总数"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,517 @@
+"""
+分词模块
+提供 jieba 词性标注、分词结果缓存,以及在进程池中批量分词的能力
+"""
+import asyncio
+import contextvars
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from ncatbot.core import GroupMessageEvent
+from ncatbot.utils import get_log
+
+from .features import FEATURE_POS, FEATURE_WORDS
+from .segments import classify_segments
+from .token_store import Tokens, TokenStore
+
+LOG = get_log("ChatAnalyzerTokenizer")
+
+# 停用词列表（词云与词性分析器共享）
+STOP_WORDS = {
+    '一个', '什么', '怎么', '这个', '那个', '这样', '那样'
+}
+
+# 分词模式
+# pos: jieba.posseg 词性标注(开销最大)
+# words: jieba.cut 普通分词,词性为空字符串
+# words_no_hmm: 关闭 HMM 新词发现的普通分词(最快)
+TOKENIZE_POS = "pos"
+TOKENIZE_WORDS = "words"
+TOKENIZE_WORDS_NO_HMM = "words_no_hmm"
+TOKENIZE_MODES = (TOKENIZE_POS, TOKENIZE_WORDS, TOKENIZE_WORDS_NO_HMM)
+
+# 移除特殊字符,保留中文、英文、数字和空格
+_CLEAN_PATTERN = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]+')
+
+# 每批发送给工作进程的文本数量
+DEFAULT_BATCH_SIZE = 512
+# 待分词文本少于该数量时直接在当前进程中分词,避免进程间通信开销
+MIN_PARALLEL_TEXTS = 2000
+
+# 分词缓存的默认上限
+DEFAULT_CACHE_MAX_ENTRIES = 50_000
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_CACHE_TTL = 24 * 60 * 60  # 秒
+
+
+@dataclass
+class TokenCacheStats:
+    """分词缓存的统计信息"""
+    entries: int
+    bytes: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+def _estimate_size(text: str, tokens: Tokens) -> int:
+    """估算一条缓存项占用的内存(字节)"""
+    size = sys.getsizeof(text) + sys.getsizeof(tokens)
+    for word, flag in tokens:
+        size += 56 + sys.getsizeof(word) + sys.getsizeof(flag)  # 56: 二元组自身
+    return size
+
+
+class TokenCache:
+    """
+    有界的分词结果缓存(LRU)
+
+    同时限制条目数与估算的内存占用,超过 ttl 秒未写入的条目会过期,
+    保证插件长时间运行时内存保持平稳。线程安全。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+        ttl: float = DEFAULT_CACHE_TTL
+    ):
+        """
+        :param max_entries: 最大条目数,0 表示不限制
+        :param max_bytes: 最大估算内存(字节),0 表示不限制
+        :param ttl: 条目存活时间(秒),0 表示永不过期
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # 文本 -> (分词结果, 写入时间, 估算大小)
+        self._data: "OrderedDict[str, Tuple[Tokens, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, text: str) -> bool:
+        with self._lock:
+            entry = self._data.get(text)
+            return entry is not None and not self._expired(entry[1], time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl > 0 and now - stored_at > self.ttl
+
+    def get(self, text: str) -> Optional[Tokens]:
+        """读取缓存,命中时将条目移到最近使用的位置"""
+        with self._lock:
+            entry = self._data.get(text)
+            if entry is not None and self._expired(entry[1], time.monotonic()):
+                self._remove(text)
+                self._expirations += 1
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._data.move_to_end(text)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, text: str, tokens: Tokens):
+        """写入缓存,超过上限时淘汰最久未使用的条目"""
+        size = _estimate_size(text, tokens)
+        with self._lock:
+            if text in self._data:
+                self._remove(text)
+            self._data[text] = (tokens, time.monotonic(), size)
+            self._bytes += size
+            self._evict()
+
+    def _remove(self, text: str):
+        _, _, size = self._data.pop(text)
+        self._bytes -= size
+
+    def _evict(self):
+        now = time.monotonic()
+        # 先清理最旧的过期条目(按写入顺序近似)
+        while self._data and self.ttl > 0:
+            oldest = next(iter(self._data))
+            if not self._expired(self._data[oldest][1], now):
+                break
+            self._remove(oldest)
+            self._expirations += 1
+        while self._data and (
+            (self.max_entries and len(self._data) > self.max_entries)
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            _, (_, _, size) = self._data.popitem(last=False)
+            self._bytes -= size
+            self._evictions += 1
+
+    def configure(self, max_entries: int, max_bytes: int, ttl: float):
+        """调整上限,立即按新上限淘汰"""
+        with self._lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.ttl = ttl
+            self._evict()
+
+    def clear(self):
+        """清空缓存(不重置统计)"""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> TokenCacheStats:
+        """获取统计信息"""
+        with self._lock:
+            return TokenCacheStats(
+                entries=len(self._data),
+                bytes=self._bytes,
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                expirations=self._expirations
+            )
+
+
+# 分词结果缓存(文本 -> 结果),词云与词性分析器共享
+_TOKEN_CACHE = TokenCache()
+
+# 当前报告的分词结果(随报告结束释放),保证同一份报告内各分析器共享结果,
+# 不受全局缓存容量的影响;contextvar 使并发生成的多份报告互不干扰
+_SESSION: contextvars.ContextVar[Optional[Dict[str, Tokens]]] = contextvars.ContextVar(
+    "chat_analyzer_token_session", default=None
+)
+
+
+@contextmanager
+def token_session() -> Iterator[Dict[str, Tokens]]:
+    """
+    报告级的分词作用域,退出时释放本次报告的分词结果
+
+    用法:
+    with token_session():
+        await prefetch_tokens(texts)
+        ...  # 各分析器调用 extract_tokens / extract_words_with_pos
+    """
+    session: Dict[str, Tokens] = {}
+    token = _SESSION.set(session)
+    try:
+        yield session
+    finally:
+        _SESSION.reset(token)
+
+
+def message_text(event: GroupMessageEvent) -> str:
+    """
+    拼接消息中的纯文本,忽略以 / 开头的命令
+
+    :param event: 群消息事件
+    :return: 以空格连接的文本
+    """
+    return classify_segments(event).text
+
+
+def _cache_key(text: str, mode: str) -> str:
+    """缓存键:词性模式直接使用文本,其他模式加上模式前缀"""
+    return text if mode == TOKENIZE_POS else f"{mode}\x00{text}"
+
+
+def tokenize(text: str, mode: str = TOKENIZE_POS) -> Tokens:
+    """
+    使用 jieba 从文本中提取词汇和词性(不使用缓存)
+
+    :param text: 原始文本
+    :param mode: 分词模式,见 TOKENIZE_MODES;非词性模式下词性为空字符串
+    :return: ((词汇, 词性), ...)
+    """
+    text = _CLEAN_PATTERN.sub('', text)
+
+    if not text.strip():
+        return ()
+
+    if mode == TOKENIZE_POS:
+        import jieba.posseg as pseg
+
+        # 使用 jieba 进行词性标注（一次调用，返回词和词性）
+        words_with_pos = pseg.cut(text)
+    else:
+        import jieba
+
+        words_with_pos = ((word, "") for word in jieba.cut(text, HMM=mode != TOKENIZE_WORDS_NO_HMM))
+
+    # 过滤停用词和短词
+    return tuple(
+        (word.strip(), flag) for word, flag in words_with_pos
+        if len(word.strip()) >= 2 and word.lower() not in STOP_WORDS
+    )
+
+
+def extract_tokens(text: str, mode: str = TOKENIZE_POS) -> Tokens:
+    """
+    按指定模式分词(各分析器共享)
+    结果会写入有界缓存与持久化存储,相同文本只分词一次;进程池预取的结果也会写入同一缓存
+
+    :param text: 原始文本
+    :param mode: 分词模式,见 TOKENIZE_MODES
+    :return: ((词汇, 词性), ...) 元组
+    """
+    key = _cache_key(text, mode)
+    session = _SESSION.get()
+    if session is not None:
+        tokens = session.get(key)
+        if tokens is not None:
+            return tokens
+    tokens = _TOKEN_CACHE.get(key)
+    if tokens is None:
+        store = _STORE
+        tokens = store.get(key) if store is not None else None
+        if tokens is None:
+            tokens = tokenize(text, mode)
+            if store is not None:
+                store.put(key, tokens)
+        _TOKEN_CACHE.put(key, tokens)
+    if session is not None:
+        session[key] = tokens
+    return tokens
+
+
+def extract_words_with_pos(text: str) -> Tokens:
+    """
+    使用 jieba 从文本中提取词汇和词性(词性标注模式的 extract_tokens)
+
+    :param text: 原始文本
+    :return: ((词汇, 词性), ...) 元组
+    """
+    return extract_tokens(text, TOKENIZE_POS)
+
+
+def clear_token_cache():
+    """清空分词缓存"""
+    _TOKEN_CACHE.clear()
+
+
+def configure_token_cache(
+    max_entries: int = DEFAULT_CACHE_MAX_ENTRIES,
+    max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ttl: float = DEFAULT_CACHE_TTL
+):
+    """
+    调整分词缓存的上限
+
+    :param max_entries: 最大条目数,0 表示不限制
+    :param max_bytes: 最大估算内存(字节),0 表示不限制
+    :param ttl: 条目存活时间(秒),0 表示永不过期
+    """
+    _TOKEN_CACHE.configure(max_entries, max_bytes, ttl)
+
+
+def token_cache_stats() -> TokenCacheStats:
+    """获取分词缓存的统计信息"""
+    return _TOKEN_CACHE.stats()
+
+
+# 持久化分词存储(可选),内存缓存未命中时查询
+_STORE: Optional[TokenStore] = None
+
+
+def configure_token_store(path: Optional[Path], max_age_days: int = 30):
+    """
+    配置持久化分词存储,path 为 None 时关闭
+
+    :param path: SQLite 数据库文件路径
+    :param max_age_days: 记录保留天数,0 表示永久保留
+    """
+    global _STORE
+    close_token_store()
+    if path is None:
+        return
+    try:
+        _STORE = TokenStore(path, max_age_days)
+    except Exception as e:
+        LOG.warning(f"无法打开分词持久化缓存 {path}，将只使用内存缓存: {e}")
+
+
+def close_token_store():
+    """关闭持久化分词存储"""
+    global _STORE
+    if _STORE is not None:
+        _STORE.close()
+        _STORE = None
+
+
+# ======== 进程池 ========
+def _init_worker():
+    """工作进程初始化:预先加载 jieba 词典"""
+    import jieba
+    jieba.initialize()
+
+
+def _tokenize_batch(texts: List[str], mode: str) -> List[Tokens]:
+    """在工作进程中对一批文本分词"""
+    return [tokenize(text, mode) for text in texts]
+
+
+class TokenizerPool:
+    """在工作进程池中批量分词,每个进程启动时预加载 jieba 词典"""
+
+    def __init__(self, workers: int, batch_size: int = DEFAULT_BATCH_SIZE):
+        self._workers = workers
+        self._batch_size = max(1, batch_size)
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    async def stream(self, texts: Sequence[str], mode: str = TOKENIZE_POS) -> AsyncIterator[Tuple[str, Tokens]]:
+        """
+        按批提交所有文本,并按原顺序逐条返回分词结果
+
+        :param texts: 待分词文本
+        :param mode: 分词模式
+        :return: 异步迭代 (文本, 分词结果)
+        """
+        loop = asyncio.get_running_loop()
+        batches = [list(texts[i:i + self._batch_size]) for i in range(0, len(texts), self._batch_size)]
+        futures = [loop.run_in_executor(self._executor, _tokenize_batch, batch, mode) for batch in batches]
+        try:
+            for batch, future in zip(batches, futures):
+                for text, tokens in zip(batch, await future):
+                    yield text, tokens
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        """关闭进程池"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_POOL: Optional[TokenizerPool] = None
+
+
+def configure_tokenizer_pool(workers: int, batch_size: int = DEFAULT_BATCH_SIZE):
+    """
+    配置分词进程池,workers 为 0 时关闭进程池并在当前进程中分词
+
+    :param workers: 工作进程数
+    :param batch_size: 每批文本数量
+    """
+    global _POOL
+    shutdown_tokenizer_pool()
+    if workers > 0:
+        _POOL = TokenizerPool(workers, batch_size)
+        LOG.info(f"已启动 {workers} 个分词工作进程")
+
+
+def shutdown_tokenizer_pool():
+    """关闭分词进程池"""
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown()
+        _POOL = None
+
+
+async def prefetch_tokens(texts: Iterable[str], mode: str = TOKENIZE_POS):
+    """
+    预先对一批文本分词并写入缓存(以及当前报告的分词作用域)
+
+    依次查找内存缓存、持久化存储,剩余文本在配置了进程池且数量足够多时并行分词,
+    否则在当前进程中分词;进程池异常时回退到当前进程。新结果会批量写入持久化存储。
+
+    :param texts: 待分词文本
+    :param mode: 分词模式
+    """
+    session = _SESSION.get()
+
+    def remember(key: str, tokens: Tokens):
+        _TOKEN_CACHE.put(key, tokens)
+        if session is not None:
+            session[key] = tokens
+
+    # 缓存键 -> 文本
+    missing: Dict[str, str] = {}
+    for text in dict.fromkeys(texts):
+        if not text:
+            continue
+        key = _cache_key(text, mode)
+        if session is not None and key in session:
+            continue
+        tokens = _TOKEN_CACHE.get(key)
+        if tokens is None:
+            missing[key] = text
+        elif session is not None:
+            session[key] = tokens
+    if not missing:
+        return
+
+    store = _STORE
+    if store is not None:
+        stored = await asyncio.to_thread(store.get_many, list(missing))
+        for key, tokens in stored.items():
+            remember(key, tokens)
+            del missing[key]
+        if not missing:
+            return
+
+    computed: List[Tuple[str, Tokens]] = []
+    pool = _POOL
+    if pool is not None and len(missing) >= MIN_PARALLEL_TEXTS:
+        try:
+            async for text, tokens in pool.stream(list(missing.values()), mode):
+                key = _cache_key(text, mode)
+                remember(key, tokens)
+                computed.append((key, tokens))
+                del missing[key]
+        except (BrokenProcessPool, OSError, RuntimeError) as e:
+            LOG.warning(f"分词进程池不可用，回退到当前进程分词: {e}")
+            if _POOL is pool:
+                shutdown_tokenizer_pool()
+    for index, (key, text) in enumerate(missing.items(), 1):
+        tokens = tokenize(text, mode)
+        remember(key, tokens)
+        computed.append((key, tokens))
+        # 在当前进程中分词时,每批之间让出事件循环
+        if index % DEFAULT_BATCH_SIZE == 0:
+            await asyncio.sleep(0)
+
+    if store is not None and computed:
+        try:
+            await asyncio.to_thread(store.put_many, computed)
+        except Exception as e:
+            LOG.warning(f"写入分词持久化缓存失败: {e}")
+
+
+def choose_tokenize_mode(features: Iterable[str], hmm: bool = True) -> Optional[str]:
+    """
+    根据分析器声明的特征选择开销最小的分词模式
+
+    :param features: 所有启用分析器需要的特征
+    :param hmm: 普通分词时是否启用 HMM 新词发现
+    :return: 分词模式,没有分析器需要分词时返回 None
+    """
+    features = set(features)
+    if FEATURE_POS in features:
+        return TOKENIZE_POS
+    if FEATURE_WORDS in features:
+        return TOKENIZE_WORDS if hmm else TOKENIZE_WORDS_NO_HMM
+    return None
@@ -0,0 +1,169 @@
+"""
+个人统计索引
+每日定时报告时按 (群, 用户, 日期) 保存每个成员当天的统计(发言、图片、表情包、活跃小时、常用词),
+查询个人统计只读取该成员自己的记录,开销与群的消息量无关
+"""
+import json
+import sqlite3
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+from ncatbot.core import GroupMessageEvent
+from ncatbot.utils import get_log
+
+from .features import MessageFeatures
+
+LOG = get_log("ChatAnalyzerUserIndex")
+
+# 每个成员每天保留的常用词数量
+USER_TOP_WORDS = 30
+
+
+@dataclass
+class UserStats:
+    """一个成员在一段时间内的统计"""
+    messages: int = 0
+    images: int = 0
+    emoticons: int = 0
+    hours: List[int] = field(default_factory=lambda: [0] * 24)
+    words: Counter = field(default_factory=Counter)
+    days: int = 0  # 有记录的天数
+
+    def merge(self, other: "UserStats"):
+        """累加另一段时间的统计"""
+        self.messages += other.messages
+        self.images += other.images
+        self.emoticons += other.emoticons
+        self.hours = [a + b for a, b in zip(self.hours, other.hours)]
+        self.words.update(other.words)
+        self.days += other.days
+
+    def to_dict(self) -> dict:
+        return {
+            "messages": self.messages,
+            "images": self.images,
+            "emoticons": self.emoticons,
+            "hours": self.hours,
+            "words": self.words.most_common(USER_TOP_WORDS)
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserStats":
+        return cls(
+            messages=data.get("messages", 0),
+            images=data.get("images", 0),
+            emoticons=data.get("emoticons", 0),
+            hours=list(data.get("hours", [0] * 24)),
+            words=Counter(dict(data.get("words", []))),
+            days=1
+        )
+
+    def top_hours(self, n: int = 3) -> List[int]:
+        """发言最多的 n 个小时(没有发言的小时不计入)"""
+        ranked = sorted(range(24), key=lambda hour: -self.hours[hour])
+        return [hour for hour in ranked[:n] if self.hours[hour] > 0]
+
+
+def collect_user_stats(events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]) -> Dict[str, UserStats]:
+    """
+    按成员汇总一批消息的统计
+
+    :param events: 事件列表
+    :param features: 与事件一一对应的特征(需要消息段统计与小时,有分词结果时统计常用词)
+    :return: {用户号: 统计}
+    """
+    stats: Dict[str, UserStats] = {}
+    for event, feature in zip(events, features):
+        user_id = str(event.user_id)
+        user = stats.get(user_id)
+        if user is None:
+            user = stats[user_id] = UserStats(days=1)
+        user.messages += 1
+        user.images += feature.segments.images
+        user.emoticons += feature.segments.animated_images
+        if feature.hour >= 0:
+            user.hours[feature.hour] += 1
+        if feature.tokens:
+            user.words.update(word for word, _ in feature.tokens)
+    return stats
+
+
+class UserIndex:
+    """
+    SQLite 个人统计索引,线程安全
+
+    主键为 (群号, 用户号, 日期),查询一个成员的统计只扫描该成员的记录
+    """
+
+    def __init__(self, path: Path, keep_days: int = 90):
+        """
+        :param path: 数据库文件路径
+        :param keep_days: 保留天数,保存时清理更早的记录
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._keep_days = keep_days
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_days ("
+                "group_id TEXT NOT NULL, "
+                "user_id TEXT NOT NULL, "
+                "day TEXT NOT NULL, "
+                "stats TEXT NOT NULL, "
+                "PRIMARY KEY (group_id, user_id, day)"
+                ") WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS user_days_day ON user_days (day)")
+
+    def save_day(self, group_id: str, day: date, stats: Dict[str, UserStats]):
+        """
+        保存一个群一天的个人统计(同一天已有的记录会被替换),并清理过期记录
+
+        :param group_id: 群号
+        :param day: 日期
+        :param stats: {用户号: 统计}
+        """
+        rows = [
+            (str(group_id), user_id, day.isoformat(), json.dumps(user.to_dict(), ensure_ascii=False))
+            for user_id, user in stats.items()
+        ]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM user_days WHERE group_id = ? AND day = ?", (str(group_id), day.isoformat()))
+            self._conn.executemany("INSERT INTO user_days (group_id, user_id, day, stats) VALUES (?, ?, ?, ?)", rows)
+            if self._keep_days > 0:
+                self._conn.execute(
+                    "DELETE FROM user_days WHERE day < ?",
+                    ((day - timedelta(days=self._keep_days)).isoformat(),)
+                )
+
+    def load(self, group_id: str, user_id: str, start: date, end: date) -> UserStats:
+        """
+        合并一个成员在 [start, end] 日期范围内的统计
+
+        :param group_id: 群号
+        :param user_id: 用户号
+        :param start: 开始日期
+        :param end: 结束日期
+        :return: 合并后的统计,没有记录时 days 为 0
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stats FROM user_days WHERE group_id = ? AND user_id = ? AND day BETWEEN ? AND ?",
+                (str(group_id), str(user_id), start.isoformat(), end.isoformat())
+            ).fetchall()
+        total = UserStats()
+        for (data,) in rows:
+            total.merge(UserStats.from_dict(json.loads(data)))
+        return total
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
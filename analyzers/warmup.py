@@ -0,0 +1,91 @@
+"""
+插件加载时的后台预热
+提前加载 jieba 词典、词云依赖、字体与渲染样式,避免第一份报告承担这些开销
+"""
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from ncatbot.utils import get_log
+
+LOG = get_log("ChatAnalyzerWarmup")
+
+
+def warm_up(
+    resources_path: Path,
+    render_backend: str = "pillowmd",
+    enabled_analyzers: Optional[Iterable[str]] = None,
+    tokenizer_hmm: bool = True,
+    max_tier: str = "full"
+) -> float:
+    """
+    同步执行预热(应在后台线程中调用),单个步骤失败只记录日志
+
+    只导入被启用的分析器模块;没有分析器需要分词时不加载 jieba,未启用词云时不加载词云依赖
+
+    :param resources_path: 资源文件夹路径
+    :param render_backend: 渲染后端,决定预加载哪种样式
+    :param enabled_analyzers: 启用的分析器名称,None 表示全部启用
+    :param tokenizer_hmm: 普通分词是否启用 HMM,决定预加载哪种分词模式
+    :param max_tier: 任一群允许的最高开销等级,超出的分析器不会被预热
+    :return: 预热耗时(秒)
+    """
+    from .base_analyzer import get_all_analyzers
+    from .features import union_features
+    from .tokenizer import choose_tokenize_mode
+
+    start = time.perf_counter()
+    analyzer_classes = []
+
+    def step(description: str, func):
+        step_start = time.perf_counter()
+        try:
+            func()
+            LOG.debug(f"预热 {description} 完成，用时 {time.perf_counter() - step_start:.2f}s")
+        except Exception as e:
+            LOG.warning(f"预热 {description} 失败: {e}")
+
+    def load_jieba():
+        import jieba
+        jieba.initialize()
+        # 按实际使用的分词模式触发模型加载(词性标注需要额外的 HMM 模型)
+        from .tokenizer import tokenize
+        tokenize("今天的群聊很热闹", tokenize_mode)
+
+    def load_wordcloud():
+        from .word import get_wordcloud
+        get_wordcloud()
+
+    def load_ranking_assets():
+        from .render.rankings import load_ranking_frames, load_ranking_fonts, NICKNAME_FONT_SIZE, COUNT_FONT_SIZE
+        load_ranking_fonts(NICKNAME_FONT_SIZE, COUNT_FONT_SIZE)
+        if (resources_path / "1st.png").exists():
+            load_ranking_frames(str(resources_path))
+
+    def load_style():
+        style_path = str(resources_path / "mdstyle")
+        if render_backend == "native":
+            from .render.compositor import load_style_assets
+            load_style_assets(style_path)
+        else:
+            from .render.main_render import load_markdown_style
+            load_markdown_style(style_path)
+
+    def load_analyzers():
+        analyzer_classes.extend(get_all_analyzers(enabled_analyzers, max_tier))
+
+    step("分析器", load_analyzers)
+    class_names = {cls.__name__ for cls in analyzer_classes}
+    tokenize_mode = choose_tokenize_mode(
+        union_features(cls._features for cls in analyzer_classes), tokenizer_hmm
+    )
+    if tokenize_mode is not None:
+        step("jieba 词典", load_jieba)
+    if "WordCloudAnalyzer" in class_names:
+        step("词云", load_wordcloud)
+    step("排行榜资源", load_ranking_assets)
+    step("渲染样式", load_style)
+
+    elapsed = time.perf_counter() - start
+    LOG.info(f"预热完成，用时 {elapsed:.2f}s")
+    return elapsed
@@ -1,53 +1,72 @@
 from ncatbot.core import GroupMessageEvent
-from typing import Tuple
+from typing import Optional, Sequence
 from pathlib import Path
-import re
-import jieba.posseg as pseg
 import uuid
+import threading
 from functools import lru_cache
 from wordcloud import WordCloud
 from PIL import Image, ImageDraw, ImageFont
 from .base_analyzer import BaseAnalyzer, register_analyzer
 from .crayon_utils import draw_crayon_rectangle
+from .features import FEATURE_POS, FEATURE_WORDS, MessageFeatures
 
 
-# 停用词列表（两个分析器共享）
-STOP_WORDS = {
-    '一个', '什么', '怎么', '这个', '那个', '这样', '那样'
-}
+# 词云配置:输出尺寸、最多绘制的词数,以及布局缩放倍数
+# 布局在 (宽/缩放, 高/缩放) 的画布上计算,绘制时再放大到输出尺寸
+WORDCLOUD_WIDTH = 800
+WORDCLOUD_HEIGHT = 600
+WORDCLOUD_MAX_WORDS = 100
+WORDCLOUD_LAYOUT_SCALE = 2
 
+# 词云字体候选
+WORDCLOUD_FONT_PATHS = [
+    "C:/Windows/Fonts/simkai.ttf",    # 楷体
+    "C:/Windows/Fonts/msyh.ttc",      # 微软雅黑 - 备用
+]
 
-@lru_cache(maxsize=None)
-def extract_words_with_pos(text: str) -> Tuple[Tuple[str, str], ...]:
+# WordCloud 实例在多次生成之间复用,布局状态保存在实例上,需要加锁
+_WORDCLOUD_LOCK = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def find_wordcloud_font() -> Optional[str]:
     """
-    使用 jieba 从文本中提取词汇和词性（两个分析器共享）
-    使用 LRU 缓存避免重复计算相同文本
-    maxsize=None 表示无限缓存，因为在单次分析会话中，每条消息只会被处理一次
+    查找可用的词云中文字体(结果缓存)
     
-    :param text: 原始文本
-    :return: ((词汇, 词性), ...) 元组（用于缓存）
+    :return: 字体路径,找不到时返回 None(使用 WordCloud 自带字体)
     """
-    # 移除特殊字符,保留中文、英文、数字和空格
-    text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9\s]+', '', text)
-    
-    if not text.strip():
-        return ()
-    
-    # 使用 jieba 进行词性标注（一次调用，返回词和词性）
-    words_with_pos = pseg.cut(text)
+    for path in WORDCLOUD_FONT_PATHS:
+        if Path(path).exists():
+            return path
+    return None
+
+
+@lru_cache(maxsize=None)
+def get_wordcloud(scale: int = WORDCLOUD_LAYOUT_SCALE) -> WordCloud:
+    """
+    获取按指定缩放倍数配置好的 WordCloud 实例(每种配置只创建一次)
     
-    # 过滤停用词和短词
-    filtered_results = tuple(
-        (word.strip(), flag) for word, flag in words_with_pos
-        if len(word.strip()) >= 2 and word.lower() not in STOP_WORDS
+    :param scale: 布局缩放倍数,布局在 1/scale 大小的画布上进行
+    :return: WordCloud 实例
+    """
+    return WordCloud(
+        font_path=find_wordcloud_font(),
+        width=WORDCLOUD_WIDTH // scale,
+        height=WORDCLOUD_HEIGHT // scale,
+        scale=scale,
+        max_words=WORDCLOUD_MAX_WORDS,
+        min_font_size=max(1, 10 // scale),
+        colormap='viridis',
+        mode="RGBA",
+        background_color=None
     )
-    
-    return filtered_results
 
 
 @register_analyzer
 class PartOfSpeechAnalyzer(BaseAnalyzer):
     """词性分析器 - 统计不同词性的使用频率"""
+
+    _features = frozenset({FEATURE_POS})
     
     # 词性中文映射
     POS_NAMES = {
@@ -75,26 +94,23 @@ class PartOfSpeechAnalyzer(BaseAnalyzer):
         self._unit = "次"
         self._custom_image_getter = self._generate_pos_chart
     
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """处理单个消息事件，提取并统计词性"""
-        if not event.raw_message:
-            return
-        
-        texts = event.message.filter_text()
-        all_text = ""
-        for plain_text in texts:
-            if plain_text.text.startswith('/'):
-                continue  # 忽略命令消息
-            all_text += plain_text.text + " "
-        
-        # 使用共享的文本处理函数（只调用一次jieba）
-        words_with_pos = extract_words_with_pos(all_text)
-        
-        for _, flag in words_with_pos:  # 只使用词性，忽略词
+        # 引擎统一分词（只调用一次jieba）
+        for _, flag in features.tokens:  # 只使用词性，忽略词
             # 提取词性的首字母（jieba的词性标注可能有子类）
             pos = flag[0] if flag else 'x'
             pos_name = self.POS_NAMES.get(pos, '其他')
             self._counter[pos_name] += 1
+
+    def process_batch(self, events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]):
+        """批量统计词性"""
+        pos_names = self.POS_NAMES
+        self._counter.update(
+            pos_names.get(flag[0] if flag else 'x', '其他')
+            for feature in features
+            for _, flag in feature.tokens
+        )
     
     
     def _generate_pos_chart(self, resources_path: Path) -> Path:
@@ -227,34 +243,32 @@ class PartOfSpeechAnalyzer(BaseAnalyzer):
 @register_analyzer
 class WordCloudAnalyzer(BaseAnalyzer):
     """词云分析器 - 统计高频词汇并生成词云图片"""
+
+    # 只需要词,词性分析器未启用时可以使用更快的普通分词
+    _features = frozenset({FEATURE_WORDS})
+    # 只绘制前 WORDCLOUD_MAX_WORDS 个词,大群可以使用近似统计
+    _top_k = WORDCLOUD_MAX_WORDS
     
     def __init__(self, group_id: str):
         super().__init__(group_id)
         self._name = "高频词云"
         self._custom_image_getter = self.generate_wordcloud_image
     
-    def process_event(self, event: GroupMessageEvent):
+    def process_event(self, event: GroupMessageEvent, features: MessageFeatures):
         """处理单个消息事件,提取并统计词汇"""
-        if not event.raw_message:
-            return
-        texts = event.message.filter_text()
-        all_text = ""
-        for plain_text in texts:
-            if plain_text.text.startswith('/'):
-                continue  # 忽略命令消息
-            all_text += plain_text.text + " "
-        
-        words_with_pos = extract_words_with_pos(all_text)
-        for word, _ in words_with_pos:  # 只使用词，忽略词性
-            self._counter[word] += 1
+        self._counter.update(word for word, _ in features.tokens)  # 只使用词，忽略词性
+
+    def process_batch(self, events: Sequence[GroupMessageEvent], features: Sequence[MessageFeatures]):
+        """批量统计词汇"""
+        self._counter.update(word for feature in features for word, _ in feature.tokens)
     
     def get_result(self):
         """
-        获取高频词汇(返回前100个)
+        获取高频词汇(返回前 WORDCLOUD_MAX_WORDS 个)
         
         :return: [(词汇, 出现次数), ...]
         """
-        return self._counter.most_common(100)
+        return self._counter.most_common(WORDCLOUD_MAX_WORDS)
     
     def generate_wordcloud_image(self, resources_path: Path) -> Path:
         """
@@ -262,52 +276,23 @@ class WordCloudAnalyzer(BaseAnalyzer):
         
         :return: 图片保存路径
         """
-        
-        # 尝试加载中文字体
-        font_paths = [
-        "C:/Windows/Fonts/simkai.ttf",    # 楷体
-        "C:/Windows/Fonts/msyh.ttc",      # 微软雅黑 - 备用
-        ]
-        
-        font_path = None
-        for path in font_paths:
-            if Path(path).exists():
-                font_path = path
-                break
-        
-        # 创建词云
-        wc = WordCloud(
-            font_path=font_path,
-            width=800,
-            height=600,
-            max_words=100,
-            min_font_size=10,
-            colormap='viridis'
-        )
-        
-        # 从词频字典生成词云
-        word_freq = dict(self._counter.most_common())
-        wc.generate_from_frequencies(word_freq)
-        # 转换为 PIL Image
-        wordcloud_image = wc.to_image()
-        # 转换为 RGBA 模式
-        wordcloud_image = wordcloud_image.convert("RGBA")
-        bg_rgb = (0, 0, 0)
-        # 使用 numpy 数组处理
-        import numpy as np
-        data = np.array(wordcloud_image)
-        # 创建 alpha 通道
-        # 找出接近背景色的像素
-        r, g, b, _ = data[:, :, 0], data[:, :, 1], data[:, :, 2], data[:, :, 3]
-        mask = (np.abs(r - bg_rgb[0]) < 12) & \
-                (np.abs(g - bg_rgb[1]) < 12) & \
-                (np.abs(b - bg_rgb[2]) < 12)
-        # 将背景色的 alpha 设为 0 (透明)
-        data[mask, 3] = 0
-        wordcloud_image = Image.fromarray(data, 'RGBA')
+        # 只把会被绘制的前 K 个词交给布局引擎
+        word_freq = dict(self._counter.most_common(WORDCLOUD_MAX_WORDS))
+        wc = get_wordcloud()
+        with _WORDCLOUD_LOCK:
+            if word_freq:
+                wc.generate_from_frequencies(word_freq)
+                # RGBA 模式 + 无背景色,直接输出透明背景
+                wordcloud_image = wc.to_image()
+            else:
+                wordcloud_image = Image.new(
+                    "RGBA",
+                    (WORDCLOUD_WIDTH, WORDCLOUD_HEIGHT),
+                    (0, 0, 0, 0)
+                )
 
-        output_path = resources_path.parent / "temp" / f"wordcloud_{uuid.uuid4().hex}.png"        
+        temp_dir = resources_path.parent / "temp"
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        output_path = temp_dir / f"wordcloud_{uuid.uuid4().hex}.png"
         wordcloud_image.save(str(output_path), "PNG")
         return output_path
-
-
@@ -0,0 +1,297 @@
+"""
+分析流水线基准测试
+
+使用合成的 GroupMessageEvent 流测量各阶段耗时与峰值内存,
+ncatbot 的 status.global_api 与头像获取函数会被替换为本地桩实现,不访问网络。
+
+用法:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 1000 10000 --users 200 --mix 0.7 0.2 0.1
+    python benchmarks/bench_pipeline.py --resources data/ChatAnalyzer/resources --json bench.json
+"""
+import argparse
+import asyncio
+import base64
+import importlib
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, replace
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Iterator, List, Optional
+
+from PIL import Image, ImageDraw
+
+from synthetic import MessageMix, generate_events
+
+# 插件根目录本身就是一个包,将其父目录加入路径后按目录名导入
+PLUGIN_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PLUGIN_ROOT.parent))
+plugin = importlib.import_module(PLUGIN_ROOT.name)
+analyzers = importlib.import_module(f"{PLUGIN_ROOT.name}.analyzers")
+rankings = importlib.import_module(f"{PLUGIN_ROOT.name}.analyzers.render.rankings")
+tokenizer = importlib.import_module(f"{PLUGIN_ROOT.name}.analyzers.tokenizer")
+crayon_utils = importlib.import_module(f"{PLUGIN_ROOT.name}.analyzers.crayon_utils")
+sampling = importlib.import_module(f"{PLUGIN_ROOT.name}.analyzers.sampling")
+render_queue = importlib.import_module(f"{PLUGIN_ROOT.name}.analyzers.render_queue")
+
+from ncatbot.utils import status
+
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+# 近似统计的候选项数量,以及每日汇总合并的天数
+SKETCH_CAPACITY = 256
+ROLLUP_DAYS = 7
+
+
+@dataclass
+class StageRecord:
+    """单个阶段的测量结果"""
+    size: int
+    stage: str
+    seconds: float
+    peak_bytes: Optional[int]
+
+
+# ======== 桩实现 ========
+class StubApi:
+    """替代 status.global_api,按用户号返回固定的群成员信息"""
+
+    async def get_group_member_info(self, group_id, user_id):
+        return SimpleNamespace(card="", nickname=f"用户{user_id}", role="member")
+
+    async def get_group_info(self, group_id):
+        return SimpleNamespace(group_name="基准测试群", member_count=500)
+
+
+def _stub_avatar_base64() -> str:
+    """生成一张固定的 100x100 头像"""
+    image = Image.new("RGBA", (100, 100), (120, 170, 230, 255))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def install_stubs():
+    """替换网络相关的依赖"""
+    avatar = _stub_avatar_base64()
+
+    async def fake_get_qq_avatar_async(user_id: str, max_retries: int = 3) -> str:
+        return avatar
+
+    status.global_api = StubApi()
+    rankings.get_qq_avatar_async = fake_get_qq_avatar_async
+
+
+# ======== 测量工具 ========
+class Recorder:
+    """记录各阶段的耗时与峰值内存"""
+
+    def __init__(self, trace_memory: bool):
+        self.trace_memory = trace_memory
+        self.records: List[StageRecord] = []
+
+    @contextmanager
+    def stage(self, size: int, name: str) -> Iterator[None]:
+        if self.trace_memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = None
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.records.append(StageRecord(size, name, elapsed, peak))
+            print(f"  {name:<28} {elapsed * 1000:>10.1f} ms  {_format_bytes(peak):>10}", flush=True)
+
+
+def _format_bytes(value: Optional[int]) -> str:
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.1f} {unit}"
+        value /= 1024  # type: ignore
+    return f"{value:.1f} TiB"
+
+
+def _clear_token_cache():
+    """清空分词缓存,保证每个规模都从冷缓存开始"""
+    tokenizer.clear_token_cache()
+
+
+# ======== 基准测试 ========
+async def bench_size(
+    recorder: Recorder,
+    size: int,
+    users: int,
+    mix: MessageMix,
+    resources_path: Path
+):
+    """对单个规模运行所有阶段"""
+    print(f"\n[{size} 条消息, {users} 个用户]")
+    with recorder.stage(size, "generate_events"):
+        events = generate_events(size, user_count=users, mix=mix)
+
+    texts = [tokenizer.message_text(event) for event in events]
+    _clear_token_cache()
+    with recorder.stage(size, "extract_words_with_pos"):
+        for text in texts:
+            tokenizer.extract_words_with_pos(text)
+
+    with recorder.stage(size, "draw_crayon_rectangle"):
+        canvas = Image.new("RGBA", (960, 240), (255, 255, 255, 0))
+        draw = ImageDraw.Draw(canvas)
+        for i in range(24):
+            crayon_utils.draw_crayon_rectangle(draw, 80 + i * 33, 30, 33, 48, (50, 110, 230), "vertical")
+        for i in range(3):
+            crayon_utils.draw_crayon_rectangle(draw, 100, 40 + i * 60, 600, 45, (255, 138, 128), "horizontal")
+
+    render_info = analyzers.RenderInfo(
+        current_time=datetime.now(),
+        analysis_duration=24 * 60,
+        group_name_and_id="基准测试群(123456789)",
+        plugin_version=plugin.ChatAnalyzer.version
+    )
+    engine = analyzers.ChatAnalysisEngine(resources_path, "123456789", render_info)
+    _clear_token_cache()
+    with recorder.stage(size, "engine.aggregate"):
+        results = await engine.aggregate(events)
+
+    # 抽样模式:抽样后的聚合必须完成,并在报告头部写入抽样说明
+    sample_size = max(1, size // 10)
+    for method in sampling.SAMPLE_METHODS:
+        sampled = analyzers.ChatAnalysisEngine(
+            resources_path, "123456789", render_info,
+            sample_size=sample_size, sample_method=method
+        )
+        _clear_token_cache()
+        with recorder.stage(size, f"engine.aggregate (sample {method})"):
+            await sampled.aggregate(events)
+        if size > sample_size and not any("抽样" in note for note in sampled.notes):
+            raise AssertionError(f"抽样方式 {method} 没有写入抽样说明")
+
+    # 近似统计:只有声明了 _top_k 的分析器(词云)改用固定内存的 Space-Saving 计数器,发言、图片、表情等排行榜仍为精确统计
+    sketched = analyzers.ChatAnalysisEngine(
+        resources_path, "123456789", render_info, sketch_capacity=SKETCH_CAPACITY
+    )
+    _clear_token_cache()
+    with recorder.stage(size, "engine.aggregate (sketch)"):
+        await sketched.aggregate(events)
+
+    # 每日汇总:保存 ROLLUP_DAYS 份首尾相接的汇总,读取窗口后直接合并
+    end = int(time.time())
+    daily = engine.export_daily_rollup("123456789", 0, 0, size)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = analyzers.RollupStore(Path(temp_dir))
+        day_seconds = 24 * 3600
+        start = end - ROLLUP_DAYS * day_seconds
+        for day in range(ROLLUP_DAYS):
+            store.save(replace(
+                daily,
+                start=start + day * day_seconds,
+                end=start + (day + 1) * day_seconds
+            ))
+        merged = analyzers.ChatAnalysisEngine(resources_path, "123456789", render_info)
+        with recorder.stage(size, f"engine.aggregate_rollups ({ROLLUP_DAYS}d)"):
+            rollups = store.load_window("123456789", start, end)
+            if rollups is None:
+                raise AssertionError("每日汇总没有覆盖完整的时间段")
+            await merged.aggregate_rollups(rollups)
+
+    if not (resources_path / "1st.png").exists():
+        print(f"  未找到资源文件夹 {resources_path},跳过渲染相关阶段")
+        return
+
+    ranking = next(iter(results.values()))[:3]
+    while len(ranking) < 3:
+        ranking.append(rankings.RenderUserInfo.create_placeholder(len(ranking) + 1))
+    champions = (ranking[0], ranking[1], ranking[2])
+    with recorder.stage(size, "create_ranking_with_avatars"):
+        rankings.create_ranking_with_avatars(champions, resources_path)
+
+    # 排行榜图片缓存:第二次输入相同,应直接写出缓存的图片
+    rankings.configure_ranking_memo(32 * 1024 * 1024)
+    outputs = []
+    try:
+        with recorder.stage(size, "save_ranking (memo miss)"):
+            outputs.append(rankings.save_ranking_with_avatars(champions, resources_path))
+        with recorder.stage(size, "save_ranking (memo hit)"):
+            outputs.append(rankings.save_ranking_with_avatars(champions, resources_path))
+        if rankings.ranking_memo_stats().hits < 1:
+            raise AssertionError("相同输入的排行榜图片没有命中缓存")
+    finally:
+        for output in outputs:
+            output.unlink(True)
+        rankings.configure_ranking_memo(0)
+
+    try:
+        with recorder.stage(size, "engine.build_sections"):
+            await engine.build_sections()
+        with recorder.stage(size, "render_analysis_result"):
+            await engine.render()
+    finally:
+        engine.clear_sections()
+
+    # 渲染队列:任务经 SQLite 队列认领后在当前进程中按工作进程的方式生成(不启动子进程)
+    payload = {**engine.export_render_job(), "group_id": "123456789", "enabled": None, "tier": "full"}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        queue = render_queue.JobQueue(Path(temp_dir) / "render_queue.sqlite3")
+        try:
+            with recorder.stage(size, "render_queue job (in-process)"):
+                queue.put("123456789", payload)
+                job_id, claimed = queue.claim("bench")
+                result = await render_queue.render_job(analyzers.EnginePool(resources_path), claimed)
+                queue.complete(job_id, "bench", result)
+            if queue.get(job_id).status != render_queue.JOB_DONE:  # type: ignore
+                raise AssertionError("渲染任务没有完成")
+        finally:
+            queue.close()
+
+    _clear_token_cache()
+    with recorder.stage(size, "engine.analyze (total)"):
+        await engine.analyze(events)
+
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="ChatAnalyzer 分析流水线基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="消息数量列表")
+    parser.add_argument("--users", type=int, default=50, help="用户数量")
+    parser.add_argument(
+        "--mix", type=float, nargs=3, default=[0.8, 0.1, 0.1],
+        metavar=("TEXT", "IMAGE", "EMOTICON"), help="文本 / 图片 / 动画表情的比例"
+    )
+    parser.add_argument(
+        "--resources", type=Path, default=Path("data/ChatAnalyzer/resources"),
+        help="资源文件夹路径(包含头像框与 mdstyle),缺失时跳过渲染阶段"
+    )
+    parser.add_argument("--no-memory", action="store_true", help="不使用 tracemalloc 统计峰值内存(耗时更准确)")
+    parser.add_argument("--json", type=Path, default=None, help="将结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+
+    install_stubs()
+    recorder = Recorder(trace_memory=not args.no_memory)
+    mix = MessageMix(*args.mix)
+    for size in args.sizes:
+        await bench_size(recorder, size, args.users, mix, args.resources)
+
+    if args.json:
+        args.json.write_text(
+            json.dumps([asdict(record) for record in recorder.records], ensure_ascii=False, indent=2),
+            encoding="utf-8"
+        )
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
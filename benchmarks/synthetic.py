@@ -0,0 +1,134 @@
+"""
+合成聊天数据生成器
+按指定的消息数、用户数和消息类型比例生成 GroupMessageEvent 流,用于基准测试
+"""
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from ncatbot.core import GroupMessageEvent
+
+
+# 常见群聊用语,用于拼接出接近真实分布的中文文本
+CHAT_PHRASES = [
+    "今天", "晚上", "吃什么", "有没有人", "一起", "打游戏", "上班", "好累", "下班了", "周末",
+    "出去玩", "这个", "真的", "太好笑了", "哈哈哈", "笑死", "确实", "不会吧", "老板", "开会",
+    "项目", "代码", "又出", "问题了", "修好了", "服务器", "挂了", "重启", "一下", "看看",
+    "电影", "好看", "推荐", "新番", "更新了", "抽卡", "歪了", "欧皇", "非酋", "天气",
+    "下雨", "好热", "空调", "奶茶", "外卖", "到了", "快递", "双十一", "买了", "便宜",
+    "考试", "复习", "论文", "导师", "毕业", "实习", "面试", "offer", "加油", "冲冲冲",
+    "晚安", "早上好", "摸鱼", "划水", "群主", "管理员", "红包", "谢谢老板", "牛逼", "厉害",
+]
+
+PUNCTUATIONS = ["", "", "", "！", "？", "。", "~", "……", "，"]
+
+
+@dataclass
+class MessageMix:
+    """消息类型比例(会被归一化)"""
+    text: float = 0.8
+    image: float = 0.1
+    emoticon: float = 0.1
+
+
+def _random_text(rng: random.Random) -> str:
+    """生成一条随机的中文聊天文本"""
+    length = rng.choice([1, 2, 2, 3, 3, 4, 5, 8, 12])
+    parts = [rng.choice(CHAT_PHRASES) + rng.choice(PUNCTUATIONS) for _ in range(length)]
+    return "".join(parts)
+
+
+def make_event(data: dict) -> GroupMessageEvent:
+    """
+    根据 OneBot11 群消息字典构造事件对象
+
+    :param data: OneBot11 群消息数据
+    :return: GroupMessageEvent 实例
+    """
+    return GroupMessageEvent(data)
+
+
+def generate_events(
+    message_count: int,
+    user_count: int = 50,
+    mix: Optional[MessageMix] = None,
+    group_id: str = "123456789",
+    end_time: Optional[int] = None,
+    duration: int = 24 * 60,
+    seed: int = 0
+) -> List[GroupMessageEvent]:
+    """
+    生成按时间升序排列的合成群消息事件
+
+    用户发言量服从近似齐夫分布,少数活跃用户贡献大部分消息
+
+    :param message_count: 消息数量
+    :param user_count: 用户数量
+    :param mix: 文本 / 图片 / 动画表情的比例
+    :param group_id: 群号
+    :param end_time: 时间窗口结束时间戳,默认当前时间
+    :param duration: 时间窗口长度(分钟)
+    :param seed: 随机种子
+    :return: 事件列表
+    """
+    rng = random.Random(seed)
+    mix = mix or MessageMix()
+    end_time = end_time or int(time.time())
+    start_time = end_time - duration * 60
+
+    user_ids = [str(10000 + i) for i in range(user_count)]
+    user_weights = [1 / (i + 1) for i in range(user_count)]
+    timestamps = sorted(rng.randint(start_time, end_time) for _ in range(message_count))
+    kinds = rng.choices(
+        ["text", "image", "emoticon"],
+        weights=[mix.text, mix.image, mix.emoticon],
+        k=message_count
+    )
+
+    events: List[GroupMessageEvent] = []
+    for index, (timestamp, kind) in enumerate(zip(timestamps, kinds)):
+        user_id = rng.choices(user_ids, weights=user_weights)[0]
+        if kind == "text":
+            text = _random_text(rng)
+            message = [{"type": "text", "data": {"text": text}}]
+            raw_message = text
+        else:
+            sub_type = 1 if kind == "emoticon" else 0
+            file_name = f"{rng.getrandbits(64):016x}.jpg"
+            message = [{
+                "type": "image",
+                "data": {
+                    "file": file_name,
+                    "url": f"https://example.invalid/{file_name}",
+                    "summary": "[动画表情]" if sub_type else "",
+                    "sub_type": sub_type,
+                }
+            }]
+            raw_message = f"[CQ:image,file={file_name},sub_type={sub_type}]"
+            # 部分图片消息附带文字
+            if rng.random() < 0.3:
+                text = _random_text(rng)
+                message.append({"type": "text", "data": {"text": text}})
+                raw_message += text
+        events.append(make_event({
+            "time": timestamp,
+            "self_id": 1,
+            "post_type": "message",
+            "message_type": "group",
+            "sub_type": "normal",
+            "message_id": index + 1,
+            "group_id": int(group_id),
+            "user_id": int(user_id),
+            "message": message,
+            "raw_message": raw_message,
+            "font": 0,
+            "message_format": "array",
+            "sender": {
+                "user_id": int(user_id),
+                "nickname": f"用户{user_id}",
+                "card": "",
+                "role": "member",
+            },
+        }))
+    return events
@@ -4,11 +4,45 @@ from ncatbot.core import GroupMessageEvent
 from ncatbot.plugin_system.builtin_plugin.unified_registry.command_system.registry.help_system import HelpGenerator
 
 from .utils import require_subscription
-from .analyzers import ChatAnalysisEngine, RenderInfo
+from .analyzers import (
+    COST_TIERS,
+    EnginePool,
+    RenderInfo,
+    configure_ranking_memo,
+    ranking_memo_stats,
+    METRICS,
+    LoopLagMonitor,
+    format_summary,
+    profile_run,
+    profiling_active,
+    ProfileBusyError,
+    configure_tokenizer_pool,
+    shutdown_tokenizer_pool,
+    configure_token_cache,
+    token_cache_stats,
+    configure_token_store,
+    close_token_store,
+    warm_up,
+    RollupStore,
+    ReportScheduler,
+    RenderWorkers,
+    JOB_POSTED,
+    UserIndex,
+    API,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    api_priority,
+    parse_limits
+)
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 import asyncio
+from time import monotonic
+
+# 一天的分钟数，每日汇总只在时长为一天的定时报告后保存
+DAY_MINUTES = 24 * 60
 
 class ChatAnalyzer(NcatBotPlugin):
     name = "ChatAnalyzer"
@@ -37,6 +71,150 @@ class ChatAnalyzer(NcatBotPlugin):
             "分析要求的最小消息数",
             int
         )
+        self.register_config(
+            "render_backend",
+            "pillowmd",
+            "报告渲染方式（pillowmd / native）",
+            str
+        )
+        self.register_config(
+            "tokenizer_workers",
+            0,
+            "分词工作进程数（0 表示在主进程中分词）",
+            int
+        )
+        self.register_config(
+            "tokenizer_hmm",
+            True,
+            "只需要词（不需要词性）时，分词是否启用 HMM 新词发现",
+            bool
+        )
+        self.register_config(
+            "sketch_capacity",
+            0,
+            "词频近似统计的候选词数量（0 表示精确统计）",
+            int
+        )
+        self.register_config(
+            "rollup_keep_days",
+            45,
+            "每日汇总保留天数（0 表示不保存每日汇总）",
+            int
+        )
+        self.register_config(
+            "report_deadline",
+            180,
+            "单份报告从获取聊天记录到生成完各节的总时限（秒，0 表示不限制）",
+            int
+        )
+        self.register_config(
+            "analyzer_budget",
+            60,
+            "单个分析器的时间预算（秒，0 表示不限制）",
+            int
+        )
+        self.register_config(
+            "analysis_batch_size",
+            512,
+            "每批处理的消息数，每批之间让出事件循环",
+            int
+        )
+        self.register_config(
+            "token_cache_max_entries",
+            50000,
+            "分词缓存最大条目数（0 表示不限制）",
+            int
+        )
+        self.register_config(
+            "token_cache_max_mb",
+            64,
+            "分词缓存最大内存（MB，0 表示不限制）",
+            int
+        )
+        self.register_config(
+            "token_cache_ttl",
+            1440,
+            "分词缓存条目存活时间（分钟，0 表示永不过期）",
+            int
+        )
+        self.register_config(
+            "token_store_days",
+            30,
+            "分词持久化缓存保留天数（-1 表示关闭持久化缓存，0 表示永久保留）",
+            int
+        )
+        self.register_config(
+            "enabled_analyzers",
+            [],
+            "启用的分析器列表（为空表示全部启用）",
+            list
+        )
+        self.register_config(
+            "group_analyzers",
+            {},
+            "按群覆盖启用的分析器列表（群号 -> 分析器列表）",
+            dict
+        )
+        self.register_config(
+            "analysis_tier",
+            "full",
+            "允许的最高分析开销等级（basic / standard / full）",
+            str
+        )
+        self.register_config(
+            "group_tiers",
+            {},
+            "按群覆盖分析开销等级（群号 -> 等级）",
+            dict
+        )
+        self.register_config(
+            "sample_size",
+            0,
+            "消息数超过该值时，词云与词性统计只处理该数量的抽样消息，0 表示不抽样",
+            int
+        )
+        self.register_config(
+            "sample_method",
+            "hour",
+            "抽样方式：hour（按小时分层）或 reservoir（蓄水池抽样）",
+            str
+        )
+        self.register_config(
+            "render_workers",
+            0,
+            "渲染报告图片的工作进程数，0 表示在机器人进程中渲染",
+            int
+        )
+        self.register_config(
+            "ranking_memo_mb",
+            16,
+            "排行榜图片缓存的内存上限（MB），0 表示不缓存",
+            int
+        )
+        self.register_config(
+            "user_index_days",
+            90,
+            "个人统计（/ca me）保留的天数，0 表示不记录",
+            int
+        )
+        self.register_config(
+            "report_workers",
+            2,
+            "定时报告同时生成的群数量",
+            int
+        )
+        self.register_config(
+            "report_spread",
+            0,
+            "定时报告在多少秒内错开各群的开始时间，0 表示不错开",
+            int
+        )
+        self.register_config(
+            "api_rate_limits",
+            {},
+            "按接口覆盖 API 限速（接口名 -> {rate, burst, concurrency, retries}）",
+            dict
+        )
         self.register_config(
             "subscribed_groups",
             ["123456789"],  # 示例群号
@@ -58,7 +236,81 @@ class ChatAnalyzer(NcatBotPlugin):
     # ======== 初始化插件 ========
     async def on_load(self):
         self.init_config()
+        # 先校验配置，无效时不注册定时任务等任何副作用
+        try:
+            limits = parse_limits(self.config["api_rate_limits"])
+        except ValueError as e:
+            self.log.error(f"API 限速配置无效，插件未加载: {e}")
+            raise
         self.init_scheduler()
+        API.configure(limits)
+        configure_tokenizer_pool(self.config["tokenizer_workers"])
+        configure_token_cache(
+            max_entries=self.config["token_cache_max_entries"],
+            max_bytes=self.config["token_cache_max_mb"] * 1024 * 1024,
+            ttl=self.config["token_cache_ttl"] * 60
+        )
+        configure_ranking_memo(self.config["ranking_memo_mb"] * 1024 * 1024)
+        if self.config["token_store_days"] >= 0:
+            configure_token_store(self.workspace / "token_cache.sqlite3", self.config["token_store_days"])
+        engine_options = dict(
+            render_backend=self.config["render_backend"],
+            tokenizer_hmm=self.config["tokenizer_hmm"],
+            sketch_capacity=self.config["sketch_capacity"],
+            deadline=self.config["report_deadline"],
+            analyzer_budget=self.config["analyzer_budget"],
+            batch_size=self.config["analysis_batch_size"],
+            sample_size=self.config["sample_size"],
+            sample_method=self.config["sample_method"]
+        )
+        # 每个群复用一个配置好的分析引擎
+        self._engines = EnginePool(self.workspace / "resources", **engine_options)
+        # 个人统计：定时日报保存每个成员当天的统计，/ca me 只读取自己的记录
+        self._user_index: Optional[UserIndex] = None
+        if self.config["user_index_days"] > 0:
+            self._user_index = UserIndex(self.workspace / "user_index.sqlite3", self.config["user_index_days"])
+        # 渲染工作进程：聚合在机器人进程中完成，图片在工作进程中生成
+        self._render_workers: Optional[RenderWorkers] = None
+        # 上次未发送的报告:{(群号, 统计窗口): 状态},与本次运行中同一窗口的定时报告去重
+        self._resumed_reports: Dict[Tuple[str, str], str] = {}
+        if self.config["render_workers"] > 0:
+            self._render_workers = RenderWorkers(
+                self.workspace / "render_queue.sqlite3",
+                self.workspace / "resources",
+                self.config["render_workers"],
+                engine_options
+            )
+            self._render_workers.start()
+            self._resume_task = asyncio.create_task(self._resume_render_jobs())
+        # 定时报告排队生成，同时进行的报告数有上限
+        deadline = self.config["report_deadline"]
+        self._scheduler = ReportScheduler(
+            workers=self.config["report_workers"],
+            spread=self.config["report_spread"],
+            deadline=self.config["report_spread"] + deadline if deadline > 0 else 0
+        )
+        # 记录事件循环延迟，确认分析期间机器人仍能及时响应
+        self._loop_monitor = LoopLagMonitor()
+        self._loop_monitor.start()
+        # 同一时间只有一次统计导出写文件（各次导出写同一个临时文件）
+        self._metrics_lock = asyncio.Lock()
+        # 每日汇总：定时报告保存当天的统计结果，长时段报告直接合并
+        self._rollups: Optional[RollupStore] = None
+        if self.config["rollup_keep_days"] > 0:
+            self._rollups = RollupStore(self.workspace / "rollups", self.config["rollup_keep_days"])
+        # 在后台线程中预热，报告生成前会等待预热完成
+        self._ready = asyncio.Event()
+        self._warmup_task = asyncio.create_task(self._warm_up())
+
+    async def on_close(self):
+        self._loop_monitor.stop()
+        self._scheduler.stop()
+        if self._render_workers is not None:
+            self._render_workers.shutdown()
+        if self._user_index is not None:
+            self._user_index.close()
+        shutdown_tokenizer_pool()
+        close_token_store()
 
     # ======== 注册指令 ========
     ca_group = command_registry.group("ca", description="聊天分析指令")
@@ -80,7 +332,9 @@ class ChatAnalyzer(NcatBotPlugin):
             return
         try:
             await event.reply("开始分析群聊数据喵~请稍等...")
-            await self._post_analyze_img(event.group_id, time, duration)
+            # 手动指令的 API 调用优先于定时任务
+            with api_priority(PRIORITY_HIGH):
+                await self._post_analyze_img(event.group_id, time, duration)
         except Exception as e:
             self.log.error(f"分析失败: {e}", exc_info=True)
             await event.reply(f"分析失败喵~错误信息: {str(e)}")
@@ -95,29 +349,345 @@ class ChatAnalyzer(NcatBotPlugin):
         if earliest_chat:
             await self.api.post_group_msg(event.group_id, f"获取到了{len(chat_histories)}条聊天记录喵~最早一条聊天记录是: {earliest_chat.raw_message}，时间是{datetime.fromtimestamp(earliest_chat.time).strftime('%Y-%m-%d %H:%M:%S')}")
 
+    @root_filter
+    @ca_group.command("profile", description="在性能剖析下分析群聊数据")
+    @param("time", default="", help="分析时间点(格式: HH:MM)", required=False)
+    @param("duration", default=1440, help="分析时长(分钟)", required=False)
+    @require_subscription
+    async def cmd_profile(self, event: GroupMessageEvent, time: str="", duration: int=1440):
+        """与 analyze 相同，但在 cProfile 和 tracemalloc 下运行并保存剖析报告，仅root用户可用"""
+        if not time:
+            time = datetime.now().strftime("%H:%M")
+        try:
+            datetime.strptime(time, "%H:%M")
+        except ValueError:
+            await event.reply("时间格式错误喵~请使用 HH:MM 格式")
+            return
+        if profiling_active():
+            await event.reply("已经有一次剖析在进行了喵~请等它结束后再试")
+            return
+        group_id = str(event.group_id)
+        await event.reply("开始剖析分析过程喵~请稍等...")
+        try:
+            with api_priority(PRIORITY_HIGH):
+                report = await profile_run(
+                    group_id,
+                    lambda: self._post_analyze_img(group_id, time, duration),
+                    self.workspace / "profiles"
+                )
+        except ProfileBusyError:
+            await event.reply("已经有一次剖析在进行了喵~请等它结束后再试")
+            return
+        if report.error is not None:
+            self.log.error(f"剖析过程中分析失败: {report.error}", exc_info=report.error)
+        await event.reply(report.summary())
+
+    @root_filter
+    @ca_group.command("stats", description="查看各阶段耗时统计")
+    @param("group", default="", help="只查看指定群号的统计", required=False)
+    async def cmd_stats(self, event: GroupMessageEvent, group: str = ""):
+        """查看分析流水线各阶段的 p50/p95 耗时，仅root用户可用"""
+        summaries = METRICS.summarize(group_id=group or None)
+        if not summaries:
+            await event.reply("还没有统计数据喵~")
+            return
+        await self._export_metrics()
+        scope = f"群 {group}" if group else "所有群"
+        cache = token_cache_stats()
+        memo = ranking_memo_stats()
+        last_run = f"最近一次{self._scheduler.last_run.summary()}\n" if self._scheduler.last_run else ""
+        await event.reply(
+            f"{scope}的各阶段耗时统计喵~\n"
+            f"{format_summary(summaries)}\n"
+            f"分词缓存: {cache.entries} 条 / {cache.bytes / 1024 / 1024:.1f} MB，命中率 {cache.hit_rate:.1%}\n"
+            f"排行榜图片缓存: {memo.entries} 张 / {memo.bytes / 1024 / 1024:.1f} MB，命中率 {memo.hit_rate:.1%}\n"
+            f"{last_run}"
+            f"完整数据已导出到 {self._metrics_path}"
+        )
+
+    @ca_group.command("me", description="查看自己的聊天统计")
+    @param("days", default=7, help="统计最近多少天", required=False)
+    @require_subscription
+    async def cmd_me(self, event: GroupMessageEvent, days: int = 7):
+        """查看自己最近几天的发言、图片、表情包数量，以及活跃时段与常用词"""
+        if self._user_index is None:
+            await event.reply("个人统计功能没有开启喵~")
+            return
+        try:
+            days = max(1, min(int(days), self.config["user_index_days"]))
+        except ValueError:
+            await event.reply("天数格式错误喵~请输入整数")
+            return
+        end = datetime.now().date()
+        start = end - timedelta(days=days - 1)
+        stats = await asyncio.to_thread(self._user_index.load, str(event.group_id), str(event.user_id), start, end)
+        if stats.days == 0:
+            await event.reply("还没有你的统计数据喵~每天的定时报告之后才会记录哦")
+            return
+        lines = [
+            f"你最近 {days} 天（有记录的 {stats.days} 天）的聊天统计喵~",
+            f"发言 {stats.messages} 条，图片 {stats.images} 张，表情包 {stats.emoticons} 张",
+        ]
+        top_hours = stats.top_hours()
+        if top_hours:
+            lines.append("最活跃的时段: " + "、".join(f"{hour:02d}:00~{(hour + 1) % 24:02d}:00" for hour in top_hours))
+        top_words = [word for word, _ in stats.words.most_common(10)]
+        if top_words:
+            # 常用词来自报告中参与分词的消息，消息很多时只有抽样的部分会被分词
+            lines.append("常用词: " + "、".join(top_words))
+            lines.append("（常用词来自定时报告中参与分词的消息，消息很多时只统计抽样的部分）")
+        else:
+            lines.append("（没有常用词记录：本群的报告没有启用需要分词的分析器）")
+        await event.reply("\n".join(lines))
+
     # ======== 私有方法 ========
-    async def _post_analyze_img(self, group_id: str, time: str, duration:int):
-        # 获取聊天记录
-        chat_histories = await self._get_chat_history(group_id, time, duration)
-        if not chat_histories:
-            raise ValueError("未能获取到聊天记录喵~")
-        if len(chat_histories) < self.config["minimum_message_count"]:
+    async def _warm_up(self):
+        """后台预热 jieba、词云、字体与渲染样式，完成(或失败)后标记为就绪"""
+        try:
+            with METRICS.span("warm_up"):
+                await asyncio.to_thread(
+                    warm_up,
+                    self.workspace / "resources",
+                    self.config["render_backend"],
+                    self._all_enabled_analyzers(),
+                    self.config["tokenizer_hmm"],
+                    self._max_tier()
+                )
+        except Exception as e:
+            self.log.warning(f"预热失败，将在首次分析时加载: {e}")
+        finally:
+            self._ready.set()
+
+    def _enabled_analyzers(self, group_id: str) -> Optional[List[str]]:
+        """获取指定群启用的分析器，None 表示全部启用"""
+        group_analyzers = self.config["group_analyzers"] or {}
+        enabled = group_analyzers.get(str(group_id)) or self.config["enabled_analyzers"]
+        return list(enabled) if enabled else None
+
+    def _group_tier(self, group_id: str) -> str:
+        """获取指定群允许的最高分析开销等级"""
+        group_tiers = self.config["group_tiers"] or {}
+        tier = group_tiers.get(str(group_id)) or self.config["analysis_tier"]
+        if tier not in COST_TIERS:
+            self.log.warning(f"群 {group_id} 的分析开销等级 {tier} 无效，使用 full")
+            return "full"
+        return tier
+
+    def _max_tier(self) -> str:
+        """获取任一群可能用到的最高开销等级(用于预热)"""
+        tiers = [self.config["analysis_tier"], *(self.config["group_tiers"] or {}).values()]
+        ranks = [COST_TIERS.index(tier) for tier in tiers if tier in COST_TIERS]
+        return COST_TIERS[max(ranks)] if ranks else "full"
+
+    def _all_enabled_analyzers(self) -> Optional[List[str]]:
+        """获取任一群可能用到的分析器(用于预热)，None 表示全部"""
+        if not self.config["enabled_analyzers"]:
+            return None
+        enabled = set(self.config["enabled_analyzers"])
+        for analyzers in (self.config["group_analyzers"] or {}).values():
+            enabled.update(analyzers)
+        return sorted(enabled)
+
+    async def _wait_until_ready(self):
+        """等待后台预热完成"""
+        ready = getattr(self, "_ready", None)
+        if ready is not None and not ready.is_set():
+            self.log.info("等待预热完成后再生成报告...")
+            await ready.wait()
+
+    @property
+    def _metrics_path(self):
+        """Prometheus 文本格式的统计导出路径"""
+        return self.workspace / "metrics.prom"
+
+    async def _export_metrics(self):
+        """导出统计数据，失败时只记录日志；文件在线程中写出，多次导出依次进行"""
+        cache = token_cache_stats()
+        METRICS.set_gauge("token_cache_entries", cache.entries)
+        METRICS.set_gauge("token_cache_bytes", cache.bytes)
+        METRICS.set_gauge("token_cache_hits", cache.hits)
+        METRICS.set_gauge("token_cache_misses", cache.misses)
+        METRICS.set_gauge("token_cache_evictions", cache.evictions + cache.expirations)
+        METRICS.set_gauge("token_cache_hit_rate", cache.hit_rate)
+        memo = ranking_memo_stats()
+        METRICS.set_gauge("ranking_memo_entries", memo.entries)
+        METRICS.set_gauge("ranking_memo_bytes", memo.bytes)
+        METRICS.set_gauge("ranking_memo_hit_rate", memo.hit_rate)
+        try:
+            async with self._metrics_lock:
+                await asyncio.to_thread(METRICS.write_prometheus, self._metrics_path)
+        except Exception as e:
+            self.log.warning(f"导出统计数据失败: {e}")
+
+    async def _post_analyze_img(self, group_id: str, time: str, duration:int, save_rollup: bool = False):
+        group_id = str(group_id)
+        try:
+            with METRICS.span("report", group_id):
+                await self._generate_and_post(group_id, time, duration, save_rollup)
+        finally:
+            await self._export_metrics()
+
+    @staticmethod
+    def _time_window(time: str, duration: int) -> Tuple[int, int]:
+        """
+        计算分析的时间范围
+
+        :param time: 目标时间点(格式: "HH:MM")，当天该时间点为结束时间
+        :param duration: 分析时长(分钟)
+        :return: (开始时间戳, 结束时间戳)
+        """
+        hour, minute = map(int, time.split(':'))
+        today = datetime.now().date()
+        target_time = datetime.combine(today, datetime.min.time().replace(hour=hour, minute=minute))
+        target_timestamp = int(target_time.timestamp())
+        return target_timestamp - duration * 60, target_timestamp
+
+    async def _generate_and_post(self, group_id: str, time: str, duration: int, save_rollup: bool = False):
+        """
+        生成并发送报告
+
+        超过一天的报告优先合并每日汇总，汇总不完整时才获取原始聊天记录；
+        save_rollup 为 True 且时长为一天时，保存本次统计结果作为当天的汇总
+        """
+        with METRICS.span("wait_ready", group_id):
+            await self._wait_until_ready()
+        # 报告总时限从这里开始计算，获取聊天记录与群信息也计入
+        report_started = monotonic()
+        start_timestamp, end_timestamp = self._time_window(time, duration)
+        rollups = None
+        if self._rollups is not None and duration > DAY_MINUTES:
+            rollups = await asyncio.to_thread(self._rollups.load_window, group_id, start_timestamp, end_timestamp)
+        if rollups is not None:
+            chat_histories = []
+            message_count = sum(rollup.message_count for rollup in rollups)
+            self.log.info(f"使用群 {group_id} 的 {len(rollups)} 份每日汇总生成报告，共 {message_count} 条聊天记录")
+        else:
+            # 获取聊天记录
+            with METRICS.span("fetch_history", group_id):
+                chat_histories = await self._get_chat_history(group_id, time, duration)
+            if not chat_histories:
+                raise ValueError("未能获取到聊天记录喵~")
+            message_count = len(chat_histories)
+            self.log.info(f"从群 {group_id} 获取到 {message_count} 条聊天记录")
+            self._scheduler.record_size(group_id, message_count)
+        if message_count < self.config["minimum_message_count"]:
             raise ValueError("聊天记录数量不足，无法进行分析喵~")
-        
-        self.log.info(f"从群 {group_id} 获取到 {len(chat_histories)} 条聊天记录")
-        group_info = await self.api.get_group_info(group_id)
+
+        with METRICS.span("get_group_info", group_id):
+            group_info = await API.get_group_info(group_id)
         # 使用分析引擎进行分析
-        render_info = RenderInfo(
-            current_time=datetime.now(),
-            analysis_duration=duration,
-            group_name_and_id=f"{group_info.group_name}({group_id})",
-            plugin_version=self.version
-        )
-        engine = ChatAnalysisEngine(self.workspace / "resources", group_id, render_info)
-        img_b64 = await engine.analyze(chat_histories)
+        if rollups is not None:
+            # 每日汇总只覆盖到最近一次定时报告，头部显示汇总实际覆盖的时间段
+            covered_start, covered_end = rollups[0].start, rollups[-1].end
+            render_info = RenderInfo(
+                current_time=datetime.now(),
+                analysis_duration=(covered_end - covered_start) // 60,
+                group_name_and_id=f"{group_info.group_name}({group_id})",
+                plugin_version=self.version,
+                _start_time=datetime.fromtimestamp(covered_start),
+                _end_time=datetime.fromtimestamp(covered_end)
+            )
+        else:
+            render_info = RenderInfo(
+                current_time=datetime.now(),
+                analysis_duration=duration,
+                group_name_and_id=f"{group_info.group_name}({group_id})",
+                plugin_version=self.version
+            )
+        enabled = self._enabled_analyzers(group_id)
+        tier = self._group_tier(group_id)
+        render_job = None
+        # 定时日报同时保存每日汇总与个人统计
+        save_daily = save_rollup and rollups is None and duration == DAY_MINUTES
+        collect_users = save_daily and self._user_index is not None
+        async with self._engines.acquire(group_id, render_info, enabled, tier) as engine:
+            engine.start_clock(report_started)
+            with METRICS.span("analyze", group_id, items=message_count):
+                if self._render_workers is not None:
+                    # 只在机器人进程中聚合(包括获取昵称与头像)，图片交给渲染工作进程生成
+                    if rollups is not None:
+                        await engine.aggregate_rollups(rollups)
+                    else:
+                        await engine.aggregate(chat_histories, collect_users)
+                    render_job = {**engine.export_render_job(), "enabled": enabled, "tier": tier}
+                elif rollups is not None:
+                    img_b64 = await engine.analyze_rollups(rollups)
+                else:
+                    img_b64 = await engine.analyze(chat_histories, collect_users=collect_users)
+            if collect_users:
+                try:
+                    # 按窗口中点所在的日期保存：00:00 的日报记到前一天，22:00 的日报记到当天
+                    day = datetime.fromtimestamp((start_timestamp + end_timestamp) // 2).date()
+                    await asyncio.to_thread(self._user_index.save_day, group_id, day, engine.export_user_stats())
+                except Exception as e:
+                    self.log.warning(f"保存群 {group_id} 的个人统计失败: {e}")
+            if save_daily and self._rollups is not None:
+                try:
+                    rollup = engine.export_daily_rollup(group_id, start_timestamp, end_timestamp, message_count)
+                    await asyncio.to_thread(self._rollups.save, rollup)
+                except Exception as e:
+                    self.log.warning(f"保存群 {group_id} 的每日汇总失败: {e}")
+        window = f"{start_timestamp}-{end_timestamp}"
+        if render_job is not None:
+            img_b64 = await self._render_workers.render(group_id, render_job, window)
+        if save_rollup and not self._claim_scheduled_post(group_id, window):
+            self.log.info(f"群 {group_id} 的这份定时报告已由上次未完成的任务发送，跳过")
+            return
         # 发送图片
-        await self.api.post_group_msg(group_id, "大人们，这是你们今天的聊天分析报告，请注意查收喵~")
-        await self.api.post_group_msg(group_id, image=f"base64://{img_b64}")
+        with METRICS.span("post_group_msg", group_id):
+            await API.post_group_msg(group_id, "大人们，这是你们今天的聊天分析报告，请注意查收喵~")
+            await API.post_group_msg(group_id, image=f"base64://{img_b64}")
+
+    def _claim_scheduled_post(self, group_id: str, window: str) -> bool:
+        """
+        定时报告发送前检查:上次未完成的同一份报告已经发送时不再发送,
+        尚未发送时由本次报告代替
+
+        :return: 是否应发送
+        """
+        resumed = self._resumed_reports
+        key = (str(group_id), window)
+        if key not in resumed:
+            return True
+        if resumed[key] == "posted":
+            del resumed[key]
+            return False
+        resumed[key] = "superseded"
+        return True
+
+    async def _resume_render_jobs(self):
+        """发送上次运行时已提交、但结果尚未发送的渲染任务,同一群同一窗口只发送最新的一份"""
+        jobs = await asyncio.to_thread(self._render_workers.unfinished)
+        latest: Dict[Tuple[str, str], int] = {}
+        for job in jobs:
+            if job.status != JOB_POSTED:
+                latest[(job.group_id, job.window or str(job.id))] = job.id
+        for key in latest:
+            self._resumed_reports.setdefault(key, "pending")
+        for job in jobs:
+            key = (job.group_id, job.window or str(job.id))
+            try:
+                if job.status == JOB_POSTED:
+                    # 上次已经开始发送，可能已经送达，不再重发
+                    continue
+                if latest.get(key) != job.id:
+                    self.log.info(f"群 {job.group_id} 有更新的同一份报告任务，丢弃任务 {job.id}")
+                    continue
+                img_b64 = await self._render_workers.wait(job.id)
+                if self._resumed_reports.get(key) == "superseded":
+                    self.log.info(f"群 {job.group_id} 的这份报告已由本次运行重新生成并发送，丢弃任务 {job.id}")
+                    del self._resumed_reports[key]
+                    continue
+                self._resumed_reports[key] = "posted"
+                await asyncio.to_thread(self._render_workers.mark_posted, job.id)
+                self.log.info(f"继续发送群 {job.group_id} 上次未发送的聊天分析报告")
+                with api_priority(PRIORITY_LOW):
+                    await API.post_group_msg(job.group_id, "大人们，这是你们今天的聊天分析报告，请注意查收喵~")
+                    await API.post_group_msg(job.group_id, image=f"base64://{img_b64}")
+            except Exception as e:
+                self.log.error(f"发送群 {job.group_id} 上次未完成的报告失败: {e}")
+            finally:
+                await asyncio.to_thread(self._render_workers.remove, job.id)
 
     async def _get_chat_history(self, group_id: str, time: str, duration:int, count: int = 101):
         """
@@ -137,19 +707,15 @@ class ChatAnalyzer(NcatBotPlugin):
             raise ValueError("时间格式错误")
         
         # 获取聊天记录
-        chat_histories = await self.api.get_group_msg_history(
+        chat_histories = await API.get_group_msg_history(
             group_id=group_id,
             count=count
         )
         # API返回的第一个元素是最早的聊天记录
         earliest_chat_history = chat_histories[0]
         # 将时间字符串(如"22:00")转换为当天该时间点的timestamp
-        hour, minute = map(int, time.split(':'))
-        today = datetime.now().date()
-        target_time = datetime.combine(today, datetime.min.time().replace(hour=hour, minute=minute))
-        target_timestamp = int(target_time.timestamp())
+        start_timestamp, target_timestamp = self._time_window(time, duration)
         earliest_timestamp = earliest_chat_history.time
-        start_timestamp = target_timestamp - duration * 60
         # 判断最早的记录是否在我们需要的时间范围之前(或等于)
         if earliest_timestamp <= start_timestamp:
             # 已经获取到足够早的记录,进行二分查找
@@ -195,16 +761,17 @@ class ChatAnalyzer(NcatBotPlugin):
         subscribed_groups = self.config["subscribed_groups"]
         self.log.info(f"触发时间点：{time}，即将向 {'、'.join(subscribed_groups)} 发送聊天分析报告")
         async def task(group_id: str):
-            try:
-                await self._post_analyze_img(group_id, time, self.config["analysis_duration"])
-                self.log.info(f"成功向 {group_id} 发送聊天分析报告")
-            except Exception as e:
-                self.log.error(f"向 {group_id} 发送聊天分析报告失败：{e}")
-                await self.api.post_group_msg(group_id, f"这个时间应该给你们总结近段时间的聊天记录的，结果因为 {e} 没能成功喵……")
-        tasks = []
-        for group_id in subscribed_groups:
-            tasks.append(asyncio.create_task(task(group_id)))
-        await asyncio.gather(*tasks)
+            # 定时任务的 API 调用排在手动指令之后
+            with api_priority(PRIORITY_LOW):
+                try:
+                    await self._post_analyze_img(group_id, time, self.config["analysis_duration"], save_rollup=True)
+                    self.log.info(f"成功向 {group_id} 发送聊天分析报告")
+                except Exception as e:
+                    self.log.error(f"向 {group_id} 发送聊天分析报告失败：{e}")
+                    await API.post_group_msg(group_id, f"这个时间应该给你们总结近段时间的聊天记录的，结果因为 {e} 没能成功喵……")
+                    raise
+        # 由调度器按群规模排队，同时进行的报告数不超过 report_workers
+        await self._scheduler.run(f"定时报告 {time}", subscribed_groups, task)
 
 
 
@@ -229,6 +796,7 @@ class ChatAnalyzer(NcatBotPlugin):
             await event.reply("本群组未订阅聊天分析功能喵~")
             return
         self.config["subscribed_groups"].remove(str(event.group_id))
+        self._engines.discard(str(event.group_id))
         await event.reply("取消订阅了聊天分析功能喵~")
 
     @admin_group_filter